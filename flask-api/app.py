@@ -10,20 +10,26 @@ import numpy as np
 from threading import Thread
 import time
 import traceback
+import multiprocessing
 
 # Import custom modules
 from keystroke import keystroke_collector
 from keystroke import freetext_keystroke_collector
 from keystroke import multi_binary_keystroke_collector
+from keystroke import keystroke_segment
 from keystroke.freetext_keystroke_collector import (
     start_free_text_collection,
     stop_free_text_collection,
     toggle_anomaly_detection,
     get_status,
-    set_keystroke_threshold
+    set_keystroke_threshold,
+    set_streaming_mode
 )
 from models import fixed_text_model, free_text_model, multi_binary_model
 from preprocessing import keystroke_processor
+from preprocessing import chunked_pipeline
+from preprocessing.keystroke_csv import read_keystroke_csv
+from preprocessing.training_set import build_training_set
 from utils import scheduler, data_handler
 
 # Set up logging
@@ -129,10 +135,12 @@ def _save_schedules():
     with open(SCHEDULES_FILE, 'w') as f:
         json.dump(schedules, f)
 
-# Start the scheduler
-scheduler_thread = Thread(target=scheduler.run_scheduler, args=(schedules, model_map))
-scheduler_thread.daemon = True
-scheduler_thread.start()
+# Start the scheduler, in the server process only: the parallel
+# preprocessing workers are spawned and import this module again
+if multiprocessing.current_process().name == 'MainProcess':
+    scheduler_thread = Thread(target=scheduler.run_scheduler, args=(schedules, model_map))
+    scheduler_thread.daemon = True
+    scheduler_thread.start()
 
 #------------ API ROUTES ------------#
 
@@ -242,6 +250,18 @@ def download_keystrokes():
         csv_file = os.path.join(keystroke_collector.key_log_dir, filename)
         
         if not os.path.exists(csv_file):
+            # Fall back to the binary segment, exported in CSV layout
+            segment_file = keystroke_segment.segment_path_for(csv_file)
+            if os.path.exists(segment_file):
+                import io
+                csv_text = keystroke_segment.export_csv(segment_file)
+                return send_file(
+                    io.BytesIO(csv_text.encode('utf-8')),
+                    mimetype='text/csv',
+                    as_attachment=True,
+                    download_name=filename
+                )
+            
             return jsonify({
                 "success": False,
                 "message": f"No keystroke data available for user {username} with model type {model_type} on {file_date}"
@@ -398,7 +418,7 @@ def upload_fixed_text_data(username):
             
             # Basic validation that the file has the expected format
             try:
-                df = pd.read_csv(filepath)
+                df = read_keystroke_csv(filepath)
                 required_columns = ['Timestamp_Press','Timestamp_Release','Key Stroke','Application','Hold Time']
                 
                 missing_columns = [col for col in required_columns if col not in df.columns]
@@ -408,14 +428,19 @@ def upload_fixed_text_data(username):
                         "error": f"CSV file is missing required columns: {', '.join(missing_columns)}"
                     }), 400
                 
-                preprocessedDatadf = keystroke_processor.preprocess_keystroke_data(df, username, additional_users={
+                training_set = build_training_set(df, username, additional_users={
                     "Aisha": "flask-api/storage/data/FixedText_Aisha.csv",
                     "Misbah": "flask-api/storage/data/FixedText_Misbah.csv"
                 })
                 
-                # Save preprocessed data to CSV
-                preprocessed_filepath = os.path.join('flask-api/storage/data', 'fixed_text_data_preprocessed.csv')
-                preprocessedDatadf.to_csv(preprocessed_filepath, index=False)
+                # Save the training set (CSV export on request)
+                preprocessed_filepath = os.path.join('flask-api/storage/data', 'fixed_text_data_preprocessed.npz')
+                export_csv = request.form.get('exportCsv', 'false').lower() == 'true'
+                if not training_set.save(preprocessed_filepath, export_csv=export_csv, label_column='User'):
+                    return jsonify({
+                        "success": False,
+                        "error": f"Error saving preprocessed data to {preprocessed_filepath}"
+                    }), 500
                 
                 return jsonify({
                     "success": True,
@@ -545,11 +570,10 @@ def train_model():
             if os.path.exists(keystroke_file):
                 file_exists = True
             else:
-                # Try to find any file for this user and model type
-                files = [f for f in os.listdir(keystroke_collector.key_log_dir) 
-                         if f.startswith(f'keystrokes_{username}_{model_type}_') and f.endswith('.csv')]
-                if files:
-                    keystroke_file = os.path.join(keystroke_collector.key_log_dir, files[0])
+                # Try to find the most recent file for this user and model type
+                latest_file = keystroke_collector.catalog.latest_file(username, model_type)
+                if latest_file:
+                    keystroke_file = latest_file
                     file_exists = True
             
             if not file_exists:
@@ -564,7 +588,7 @@ def train_model():
                 os.makedirs('storage/data', exist_ok=True)
                 
                 # Read the raw keystroke data
-                df = pd.read_csv(keystroke_file)
+                df = read_keystroke_csv(keystroke_file)
                 
                 # Basic validation that the file has the expected format
                 required_columns = ['Timestamp_Press','Timestamp_Release','Key Stroke','Application','Hold Time']
@@ -577,14 +601,18 @@ def train_model():
                     }), 400
                 
                 # Process the data
-                preprocessedDatadf = keystroke_processor.preprocess_keystroke_data(df, username, additional_users={
+                training_set = build_training_set(df, username, additional_users={
                     "Aisha": "flask-api/storage/data/FixedText_Aisha.csv",
                     "Misbah": "flask-api/storage/data/FixedText_Misbah.csv"
                 })
                 
-                # Save preprocessed data to CSV
-                preprocessed_filepath = os.path.join('flask-api/storage/data', 'fixed_text_data_preprocessed.csv')
-                preprocessedDatadf.to_csv(preprocessed_filepath, index=False)
+                # Save the training set (CSV export on request)
+                preprocessed_filepath = os.path.join('flask-api/storage/data', 'fixed_text_data_preprocessed.npz')
+                if not training_set.save(preprocessed_filepath, export_csv=bool(data.get('exportCsv', False)), label_column='User'):
+                    return jsonify({
+                        "success": False,
+                        "error": f"Error saving preprocessed data to {preprocessed_filepath}"
+                    }), 500
                 
                 logger.info(f"Preprocessed keystroke data for {username} saved to {preprocessed_filepath}")
                 
@@ -783,6 +811,111 @@ def set_free_text_threshold():
             "error": str(e)
         }), 500
 
+@app.route('/api/keystroke/free-text/streaming', methods=['POST'])
+def set_free_text_streaming():
+    """Enable or disable sliding-window streaming detection during free-text collection"""
+    try:
+        data = request.json
+        enabled = data.get('enabled', True)
+        stride = data.get('stride')
+        
+        if stride is not None and (not isinstance(stride, int) or stride < 5):
+            return jsonify({
+                "success": False,
+                "message": "Stride must be an integer >= 5"
+            }), 400
+        
+        success, message = set_streaming_mode(bool(enabled), stride)
+        
+        if success:
+            return jsonify({
+                "success": True,
+                "message": message,
+                "status": get_status()
+            })
+        else:
+            return jsonify({
+                "success": False,
+                "message": message,
+                "status": get_status()
+            }), 400
+    except Exception as e:
+        logger.error(f"Error setting streaming mode: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/api/preprocessing/workers', methods=['POST'])
+def set_preprocessing_workers():
+    """Set how many processes preprocess the users of a training set in parallel"""
+    try:
+        data = request.json
+        workers = data.get('workers', 0)
+        
+        if not isinstance(workers, int) or workers < 0:
+            return jsonify({
+                "success": False,
+                "message": "Workers must be a non-negative integer"
+            }), 400
+        
+        success, message = chunked_pipeline.set_preprocessing_workers(workers)
+        
+        return jsonify({
+            "success": success,
+            "message": message,
+            "workers": chunked_pipeline.preprocessing_workers
+        }), (200 if success else 400)
+    except Exception as e:
+        logger.error(f"Error setting preprocessing workers: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/api/multi-binary/prediction-workers', methods=['POST'])
+def set_multi_binary_prediction_workers():
+    """Set how many threads evaluate the user models of the multi-binary ensemble"""
+    try:
+        data = request.json
+        workers = data.get('workers', 0)
+        
+        if not isinstance(workers, int) or workers < 0:
+            return jsonify({
+                "success": False,
+                "message": "Workers must be a non-negative integer"
+            }), 400
+        
+        success, message = multi_binary_model.set_prediction_workers(workers)
+        
+        return jsonify({
+            "success": success,
+            "message": message,
+            "workers": multi_binary_model.prediction_workers
+        }), (200 if success else 400)
+    except Exception as e:
+        logger.error(f"Error setting multi-binary prediction workers: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/api/multi-binary/model-latency', methods=['GET'])
+def get_multi_binary_model_latency():
+    """Prediction latency of each user model in the multi-binary ensemble"""
+    try:
+        return jsonify({
+            "success": True,
+            "workers": multi_binary_model.prediction_workers,
+            "latency": multi_binary_model.get_model_latencies()
+        })
+    except Exception as e:
+        logger.error(f"Error getting multi-binary model latency: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
 @app.route('/api/keystroke/free-text/alerts', methods=['GET'])
 def get_free_text_alerts():
     """Get alerts from free-text keystroke collection"""
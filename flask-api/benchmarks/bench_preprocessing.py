@@ -0,0 +1,279 @@
+# benchmarks/bench_preprocessing.py
+"""
+Benchmarks of the keystroke preprocessing hot path on synthetic data.
+
+Run from flask-api/:
+
+    python -m benchmarks.bench_preprocessing --sizes 1k,10k,100k
+    python -m benchmarks.bench_preprocessing --sizes 1m --repeat 1
+
+For each size the stages below are timed on deterministic synthetic
+keystrokes (best of --repeat runs), and peak memory is measured in a
+separate run with tracemalloc. Labelled preprocessing is also run with the
+reference users as CSV files, with an empty (cold) and a filled (warm)
+feature cache in a temporary directory; its output must be the same as with
+the references passed as DataFrames. Stage outputs are checked against the golden
+digests in benchmarks/golden/, so a faster replacement can be validated;
+after an intended change in output, refresh them with --update-golden.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import hashlib
+import argparse
+import logging
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from benchmarks.keystroke_generator import generate_user_keystrokes, generate_dataset
+from preprocessing import keystroke_processor, chunked_pipeline
+from preprocessing.feature_cache import FeatureCache
+from utils.symbol_table import key_symbols, app_symbols
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "preprocessing.json")
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+# Decimals kept when hashing feature values, so the digest doesn't depend on
+# float rounding in the last bits
+DIGEST_DECIMALS = 6
+
+# Grouped columns holding symbol codes; they are hashed as labels since codes
+# depend on the order symbols were first seen
+SYMBOL_COLUMNS = {"Key Stroke": key_symbols, "Application": app_symbols}
+
+# Stages whose output must equal another stage's (same size)
+SAME_OUTPUT_AS = {
+    "preprocess_keystroke_data[files, cold cache]": "preprocess_keystroke_data[labelled]",
+    "preprocess_keystroke_data[files, warm cache]": "preprocess_keystroke_data[labelled]",
+}
+
+
+def _standardize_input(df):
+    """Input of standardize_windows_keystrokes: quotes stripped and aliases applied."""
+    df = df.copy()
+    df["Key Stroke"] = df["Key Stroke"].astype(str).str.strip("'")
+    return keystroke_processor.standardize_keystrokes(df)
+
+
+def _stages(n_rows, workdir):
+    """
+    (name, input rows, setup, run) of each benchmarked stage for `n_rows`
+    keystrokes; setup builds the input outside the timed part. Reference
+    files and the feature cache are kept in `workdir`.
+    """
+    user_df = generate_user_keystrokes(n_rows)
+    dataset = generate_dataset(n_rows)
+    main_user, main_df = next(iter(dataset.items()))
+    others = {name: df for name, df in dataset.items() if name != main_user}
+    grouped = keystroke_processor.process_keystroke_data(user_df.copy())
+
+    other_files = {}
+    for name, df in others.items():
+        other_files[name] = os.path.join(workdir, f"{name}.csv")
+        df.to_csv(other_files[name], index=False)
+    cache = chunked_pipeline.feature_cache
+
+    def cold_cache():
+        shutil.rmtree(cache.directory, ignore_errors=True)
+        return main_df.copy()
+
+    def warm_cache():
+        for path in other_files.values():
+            if cache.load(path) is None:
+                cache.store(path, chunked_pipeline._build_cached_features(path, None))
+        return main_df.copy()
+
+    return [
+        ("process_keystroke_data", n_rows,
+         lambda: user_df.copy(),
+         lambda df: keystroke_processor.process_keystroke_data(df)),
+        ("standardize_windows_keystrokes", n_rows,
+         lambda: _standardize_input(user_df),
+         lambda df: keystroke_processor.standardize_windows_keystrokes(df)),
+        ("expand_features", n_rows,
+         lambda: grouped,
+         lambda df: keystroke_processor.expand_features(df)),
+        ("preprocess_keystroke_data", n_rows,
+         lambda: user_df.copy(),
+         lambda df: keystroke_processor.preprocess_keystroke_data(df)),
+        ("preprocess_keystroke_data[labelled]", n_rows,
+         lambda: (main_df.copy(), {name: df.copy() for name, df in others.items()}),
+         lambda data: keystroke_processor.preprocess_keystroke_data(data[0], main_user, data[1])),
+        ("preprocess_keystroke_data[files, cold cache]", n_rows,
+         cold_cache,
+         lambda df: keystroke_processor.preprocess_keystroke_data(df, main_user, other_files)),
+        ("preprocess_keystroke_data[files, warm cache]", n_rows,
+         warm_cache,
+         lambda df: keystroke_processor.preprocess_keystroke_data(df, main_user, other_files)),
+    ]
+
+
+def output_digest(result):
+    """
+    Digest of a stage's output: shape, columns, and a SHA-256 over its
+    values (numbers rounded to DIGEST_DECIMALS) plus per-column sums for a
+    tolerant comparison.
+    """
+    digest = hashlib.sha256()
+    sums = {}
+    for column in result.columns:
+        values = result[column]
+        if pd.api.types.is_numeric_dtype(values):
+            numbers = np.round(values.to_numpy(dtype=float), DIGEST_DECIMALS)
+            digest.update(np.ascontiguousarray(numbers).tobytes())
+            sums[str(column)] = float(np.nansum(numbers))
+        else:
+            # Lists per group (grouped frames) or labels
+            table = SYMBOL_COLUMNS.get(column)
+            items = values.tolist()
+            if table is not None and items and isinstance(items[0], list):
+                items = [table.decode(codes).tolist() for codes in items]
+            digest.update("\x1f".join(map(str, items)).encode())
+    return {
+        "shape": list(result.shape),
+        "columns": [str(column) for column in result.columns],
+        "sha256": digest.hexdigest(),
+        "column_sums": sums
+    }
+
+
+def compare_digest(actual, expected, rtol=1e-6):
+    """'ok', 'close' (same shape and columns, sums within rtol) or 'MISMATCH'."""
+    if actual["sha256"] == expected["sha256"]:
+        return "ok"
+    if actual["shape"] != expected["shape"] or actual["columns"] != expected["columns"]:
+        return "MISMATCH"
+    for column, total in expected["column_sums"].items():
+        if not np.isclose(actual["column_sums"].get(column, np.nan), total, rtol=rtol, atol=1e-6):
+            return "MISMATCH"
+    return "close"
+
+
+def _time_stage(setup, run, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        data = setup()
+        start = time.perf_counter()
+        result = run(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _peak_memory(setup, run):
+    """Peak bytes allocated by one run of the stage (input excluded)."""
+    data = setup()
+    tracemalloc.start()
+    try:
+        run(data)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(sizes, repeat=3, measure_memory=True, golden=None):
+    """
+    Time every stage for every size.
+
+    Returns:
+        tuple: (results, digests); results is a list of dicts per stage and
+        size, digests {size: {stage: output digest}}
+    """
+    results = []
+    digests = {}
+    shared_cache = chunked_pipeline.feature_cache
+    for label in sizes:
+        n_rows = SIZES[label]
+        digests[label] = {}
+        with tempfile.TemporaryDirectory() as workdir:
+            # Keep the application's feature cache out of the measurements
+            chunked_pipeline.feature_cache = FeatureCache(os.path.join(workdir, "cache"))
+            try:
+                for name, rows, setup, run in _stages(n_rows, workdir):
+                    seconds, output = _time_stage(setup, run, repeat)
+                    digest = output_digest(output)
+                    digests[label][name] = digest
+
+                    expected = (golden or {}).get(label, {}).get(name)
+                    check = compare_digest(digest, expected) if expected else "no golden"
+                    same_as = digests[label].get(SAME_OUTPUT_AS.get(name))
+                    if same_as is not None and digest["sha256"] != same_as["sha256"]:
+                        check = "MISMATCH"
+                    results.append({
+                        "size": label,
+                        "stage": name,
+                        "rows": rows,
+                        "seconds": seconds,
+                        "rows_per_sec": rows / seconds if seconds else float("inf"),
+                        "peak_mb": _peak_memory(setup, run) / 2**20 if measure_memory else None,
+                        "check": check
+                    })
+                    _print_result(results[-1])
+            finally:
+                chunked_pipeline.feature_cache = shared_cache
+    return results, digests
+
+
+def _print_result(result):
+    peak = f"{result['peak_mb']:9.1f}" if result["peak_mb"] is not None else f"{'-':>9}"
+    print(f"{result['size']:>5}  {result['stage']:<45} {result['seconds']:9.4f} "
+          f"{result['rows_per_sec']:13,.0f} {peak}  {result['check']}", flush=True)
+
+
+def load_golden(path=GOLDEN_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_golden(digests, path=GOLDEN_PATH):
+    """Merge `digests` into the golden file (other sizes are kept)."""
+    golden = load_golden(path)
+    for label, stages in digests.items():
+        golden.setdefault(label, {}).update(stages)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(golden, f, indent=2, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark keystroke preprocessing on synthetic data")
+    parser.add_argument("--sizes", default="1k,10k,100k", help=f"Comma-separated sizes out of {', '.join(SIZES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage (the best is reported)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak memory run")
+    parser.add_argument("--update-golden", action="store_true", help="Store the outputs as the new golden digests")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    sizes = [size.strip().lower() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"Unknown sizes: {', '.join(unknown)}")
+
+    # Preprocessing logs at DEBUG to the console; keep the table readable
+    logging.disable(logging.WARNING)
+
+    print(f"{'size':>5}  {'stage':<45} {'seconds':>9} {'rows/sec':>13} {'peak MB':>9}  check")
+    golden = None if args.update_golden else load_golden()
+    results, digests = run_benchmarks(sizes, args.repeat, not args.no_memory, golden)
+
+    if args.update_golden:
+        save_golden(digests)
+        print(f"Golden digests updated in {GOLDEN_PATH}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    return 1 if any(result["check"] == "MISMATCH" for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
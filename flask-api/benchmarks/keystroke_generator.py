@@ -0,0 +1,154 @@
+# benchmarks/keystroke_generator.py
+
+import numpy as np
+import pandas as pd
+
+from preprocessing.keystroke_csv import KEYSTROKE_COLUMNS
+
+# Key labels as the collectors write them, weighted roughly as in the
+# collected free-text data
+KEY_WEIGHTS = {
+    "Key.space": 76, "Key.backspace": 64, "'a'": 64, "'e'": 61, "Key.tab": 45,
+    "'d'": 45, "Key.down": 41, "'t'": 41, "'s'": 39, "Key.up": 34,
+    "'i'": 34, "'n'": 32, "'o'": 31, "'r'": 30, "Key.alt_l": 29,
+    "Key.enter": 28, "Key.shift": 27, "Key.ctrl_l": 26, "'w'": 22, "'l'": 18,
+    "Key.left": 18, "'c'": 18, "'h'": 16, "'u'": 14, "'m'": 12,
+    "Key.right": 11, "'p'": 11, "'f'": 10, "'g'": 9, "Key.caps_lock": 9,
+    "'2'": 8, "'y'": 8, "'b'": 7, "'.'": 7, "'v'": 5,
+    "'1'": 5, "'k'": 5, "'0'": 4, "Key.delete": 4, "'D'": 4,
+    "Key.end": 4, "Key.shift_r": 3, "Key.esc": 3, "Key.cmd": 3, "'('": 3,
+    "'3'": 3, "'A'": 2, "'-'": 2, "'S'": 2, "')'": 2,
+    "':'": 2, "'='": 2, "'x'": 1, "'q'": 1, "'z'": 1,
+    "'j'": 1, "Key.home": 1, "Key.f4": 1, "Key.alt_gr": 1, "Key.media_volume_down": 1,
+}
+
+# Shortcuts as they show up in the logs: modifier rows followed by the key,
+# or control characters for Ctrl + letter
+SHORTCUT_SEQUENCES = [
+    ["Key.ctrl_l", "'\\x03'"],
+    ["Key.ctrl_l", "'\\x16'"],
+    ["Key.ctrl_l", "'\\x13'"],
+    ["Key.ctrl_l", "'\\x1a'"],
+    ["Key.alt_l", "Key.tab"],
+    ["Key.alt_l", "Key.f4"],
+    ["Key.ctrl_l", "Key.home"],
+    ["Key.shift", "Key.end"],
+    ["Key.cmd", "Key.tab"],
+    ["Key.ctrl_l", "Key.shift", "Key.esc"],
+]
+
+APPLICATIONS = ["Document1 - Word", "Inbox - Outlook", "GitHub - Google Chrome", "Untitled - Notepad", "Terminal"]
+
+# Per-user typing rhythm: median press-to-press gap and hold time (seconds)
+USER_PROFILES = [
+    {"gap": 0.16, "hold": 0.095},
+    {"gap": 0.21, "hold": 0.110},
+    {"gap": 0.13, "hold": 0.080},
+    {"gap": 0.27, "hold": 0.125},
+]
+
+SHORTCUT_RATE = 0.02
+
+
+def _key_sequence(rng, n_rows):
+    """`n_rows` key labels: weighted single keys with shortcut sequences mixed in."""
+    keys = np.array(list(KEY_WEIGHTS), dtype=object)
+    weights = np.array(list(KEY_WEIGHTS.values()), dtype=float)
+    labels = rng.choice(keys, size=n_rows, p=weights / weights.sum())
+
+    # Overwrite random stretches with shortcut sequences
+    starts = np.flatnonzero(rng.random(n_rows) < SHORTCUT_RATE)
+    for start, choice in zip(starts, rng.integers(len(SHORTCUT_SEQUENCES), size=len(starts))):
+        sequence = SHORTCUT_SEQUENCES[choice][:n_rows - start]
+        labels[start:start + len(sequence)] = sequence
+    return labels
+
+
+def _format_holds(hold_us):
+    """Hold times as str(timedelta) writes them ('0:00:00.123456')."""
+    seconds = pd.Series(hold_us // 1_000_000)
+    micros = pd.Series(hold_us % 1_000_000)
+    return ("0:00:" + seconds.astype(str).str.zfill(2) + "." + micros.astype(str).str.zfill(6)).to_numpy()
+
+
+def _format_timestamps(ns):
+    return np.char.replace(np.datetime_as_string(ns.astype("datetime64[us]"), unit="us"), "T", " ")
+
+
+def generate_user_keystrokes(n_rows, seed=0, profile=None, start="2025-03-01 23:58:00"):
+    """
+    Deterministic synthetic keystroke log of one user, in the raw CSV
+    layout (string columns, rows in release order as the collectors write
+    them).
+
+    Typing comes in bursts separated by pauses, in sessions that start at
+    the time of day of `start` (late evening by default) and so run past
+    midnight, with a keystroke pressed before and released after it. Hold
+    times are log-normal with rare long holds, so the outlier filter has
+    something to drop.
+
+    Args:
+        n_rows (int): Number of keystrokes
+        seed (int): Random seed; the same seed always gives the same rows
+        profile (dict, optional): Typing rhythm ({"gap", "hold"} medians in
+            seconds); defaults to the first of USER_PROFILES
+        start (str): Time of the first keystroke
+
+    Returns:
+        pd.DataFrame: Keystroke rows with KEYSTROKE_COLUMNS
+    """
+    rng = np.random.default_rng(seed)
+    profile = profile or USER_PROFILES[0]
+    base = np.datetime64(start.replace(" ", "T"), "ns")
+    start_of_day = (base - base.astype("datetime64[D]")) / np.timedelta64(1, "s")
+
+    # Press times in seconds after midnight of the first day: a pause every
+    # ~200 keystrokes, a new session at the same time of day every ~20000
+    gaps = rng.lognormal(np.log(profile["gap"]), 0.45, n_rows)
+    pauses = rng.random(n_rows) < 1 / 200
+    gaps[pauses] += rng.exponential(20, int(pauses.sum()))
+    gaps[0] = 0
+    press_s = start_of_day + np.cumsum(gaps)
+    for position in np.flatnonzero(rng.random(n_rows) < 1 / 20000):
+        next_session = (press_s[position] // 86400 + 1) * 86400 + start_of_day
+        press_s[position:] += next_session - press_s[position]
+
+    holds = rng.lognormal(np.log(profile["hold"]), 0.3, n_rows)
+    long_holds = rng.random(n_rows) < 0.005
+    holds[long_holds] = rng.uniform(0.8, 3.0, int(long_holds.sum()))
+
+    # The last keystroke before each midnight is held past it
+    days = press_s // 86400
+    for last in np.flatnonzero(days[1:] != days[:-1]):
+        holds[last] = max(holds[last], (days[last] + 1) * 86400 - press_s[last] + 0.05)
+
+    day_start = base.astype("datetime64[D]").astype("datetime64[ns]")
+    press_ns = day_start + np.round(press_s * 1e6).astype(np.int64).astype("timedelta64[us]")
+    hold_us = np.round(holds * 1e6).astype(np.int64)
+    release_ns = press_ns + hold_us.astype("timedelta64[us]")
+
+    df = pd.DataFrame({
+        "Timestamp_Press": _format_timestamps(press_ns),
+        "Timestamp_Release": _format_timestamps(release_ns),
+        "Key Stroke": _key_sequence(rng, n_rows),
+        "Application": rng.choice(np.array(APPLICATIONS, dtype=object), size=n_rows),
+        "Hold Time": _format_holds(hold_us),
+    }, columns=KEYSTROKE_COLUMNS)
+
+    # The collectors append rows as keys are released
+    order = np.argsort(release_ns, kind="stable")
+    return df.iloc[order].reset_index(drop=True)
+
+
+def generate_dataset(n_rows, seed=0, n_users=3):
+    """
+    Synthetic keystrokes of several users, `n_rows` in total.
+
+    Returns:
+        dict: {user name: keystroke DataFrame}, users in order
+    """
+    sizes = [n_rows // n_users + (1 if i < n_rows % n_users else 0) for i in range(n_users)]
+    return {
+        f"user_{i}": generate_user_keystrokes(size, seed * 1000 + i, USER_PROFILES[i % len(USER_PROFILES)])
+        for i, size in enumerate(sizes)
+    }
@@ -10,8 +10,14 @@ import pandas as pd
 import numpy as np
 import joblib
 from keystroke import keystroke_collector
+from keystroke import keystroke_events
+from keystroke.prediction_buffer import PredictionBuffer
+from keystroke.streaming_detector import StreamingDetector
 from models import fixed_text_model
 from preprocessing import keystroke_processor
+from preprocessing.training_set import build_training_set
+from preprocessing import feature_spec
+from preprocessing.hold_time_filter import get_hold_time_filter
 import pickle
 import glob
 from . import transition_integration
@@ -27,19 +33,26 @@ free_text_target = 10000  # Target for free-text model training
 monitor_thread = None
 last_prediction_time = None
 multi_binary_model = False
+streaming_mode = False  # Score overlapping windows every `stream_stride` keystrokes
+stream_stride = 5
+stream_detector = None
 
 # File paths based on the actual project structure
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 STORAGE_DIR = os.path.join(BASE_DIR, "storage")
 ALERTS_DIR = os.path.join(STORAGE_DIR, "alerts")
 COLLECTION_STATUS_PATH = os.path.join(STORAGE_DIR, "free_text_collection_status.json")
-PREDICTION_BUFFER_PATH = os.path.join(STORAGE_DIR, "prediction_buffer.csv")
+# Mirror of the in-memory prediction buffer, only read back after a crash
+PREDICTION_BUFFER_PATH = os.path.join(STORAGE_DIR, "prediction_buffer.kseg")
 FIXED_TEXT_MODEL_PATH = os.path.join(STORAGE_DIR, "models", "fixed-text_model.pkl")
 MODEL_INFO_PATH = os.path.join(STORAGE_DIR, "models", "fixed-text_info.json")
 
 # Ensure directories exist
 os.makedirs(ALERTS_DIR, exist_ok=True)
 
+# Pending keystrokes for the next prediction window
+prediction_buffer = PredictionBuffer(capacity=1024, mirror_path=PREDICTION_BUFFER_PATH)
+
 # Initialize fixed text model
 # Check if the model file exists
 if not os.path.exists(FIXED_TEXT_MODEL_PATH):
@@ -70,6 +83,9 @@ else:
         logger.error(f"Model info file not found at: {MODEL_INFO_PATH}")
         model_trained = False
 
+# Column layout the fixed-text model was trained on
+fixed_text_spec = feature_spec.load_spec(FIXED_TEXT_MODEL_PATH)
+
 # Function to check if the model is trained
 def is_model_trained():
     return fixed_text is not None and model_trained
@@ -102,6 +118,8 @@ def get_status():
         "keystroke_count": keystroke_count,
         "keystroke_threshold": keystroke_threshold,
         "prediction_buffer_size": _get_buffer_size(),
+        "streaming_mode": streaming_mode,
+        "stream_stride": stream_stride,
         "free_text_progress": {
             "collected": keystroke_count,
             "target": free_text_target,
@@ -135,23 +153,18 @@ def save_status():
 
 def _get_buffer_size():
     """Get the current size of the prediction buffer."""
-    if os.path.exists(PREDICTION_BUFFER_PATH):
-        try:
-            with open(PREDICTION_BUFFER_PATH, 'r') as f:
-                return sum(1 for _ in f) - 1  # Subtract 1 for header
-        except Exception as e:
-            logger.error(f"Error reading prediction buffer: {str(e)}")
-    return 0
+    return len(prediction_buffer)
+
+def _append_to_prediction_buffer(events):
+    """Append keystroke events to the prediction buffer."""
+    prediction_buffer.append(events)
+    # Each keystroke counts once towards the hold-time cutoff, however
+    # often its window is preprocessed
+    _hold_time_filter().update_events(events)
 
 def _reset_prediction_buffer():
-    """Reset the prediction buffer file."""
-    try:
-        # Create a new empty file with headers
-        with open(PREDICTION_BUFFER_PATH, 'w', newline='') as f:
-            writer = pd.DataFrame(columns=["Timestamp_Press", "Timestamp_Release", "Key Stroke", "Application", "Hold Time"])
-            writer.to_csv(f, index=False)
-    except Exception as e:
-        logger.error(f"Error resetting prediction buffer: {str(e)}")
+    """Reset the prediction buffer."""
+    prediction_buffer.clear()
 
 def start_free_text_collection(username, is_multi_binary=False,prediction_mode=False):
     """Start collecting keystrokes for free-text model with real-time anomaly detection."""
@@ -291,34 +304,91 @@ def set_keystroke_threshold(threshold):
         logger.error(error_msg)
         return False, error_msg
 
+def set_streaming_mode(enable, stride=None):
+    """Switch between tumbling windows and sliding-window streaming detection."""
+    global streaming_mode, stream_stride, stream_detector
+    
+    try:
+        if stride is not None:
+            stream_stride = max(5, min(100, stride))  # At least one 5-key group
+        streaming_mode = enable
+        # Start from an empty window; it is rebuilt with the current settings
+        stream_detector = None
+        
+        # Save status
+        save_status()
+        
+        status = f"enabled (stride {stream_stride})" if enable else "disabled"
+        logger.info(f"Streaming detection {status}")
+        return True, f"Streaming detection {status}"
+    except Exception as e:
+        error_msg = f"Error setting streaming mode: {str(e)}"
+        logger.error(error_msg)
+        return False, error_msg
+
+def _hold_time_filter():
+    """Hold-time outlier filter of the user being monitored."""
+    return get_hold_time_filter(keystroke_collector.get_collection_status().get("username", "unknown"))
+
+def _stream_for_anomaly_detection(events):
+    """Feed new keystrokes to the streaming detector and score the windows that are due."""
+    global stream_detector
+    
+    hold_filter = _hold_time_filter()
+    if stream_detector is None or stream_detector.extractor.hold_filter is not hold_filter:
+        stream_detector = StreamingDetector(window_size=keystroke_threshold, stride=stream_stride, hold_filter=hold_filter)
+    windows = stream_detector.feed(events)
+    for window in windows:
+        _evaluate_window(window.features, window.keystrokes)
+    if windows:
+        hold_filter.save()
+    
 def process_for_anomaly_detection():
     """Process the keystroke buffer for anomaly detection."""
     global last_prediction_time
     
     try:
-        # Check if prediction buffer exists
-        if not os.path.exists(PREDICTION_BUFFER_PATH):
-            logger.warning("Prediction buffer does not exist")
-            return
+        if len(prediction_buffer) < keystroke_threshold:
+            return  # Not enough keystrokes for prediction
         
-        # Read the prediction buffer
+        # Take the pending window from the in-memory buffer
         try:
-            df = pd.read_csv(PREDICTION_BUFFER_PATH)
-            if len(df) < keystroke_threshold:
-                return  # Not enough keystrokes for prediction
+            df = prediction_buffer.to_frame()
         except Exception as e:
             logger.error(f"Error reading prediction buffer: {str(e)}")
             return
         
         # Preprocess data for prediction
         try:
-            processed_data = keystroke_processor.preprocess_keystroke_data(df)
+            hold_filter = _hold_time_filter()
+            processed_data = keystroke_processor.preprocess_keystroke_matrix(df, fixed_text_spec, hold_filter)
+            hold_filter.save()
         except Exception as e:
             logger.error(f"Error preprocessing data: {str(e)}")
             return
         
+        if _evaluate_window(processed_data, df) is None:
+            return
+        
+        # Reset prediction buffer
+        _reset_prediction_buffer()
+        
+        # Save status
+        save_status()
+        
+    except Exception as e:
+        logger.error(f"Error processing for anomaly detection: {str(e)}")
+
+def _evaluate_window(processed_data, df):
+    """Score one window of preprocessed keystrokes and raise an alert if anomalous."""
+    global last_prediction_time
+    
+    try:
         # Make prediction with fixed-text model for anomaly detection
         try:
+            # Model input in the training layout (a no-op for matrices)
+            processed_data = fixed_text_spec.to_matrix(processed_data)
+            
             # Use the prediction method
             prediction = fixed_text.predict(processed_data)
             prediction = prediction.flatten() if isinstance(prediction, np.ndarray) else prediction
@@ -376,14 +446,10 @@ def process_for_anomaly_detection():
         if result.get('is_anomaly', False):
             create_alert(result, df)
         
-        # Reset prediction buffer
-        _reset_prediction_buffer()
-        
-        # Save status
-        save_status()
-        
+        return result
     except Exception as e:
-        logger.error(f"Error processing for anomaly detection: {str(e)}")
+        logger.error(f"Error evaluating prediction window: {str(e)}")
+        return None
 
 def create_alert(result, keystroke_data):
     """Create an alert for anomalous behavior."""
@@ -449,197 +515,174 @@ def monitor_collection():
     
     logger.info("Started free-text collection monitoring thread")
     
-    # Keep track of last known keystroke count
-    last_known_count = 0
+    # New keystrokes are pushed by the collector; rows already in today's
+    # file count towards the training target
+    subscription = keystroke_events.bus.subscribe("free-text")
+    keystroke_count += keystroke_collector.get_collection_status().get("keystroke_count", 0)
     buffer_count = 0
+    last_status_save = 0.0
     
-    while collection_active:
-        try:
-            # Get the current status from the keystroke collector
-            collector_status = keystroke_collector.get_collection_status()
-            current_count = collector_status.get("keystroke_count", 0)
+    try:
+        while collection_active:
+            try:
+                # Wait for new keystrokes, waking up regularly to check the flags
+                events = subscription.get(timeout=1.0)
             
-            # If there are new keystrokes
-            if current_count > last_known_count:
-                new_keystrokes = current_count - last_known_count
-                keystroke_count += new_keystrokes
-                logger.debug(f"Detected {new_keystrokes} new keystrokes, total: {keystroke_count}")
+                # If there are new keystrokes
+                if events:
+                    new_keystrokes = len(events)
+                    keystroke_count += new_keystrokes
+                    logger.debug(f"Detected {new_keystrokes} new keystrokes, total: {keystroke_count}")
                 
-                # Check if we've reached the free-text target
-                if keystroke_count >= free_text_target:
-                    logger.info(f"Reached target of {free_text_target} keystrokes for free-text model training")
+                    # Check if we've reached the free-text target
+                    if keystroke_count >= free_text_target:
+                        logger.info(f"Reached target of {free_text_target} keystrokes for free-text model training")
                     
-                    # Train free-text model regardless of mode
-                    try:
-                        logger.info("Starting free-text model training process")
+                        # Train free-text model regardless of mode
+                        try:
+                            logger.info("Starting free-text model training process")
                         
-                        # Get the username from the current collection status
-                        username = keystroke_collector.get_collection_status().get("username", "unknown")
+                            # Get the username from the current collection status
+                            username = keystroke_collector.get_collection_status().get("username", "unknown")
                         
-                        # 1. Load authorized user data from the most recent collection file
-                        user_keystroke_dir = os.path.join(STORAGE_DIR, "keystroke_collection")
-                        current_date = datetime.now().strftime('%Y-%m-%d')
-                        user_file = os.path.join(user_keystroke_dir, f"keystrokes_{username}_free-text_{current_date}.csv")
+                            # 1. Load authorized user data from the most recent collection file
+                            user_keystroke_dir = os.path.join(STORAGE_DIR, "keystroke_collection")
+                            current_date = datetime.now().strftime('%Y-%m-%d')
+                            user_file = os.path.join(user_keystroke_dir, f"keystrokes_{username}_free-text_{current_date}.csv")
                         
-                        # If today's file doesn't exist, try to find any matching file
-                        if not os.path.exists(user_file):
-                            all_files = os.listdir(user_keystroke_dir)
-                            matching_files = [f for f in all_files if f.startswith(f"keystrokes_{username}_free-text_") and f.endswith(".csv")]
+                            # If today's file doesn't exist, try to find any matching file
+                            if not os.path.exists(user_file):
+                                latest_file = keystroke_collector.catalog.latest_file(username, "free-text")
                             
-                            if not matching_files:
-                                logger.error(f"No free-text keystroke files found for user {username}")
-                                return
+                                if not latest_file:
+                                    logger.error(f"No free-text keystroke files found for user {username}")
+                                    return
                             
-                            # Sort files by modification time (newest first)
-                            matching_files.sort(key=lambda f: os.path.getmtime(os.path.join(user_keystroke_dir, f)), reverse=True)
-                            user_file = os.path.join(user_keystroke_dir, matching_files[0])
+                                user_file = os.path.join(user_keystroke_dir, os.path.basename(latest_file))
                         
-                        logger.info(f"Loading authorized user data from {user_file}")
+                            logger.info(f"Loading authorized user data from {user_file}")
                         
-                        # 2. Load anomaly user data
-                        anomaly_dir = os.path.join(STORAGE_DIR, "data")
-                        all_files = os.listdir(anomaly_dir)
-                        anomaly_files = [os.path.join(anomaly_dir, f) for f in all_files 
-                                    if f.startswith("Freetext_") and f.endswith(".csv")]
+                            # 2. Load anomaly user data
+                            anomaly_dir = os.path.join(STORAGE_DIR, "data")
+                            all_files = os.listdir(anomaly_dir)
+                            anomaly_files = [os.path.join(anomaly_dir, f) for f in all_files 
+                                        if f.startswith("Freetext_") and f.endswith(".csv")]
                         
-                        if not anomaly_files:
-                            logger.error("No anomaly data files found")
-                            return
-                        
-                        logger.info(f"Found {len(anomaly_files)} anomaly data files")
-                        
-                        # 3. Create a dictionary of additional users (anomaly users)
-                        additional_users = {}
-                        for idx, file_path in enumerate(anomaly_files):
-                            # Use a numbered ID for each anomaly user
-                            additional_users[f"anomaly_user_{idx}"] = file_path
-                        
-                        # 4. Preprocess the data using the keystroke_processor
-                        logger.info("Preprocessing keystroke data with user information")
-                        processed_df = keystroke_processor.preprocess_keystroke_data(
-                            user_file,
-                            user_name=username,
-                            additional_users=additional_users
-                        )
+                            if not anomaly_files:
+                                logger.error("No anomaly data files found")
+                                return
                         
-                        logger.info(f"Processed data shape: {processed_df.shape}")
+                            logger.info(f"Found {len(anomaly_files)} anomaly data files")
                         
-                        # 5. Separate features and labels
-                        if 'User' in processed_df.columns:
-                            # Create binary labels: 1 for authorized user, 0 for anomaly users
-                            y = (processed_df['User'] == username).astype(int)
-                            # Remove User column from features
-                            X = processed_df.drop('User', axis=1)
-                        else:
-                            logger.error("User column not found in processed data")
-                            return
+                            # 3. Create a dictionary of additional users (anomaly users)
+                            additional_users = {}
+                            for idx, file_path in enumerate(anomaly_files):
+                                # Use a numbered ID for each anomaly user
+                                additional_users[f"anomaly_user_{idx}"] = file_path
                         
-                        logger.info(f"Features shape: {X.shape}, Labels shape: {y.shape}")
-                        logger.info(f"Positive samples (authorized user): {sum(y)}, Negative samples (anomaly): {len(y) - sum(y)}")
+                            # 4. Import the model
+                            from models import free_text_model
+                            model = free_text_model.FreeTextModel(username)
                         
-                        # 6. Import the model
-                        from models import free_text_model
-                        model = free_text_model.FreeTextModel(username)
+                            # Get the absolute file path that the model is expecting
+                            # Convert the relative path in model.data_path to an absolute path
+                            model_data_dir = os.path.dirname(os.path.abspath(model.data_path))
+                            model_data_path = os.path.abspath(model.data_path)
                         
-                        # Get the absolute file path that the model is expecting
-                        # Convert the relative path in model.data_path to an absolute path
-                        model_data_dir = os.path.dirname(os.path.abspath(model.data_path))
-                        model_data_path = os.path.abspath(model.data_path)
+                            # Ensure the directory exists
+                            os.makedirs(model_data_dir, exist_ok=True)
                         
-                        # Ensure the directory exists
-                        os.makedirs(model_data_dir, exist_ok=True)
+                            # 5. Preprocess chunk by chunk into a float32 training set and save
+                            # it to the exact path that the model is looking for
+                            logger.info("Preprocessing keystroke data with user information")
+                            training_set = build_training_set(
+                                user_file,
+                                user_name=username,
+                                additional_users=additional_users,
+                                # Create binary labels: 1 for authorized user, 0 for anomaly users
+                                label=lambda users: (users == username).astype(int),
+                                chunksize=10000
+                            )
                         
-                        # Add the label column to the processed data
-                        data_for_model = X.copy()
-                        data_for_model['label'] = y
+                            total_rows = len(training_set)
+                            if not total_rows:
+                                logger.error("No keystroke data left after preprocessing")
+                                return
                         
-                        # Save directly to the exact path that the model is looking for
-                        data_for_model.to_csv(model_data_path, index=False)
-                        logger.info(f"Saved processed data to {model_data_path}")
+                            positive_rows = int(training_set.labels.sum())
+                            logger.info(f"Positive samples (authorized user): {positive_rows}, Negative samples (anomaly): {total_rows - positive_rows}")
+                            if not training_set.save(model_data_path, label_column='label'):
+                                return
+                            logger.info(f"Saved processed data to {model_data_path}")
                         
-                        # 7. Update collection status to indicate enough data has been collected
-                        collection_status = model.get_collection_status()
-                        collection_status['keystroke_count'] = free_text_target
-                        collection_status['percentage'] = 100
-                        collection_status['last_updated'] = datetime.now().isoformat()
-                        collection_status['username'] = username
+                            # 6. Update collection status to indicate enough data has been collected
+                            collection_status = model.get_collection_status()
+                            collection_status['keystroke_count'] = free_text_target
+                            collection_status['percentage'] = 100
+                            collection_status['last_updated'] = datetime.now().isoformat()
+                            collection_status['username'] = username
                         
-                        # Save the updated status
-                        with open(model.collection_path, 'w') as f:
-                            json.dump(collection_status, f)
-                        logger.info(f"Updated collection status at {model.collection_path}")
+                            # Save the updated status
+                            with open(model.collection_path, 'w') as f:
+                                json.dump(collection_status, f)
+                            logger.info(f"Updated collection status at {model.collection_path}")
                         
-                        # 8. Train the model with parameters
-                        logger.info("Training free-text model")
-                        model_params = {
+                            # 7. Train the model with parameters
+                            logger.info("Training free-text model")
+                            model_params = {
                             
-                        }
+                            }
                         
-                        # Verify the file exists before training
-                        if os.path.exists(model_data_path):
-                            logger.info(f"Confirmed training data file exists at {model_data_path}")
-                        else:
-                            logger.error(f"Training data file NOT found at {model_data_path}")
+                            # Verify the file exists before training
+                            if os.path.exists(model_data_path):
+                                logger.info(f"Confirmed training data file exists at {model_data_path}")
+                            else:
+                                logger.error(f"Training data file NOT found at {model_data_path}")
                         
-                        result = model.train(model_params)
+                            result = model.train(model_params)
                         
-                        if result.get('success', False):
-                            logger.info(f"Free-text model trained successfully with accuracy: {result.get('accuracy', 0)}")
+                            if result.get('success', False):
+                                logger.info(f"Free-text model trained successfully with accuracy: {result.get('accuracy', 0)}")
                             
-                            # For multi-binary model, stop collection after training but don't switch models
-                            if multi_binary_model:
-                                logger.info("Multi-binary model mode: stopping collection after training")
-                                stop_free_text_collection()
-                                return
-                        else:
-                            logger.error(f"Error in model training: {result.get('error', 'Unknown error')}")
+                                # For multi-binary model, stop collection after training but don't switch models
+                                if multi_binary_model:
+                                    logger.info("Multi-binary model mode: stopping collection after training")
+                                    stop_free_text_collection()
+                                    return
+                            else:
+                                logger.error(f"Error in model training: {result.get('error', 'Unknown error')}")
                         
-                    except Exception as e:
-                        logger.error(f"Error in free-text model training process: {str(e)}")
-                        logger.exception("Full traceback for training process:")
+                        except Exception as e:
+                            logger.error(f"Error in free-text model training process: {str(e)}")
+                            logger.exception("Full traceback for training process:")
 
-                # Get the latest keystrokes for anomaly detection
-                try:
-                    # Get the csv file path
-                    csv_file = keystroke_collector.get_log_file_path()
-                    
-                    if os.path.exists(csv_file):
-                        # Read the latest keystrokes
-                        df = pd.read_csv(csv_file)
-                        
-                        # Get only the new ones
-                        if len(df) >= new_keystrokes:
-                            latest_keystrokes = df.iloc[-new_keystrokes:]
-                            
-                            # Append to the prediction buffer
-                            if os.path.exists(PREDICTION_BUFFER_PATH):
-                                # Append to existing buffer
-                                with open(PREDICTION_BUFFER_PATH, 'a', newline='') as f:
-                                    latest_keystrokes.to_csv(f, header=False, index=False)
-                            else:
-                                # Create new buffer file
-                                latest_keystrokes.to_csv(PREDICTION_BUFFER_PATH, index=False)
-                            
+                    if streaming_mode and prediction_active:
+                        # Sliding windows: scored as soon as each stride completes
+                        try:
+                            _stream_for_anomaly_detection(events)
+                        except Exception as e:
+                            logger.error(f"Error in streaming anomaly detection: {str(e)}")
+                    else:
+                        # Append the new keystrokes to the prediction buffer
+                        try:
+                            _append_to_prediction_buffer(events)
                             buffer_count += new_keystrokes
-                except Exception as e:
-                    logger.error(f"Error updating prediction buffer: {str(e)}")
-                
-                # Check if we should make an anomaly detection
-                if buffer_count >= keystroke_threshold and prediction_active:
-                    # Process for anomaly detection
-                    process_for_anomaly_detection()
-                    buffer_count = 0
-                
-                # Update last known count
-                last_known_count = current_count
-            
-            # Save status
-            save_status()
+                        except Exception as e:
+                            logger.error(f"Error updating prediction buffer: {str(e)}")
+                    
+                        # Check if we should make an anomaly detection
+                        if buffer_count >= keystroke_threshold and prediction_active:
+                            # Process for anomaly detection
+                            process_for_anomaly_detection()
+                            buffer_count = 0
             
-            # Sleep for a bit
-            time.sleep(1)
-        except Exception as e:
-            logger.error(f"Error in free-text collection monitoring thread: {str(e)}")
-            time.sleep(5)
-    
+                # Save status (at most once a second)
+                if time.monotonic() - last_status_save >= 1.0:
+                    save_status()
+                    last_status_save = time.monotonic()
+            except Exception as e:
+                logger.error(f"Error in free-text collection monitoring thread: {str(e)}")
+                time.sleep(5)
+    finally:
+        subscription.close()
     logger.info("Free-text collection monitoring thread stopped")
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""
+Catalog of keystroke collection files.
+Keeps a persistent manifest of every `keystrokes_<user>_<model type>_<date>.csv`
+file in the collection directory with its row count, size and time range, so
+listing files and reading counts does not require reading the files.
+"""
+
+import csv
+import io
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILENAME = "catalog.json"
+LOG_PREFIX = "keystrokes_"
+LOG_SUFFIX = ".csv"
+
+# Appends are written to the catalog at most this often (seconds); a catalog
+# left behind by a crash is corrected by the next refresh()
+SAVE_INTERVAL = 5.0
+
+
+def parse_log_filename(filename):
+    """Split a collection file name into its user, model type and date.
+
+    Returns None for names that do not follow the collector's naming scheme.
+    The date is the last component, the model type the one before it; anything
+    in front belongs to the username (which may itself contain underscores).
+    """
+    if not (filename.startswith(LOG_PREFIX) and filename.endswith(LOG_SUFFIX)):
+        return None
+    parts = filename[len(LOG_PREFIX):-len(LOG_SUFFIX)].rsplit('_', 2)
+    if len(parts) == 3:
+        username, model_type, date = parts
+    elif len(parts) == 1:
+        # Legacy keystrokes_<date>.csv files
+        username, model_type, date = None, None, parts[0]
+    else:
+        return None
+    return {
+        "username": username,
+        "model_type": model_type,
+        "date": date
+    }
+
+
+def _scan_file(path):
+    """Read a collection file once to get its row count and time range."""
+    row_count = 0
+    first_row = None
+    last_line = None
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        next(f, None)  # Header
+        for line in f:
+            if not line.strip():
+                continue
+            if first_row is None:
+                first_row = line
+            last_line = line
+            row_count += 1
+
+    first_timestamp = last_timestamp = None
+    if first_row is not None:
+        first_timestamp = next(csv.reader(io.StringIO(first_row)))[0]
+        last_timestamp = _row_timestamp(last_line)
+    return row_count, first_timestamp, last_timestamp
+
+
+def _row_timestamp(line):
+    """Release timestamp of a CSV row (press timestamp if there is none)."""
+    fields = next(csv.reader(io.StringIO(line)))
+    return fields[1] if len(fields) > 1 else fields[0]
+
+
+class KeystrokeCatalog:
+    """Persistent manifest of the keystroke collection directory."""
+
+    def __init__(self, log_dir, catalog_path=None, save_interval=SAVE_INTERVAL):
+        self.log_dir = log_dir
+        self.catalog_path = catalog_path or os.path.join(log_dir, CATALOG_FILENAME)
+        self.save_interval = save_interval
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._dirty = False
+        self._last_save = 0.0
+        self._load()
+
+    def _load(self):
+        try:
+            if os.path.exists(self.catalog_path):
+                with open(self.catalog_path, 'r') as f:
+                    self._entries = json.load(f).get("files", {})
+        except Exception as e:
+            logger.error(f"Error loading keystroke catalog, it will be rebuilt: {str(e)}")
+            self._entries = {}
+
+    def _save(self):
+        try:
+            tmp_path = self.catalog_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({"files": self._entries}, f)
+            os.replace(tmp_path, self.catalog_path)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Error saving keystroke catalog: {str(e)}")
+        self._last_save = time.monotonic()
+
+    def flush(self):
+        """Write the catalog if appends were recorded since the last save."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def refresh(self):
+        """Bring the catalog in line with the directory.
+
+        Only files that are new or whose size/mtime no longer match the catalog
+        are read; everything else costs one stat call. Files that only grew
+        are read from where the catalog left off.
+        """
+        with self._lock:
+            changed = False
+            seen = set()
+            try:
+                with os.scandir(self.log_dir) as it:
+                    for dir_entry in it:
+                        info = parse_log_filename(dir_entry.name)
+                        if info is None or not dir_entry.is_file():
+                            continue
+                        seen.add(dir_entry.name)
+                        stat = dir_entry.stat()
+                        entry = self._entries.get(dir_entry.name)
+                        if (entry is not None and entry.get("size_bytes") == stat.st_size
+                                and entry.get("mtime") == stat.st_mtime):
+                            continue
+                        if (entry is not None and entry.get("row_count")
+                                and stat.st_size > entry.get("size_bytes", stat.st_size)
+                                and self._tail_entry(dir_entry.path, entry, stat)):
+                            changed = True
+                            continue
+                        try:
+                            row_count, first_ts, last_ts = _scan_file(dir_entry.path)
+                        except Exception as e:
+                            logger.error(f"Error scanning keystroke file {dir_entry.name}: {str(e)}")
+                            continue
+                        info.update({
+                            "filename": dir_entry.name,
+                            "row_count": row_count,
+                            "size_bytes": stat.st_size,
+                            "mtime": stat.st_mtime,
+                            "first_timestamp": first_ts,
+                            "last_timestamp": last_ts
+                        })
+                        self._entries[dir_entry.name] = info
+                        changed = True
+            except FileNotFoundError:
+                pass
+
+            for filename in list(self._entries):
+                if filename not in seen:
+                    del self._entries[filename]
+                    changed = True
+
+            if changed or self._dirty:
+                self._save()
+
+    def _tail_entry(self, path, entry, stat):
+        """Update an entry from the lines appended since it was last recorded.
+
+        Lines are only counted and the last one's timestamp read; nothing
+        is parsed into keystrokes.
+        """
+        try:
+            with open(path, 'rb') as f:
+                f.seek(entry["size_bytes"])
+                data = f.read()
+        except Exception as e:
+            logger.error(f"Error reading appended keystrokes from {path}: {str(e)}")
+            return False
+        # A trailing partial line is picked up on the next refresh
+        complete = data[:data.rfind(b"\n") + 1]
+        lines = [line for line in complete.split(b"\n") if line.strip()]
+        entry["row_count"] += len(lines)
+        if lines:
+            try:
+                entry["last_timestamp"] = _row_timestamp(lines[-1].decode('utf-8'))
+            except Exception as e:
+                logger.error(f"Error reading last keystroke of {path}: {str(e)}")
+        entry["size_bytes"] += len(complete)
+        entry["mtime"] = stat.st_mtime
+        return True
+
+    def record_append(self, csv_file, rows, last_timestamp=None):
+        """Account for `rows` just appended to `csv_file` without rereading it.
+
+        `last_timestamp` defaults to the release timestamp of the last row.
+        The catalog file is rewritten at most every `save_interval` seconds;
+        flush() writes what is pending.
+        """
+        if not rows:
+            return
+        filename = os.path.basename(csv_file)
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is None:
+                info = parse_log_filename(filename)
+                if info is None:
+                    return
+                # File not catalogued yet: read it once, new rows included
+                try:
+                    row_count, first_ts, last_ts = _scan_file(csv_file)
+                except Exception as e:
+                    logger.error(f"Error scanning keystroke file {filename}: {str(e)}")
+                    return
+                entry = dict(info, filename=filename, row_count=row_count,
+                             first_timestamp=first_ts, last_timestamp=last_ts)
+                self._entries[filename] = entry
+            else:
+                entry["row_count"] += len(rows)
+                entry["last_timestamp"] = last_timestamp or str(rows[-1][1])
+            try:
+                stat = os.stat(csv_file)
+                entry["size_bytes"] = stat.st_size
+                entry["mtime"] = stat.st_mtime
+            except OSError:
+                pass
+            self._dirty = True
+            if time.monotonic() - self._last_save >= self.save_interval:
+                self._save()
+
+    def get(self, filename):
+        """Catalog entry for a file name (or path), or None."""
+        with self._lock:
+            entry = self._entries.get(os.path.basename(filename))
+            return dict(entry) if entry else None
+
+    def row_count(self, csv_file):
+        """Number of data rows in a collection file (0 if unknown)."""
+        entry = self.get(csv_file)
+        return entry["row_count"] if entry else 0
+
+    def entries(self, username=None, model_type=None):
+        """Catalog entries, newest file name first, optionally filtered."""
+        with self._lock:
+            entries = [dict(e) for e in self._entries.values()
+                       if (username is None or e.get("username") == username)
+                       and (model_type is None or e.get("model_type") == model_type)]
+        entries.sort(key=lambda e: e["filename"], reverse=True)
+        return entries
+
+    def latest_file(self, username, model_type):
+        """Path of the most recent file for a user and model type, or None."""
+        with self._lock:
+            candidates = [e for e in self._entries.values()
+                          if e.get("username") == username and e.get("model_type") == model_type]
+        if not candidates:
+            return None
+        latest = max(candidates, key=lambda e: e["date"])
+        return os.path.join(self.log_dir, latest["filename"])
@@ -0,0 +1,64 @@
+"""
+Keystroke timing clock.
+Press and release times are captured with `time.perf_counter_ns()`, which is
+monotonic and high resolution, and mapped onto the local wall clock through an
+anchor (a wall-clock / counter pair sampled together). The anchor is refreshed
+occasionally, so NTP adjustments shift later timestamps as a whole instead of
+distorting the intervals between keystrokes.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Local wall-clock nanoseconds count from this naive epoch, like the collector's
+# timestamp strings and the segment files
+_EPOCH = datetime(1970, 1, 1)
+
+
+def now_ns():
+    """Monotonic timestamp for a key event."""
+    return time.perf_counter_ns()
+
+
+def format_wall_ns(ns):
+    """Collector timestamp string ('%Y-%m-%d %H:%M:%S.%f') for local wall-clock ns."""
+    return (_EPOCH + timedelta(microseconds=int(ns) // 1000)).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def format_duration_ns(ns):
+    """Hold time text as the collector writes it (str of a timedelta)."""
+    return str(timedelta(microseconds=int(ns) // 1000))
+
+
+class WallClockAnchor:
+    """Maps `perf_counter_ns` readings to local wall-clock nanoseconds.
+
+    A new anchor is sampled when the current one is older than
+    `anchor_interval` seconds.
+    """
+
+    def __init__(self, anchor_interval=60.0):
+        self.anchor_interval_ns = int(anchor_interval * 1e9)
+        self._lock = threading.Lock()
+        self._wall_ns = 0
+        self._perf_ns = 0
+        self.anchor()
+
+    def anchor(self):
+        """Sample a fresh wall-clock / counter pair."""
+        perf_before = time.perf_counter_ns()
+        wall_ns = time.time_ns()
+        perf_after = time.perf_counter_ns()
+        # Shift from UTC to local time (DST aware)
+        wall_ns += time.localtime(wall_ns // 1_000_000_000).tm_gmtoff * 1_000_000_000
+        with self._lock:
+            self._wall_ns = wall_ns
+            self._perf_ns = (perf_before + perf_after) // 2
+
+    def to_wall_ns(self, perf_ns):
+        """Local wall-clock ns for a counter reading."""
+        if perf_ns - self._perf_ns > self.anchor_interval_ns:
+            self.anchor()
+        with self._lock:
+            return self._wall_ns + (perf_ns - self._perf_ns)
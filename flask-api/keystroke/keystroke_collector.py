@@ -4,17 +4,23 @@ This module handles collecting keystroke data for AI model training.
 """
 
 import time
-import platform
 import csv
+import io
 import os
 import signal
 import sys
 from pynput import keyboard
 import threading
 from datetime import datetime
-import ctypes
-import subprocess
 import logging
+import atexit
+from keystroke.keystroke_writer import KeystrokeWriter
+from keystroke.keystroke_catalog import KeystrokeCatalog
+from keystroke import window_context
+from keystroke import keystroke_segment
+from keystroke import keystroke_clock
+from keystroke import keystroke_events
+from utils.symbol_table import key_symbols, app_symbols
 
 # Set up logging
 logging.basicConfig(
@@ -47,55 +53,84 @@ collection_stats = {
 os.makedirs(key_log_dir, exist_ok=True)
 logger.info(f"Created keystroke collection directory: {key_log_dir}")
 
+# Manifest of the collection directory (row counts, sizes, time ranges)
+catalog = KeystrokeCatalog(key_log_dir)
+catalog.refresh()
+
+# Press/release times are monotonic counter readings mapped to wall-clock ns
+wall_clock = keystroke_clock.WallClockAnchor(anchor_interval=60.0)
+
+def _on_rows_written(csv_file, rows):
+    """Writer-thread callback: rows are on disk, so count and catalog them."""
+    with lock:
+        collection_stats["keystroke_count"] += len(rows)
+    catalog.record_append(csv_file, rows, last_timestamp=keystroke_clock.format_wall_ns(rows[-1][1]))
+    
+    # Mirror the batch into the day's binary segment (ns and codes go in as they are)
+    try:
+        keystroke_segment.append_records(
+            keystroke_segment.segment_path_for(csv_file),
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            [row[2] for row in rows],
+            [row[3] for row in rows]
+        )
+    except Exception as e:
+        logger.error(f"Error appending keystrokes to segment: {str(e)}")
+
+def _format_row(row):
+    """Writer-thread formatting: timestamp text and the decoded key for the CSV."""
+    press_ns, release_ns, key_code, _, title = row
+    return [
+        keystroke_clock.format_wall_ns(press_ns),
+        keystroke_clock.format_wall_ns(release_ns),
+        key_symbols.symbol(key_code),
+        # The title as it was read, whatever the symbol tables hold
+        title,
+        keystroke_clock.format_duration_ns(release_ns - press_ns)
+    ]
+
+# Background writer: callbacks queue rows, one thread batches them to disk
+writer = KeystrokeWriter(
+    max_queue_size=10000,  # Rows held in memory before new ones are dropped
+    batch_size=256,        # Flush after this many rows...
+    flush_interval=0.5,    # ...or this many seconds after the first pending row
+    on_flush=_on_rows_written,
+    format_row=_format_row
+)
+# Exit handlers run in reverse: the writer's last batch is catalogued first
+atexit.register(catalog.flush)
+atexit.register(writer.close)
+
+# Active window lookups are cached by a provider; see window_context.py
+window_provider = window_context.default_provider()
+
+# Keywords for sensitive fields
+sensitive_keywords = [
+]
+sensitive_matcher = window_context.SensitiveFieldMatcher(sensitive_keywords)
+
+def set_window_provider(provider):
+    """Replace the active-window provider (e.g. with a FakeWindowContextProvider)."""
+    global window_provider
+    if window_provider is not provider:
+        window_provider.close()
+    window_provider = provider
+
 # Helper functions
 def get_active_window_title():
     """Get the title of the currently active window."""
-    if platform.system() == "Windows":
-        try:
-            user32 = ctypes.windll.user32
-            hwnd = user32.GetForegroundWindow()
-            length = user32.GetWindowTextLengthW(hwnd)
-            buff = ctypes.create_unicode_buffer(length + 1)
-            user32.GetWindowTextW(hwnd, buff, length + 1)
-            return buff.value
-        except Exception as e:
-            return f"Error: {e}"
-    elif platform.system() == "Darwin":
-        try:
-            # Check if the frontmost app is Safari or Chrome
-            script = """
-            tell application "System Events"
-                set frontApp to name of first application process whose frontmost is true
-            end tell
-            if frontApp is "Safari" then
-                tell application "Safari"
-                    return URL of current tab of window 1
-                end tell
-            else if frontApp is "Google Chrome" then
-                tell application "Google Chrome"
-                    return URL of active tab of front window
-                end tell
-            else
-                return "No supported browser is active"
-            end if
-            """
-            result = subprocess.run(["osascript", "-e", script], capture_output=True, text=True)
-            return result.stdout.strip()
-        except Exception as e:
-            return f"Error: {e}"
-    return "Unknown"
+    return window_provider.current_title()
 
 def get_active_process():
     """Get the name of the currently active process."""
     return get_active_window_title()
 
-def is_sensitive_field():
+def is_sensitive_field(window_title=None):
     """Determine if the current window is a sensitive field."""
-    window_title = get_active_window_title().lower()
-    # Keywords for sensitive fields
-    sensitive_keywords = [
-    ]
-    return any(keyword in window_title for keyword in sensitive_keywords)
+    if window_title is None:
+        window_title = get_active_window_title()
+    return sensitive_matcher.matches(window_title)
 
 def get_log_file_path(log_dir=None):
     """Get the path to the log file for today."""
@@ -112,33 +147,35 @@ def get_previous_log_file_path(log_dir=None):
         log_dir = key_log_dir
     username = collection_stats.get("username", "unknown")
     model_type = collection_stats.get("model_type", "unknown")
-    pattern = f'keystrokes_{username}_{model_type}_*.csv'
-    files = [f for f in os.listdir(log_dir) if f.startswith(f'keystrokes_{username}_{model_type}_') and f.endswith('.csv')]
-    if not files:
-        return None
-    files.sort(reverse=True)
-    return os.path.join(log_dir, files[0]) if files else None
+    if log_dir != key_log_dir:
+        return KeystrokeCatalog(log_dir).latest_file(username, model_type)
+    return catalog.latest_file(username, model_type)
 
 # Keyboard event handlers
 def on_press(key):
     """Handle key press events."""
     global partial_data, collection_active
     
-    if not collection_active or is_sensitive_field():
-        return  # Skip if collection is inactive or in a sensitive field
+    if not collection_active:
+        return  # Skip if collection is inactive
     
     try:
-        active_process = get_active_process()
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+        # One cached lookup serves both the sensitivity check and the row
+        active_process = window_provider.current_title()
+        if is_sensitive_field(active_process):
+            return  # Skip keystrokes typed into sensitive fields
+        
+        timestamp = keystroke_clock.now_ns()
         
-        # Convert key to string representation
-        key_str = str(key)
+        # Keys and applications travel as interned codes
+        key_code = key_symbols.intern(str(key))
         
-        if key_str not in partial_data:    
-            partial_data[key_str] = {
+        if key_code not in partial_data:    
+            partial_data[key_code] = {
                 "timestamp_press": timestamp,
-                "key": key_str,
-                "active_process": active_process
+                "key": key_code,
+                "active_process": app_symbols.intern(active_process),
+                "title": active_process
             }
     except Exception as e:
         print(f"Error in on_press: {e}")
@@ -151,43 +188,36 @@ def on_release(key):
         return  # Skip if collection is inactive
     
     try:
-        key_str = str(key)
+        key_code = key_symbols.intern(str(key))
         
-        if key_str in partial_data:
-            press_data = partial_data.pop(key_str)
+        if key_code in partial_data:
+            press_data = partial_data.pop(key_code)
             csv_file = get_log_file_path()
-            headers = ["Timestamp_Press", "Timestamp_Release", "Key Stroke", "Application", "Hold Time"]
             
-            timestamp_release = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
-            timestamp_release_dt = datetime.strptime(timestamp_release, '%Y-%m-%d %H:%M:%S.%f')
-            timestamp_press = press_data["timestamp_press"]
-            timestamp_press_dt = datetime.strptime(timestamp_press, '%Y-%m-%d %H:%M:%S.%f')
+            timestamp_release = keystroke_clock.now_ns()
             
-            hold_time = timestamp_release_dt - timestamp_press_dt
+            # Both ends go through the same anchor, so hold time is exactly the
+            # monotonic difference; text formatting happens on the writer thread
+            release_ns = wall_clock.to_wall_ns(timestamp_release)
+            press_ns = release_ns - (timestamp_release - press_data["timestamp_press"])
             
-            with lock:
-                file_exists = os.path.isfile(csv_file)
-                with open(csv_file, mode='a', newline='', encoding='utf-8') as f:
-                    writer = csv.writer(f)
-                    if not file_exists:
-                        writer.writerow(headers)
-                    writer.writerow([
-                        press_data["timestamp_press"],
-                        timestamp_release,
-                        press_data["key"],
-                        press_data["active_process"],
-                        hold_time
-                    ])
-                    f.flush()
-                
-                # Update keystroke count from file
-                try:
-                    with open(csv_file, 'r', encoding='utf-8') as f:
-                        # Count lines and subtract 1 for header
-                        line_count = sum(1 for _ in f) - 1
-                        collection_stats["keystroke_count"] = max(0, line_count)
-                except Exception as e:
-                    logger.error(f"Error updating keystroke count: {str(e)}")
+            # Hand the row to the background writer; the keystroke count is
+            # updated once the row has been written to disk
+            writer.submit(csv_file, [
+                press_ns,
+                release_ns,
+                press_data["key"],
+                press_data["active_process"],
+                press_data["title"]
+            ])
+            
+            # Push the keystroke to in-process consumers right away
+            keystroke_events.bus.publish(keystroke_events.KeystrokeEvent(
+                press_ns,
+                release_ns,
+                press_data["key"],
+                press_data["active_process"]
+            ))
     except Exception as e:
         error_msg = f"Error in on_release: {str(e)}"
         logger.error(error_msg)
@@ -214,6 +244,13 @@ def start_collection(username, modelType):
             "model_type": modelType
         }
         
+        # Count continues from what is already in today's file and is
+        # maintained in memory from here on
+        collection_stats["keystroke_count"] = catalog.row_count(get_log_file_path())
+        
+        # Start the background writer before any key can be released
+        writer.start()
+        
         # Set up keyboard listener
         listener = keyboard.Listener(on_press=on_press, on_release=on_release)
         listener.start()
@@ -239,23 +276,19 @@ def stop_collection():
         if listener:
             listener.stop()
             listener = None
+        # Stop the background window refresher (restarted on the next lookup)
+        window_provider.close()
         collection_active = False
         collection_stats["active"] = False
         collection_stats["end_time"] = datetime.now().isoformat()
         
-        # Update keystroke count from file
-        csv_file = get_log_file_path()
-        if os.path.exists(csv_file):
-            try:
-                with open(csv_file, 'r', encoding='utf-8') as f:
-                    # Count lines and subtract 1 for header
-                    line_count = sum(1 for _ in f) - 1
-                    collection_stats["keystroke_count"] = max(0, line_count)
-                    logger.info(f"Final keystroke count: {line_count}")
-            except Exception as e:
-                error_msg = f"Error reading final keystroke count: {str(e)}"
-                logger.error(error_msg)
-                collection_stats["last_error"] = error_msg
+        # Make sure every queued keystroke is on disk before reporting
+        if not writer.flush():
+            error_msg = "Timed out flushing pending keystrokes"
+            logger.error(error_msg)
+            collection_stats["last_error"] = error_msg
+        catalog.flush()
+        logger.info(f"Final keystroke count: {collection_stats['keystroke_count']}")
         
         logger.info("Keystroke collection stopped successfully")
         return True
@@ -269,46 +302,30 @@ def get_collection_status():
     """Get the current status of keystroke collection."""
     global collection_stats
     
-    # Update keystroke count from file if active
-    if collection_active:
-        csv_file = get_log_file_path()
-        if os.path.exists(csv_file):
-            try:
-                with open(csv_file, 'r', encoding='utf-8') as f:
-                    # Count lines and subtract 1 for header
-                    line_count = sum(1 for _ in f) - 1
-                    if line_count > 0:
-                        collection_stats["keystroke_count"] = line_count
-                        logger.debug(f"Updated keystroke count: {line_count}")
-            except Exception as e:
-                error_msg = f"Error reading keystroke count: {str(e)}"
-                logger.error(error_msg)
-                collection_stats["last_error"] = error_msg
+    # The count is maintained by the writer; only report queue health here
+    collection_stats["pending_writes"] = writer.pending()
+    collection_stats["dropped_keystrokes"] = writer.dropped_count
+    collection_stats["event_subscribers"] = keystroke_events.bus.stats()
     
     return collection_stats
 
 def get_available_files():
     """Get a list of available keystroke collection files."""
-    files = [f for f in os.listdir(key_log_dir) if f.startswith('keystrokes_') and f.endswith('.csv')]
-    files.sort(reverse=True)
+    # Stat-only check for files changed outside the collector
+    catalog.refresh()
     
     file_info = []
-    for file in files:
-        path = os.path.join(key_log_dir, file)
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                # Count lines and subtract 1 for header
-                line_count = sum(1 for _ in f) - 1
-            
-            date = file.replace('keystrokes_', '').replace('.csv', '')
-            file_info.append({
-                "date": date,
-                "filename": file,
-                "keystroke_count": line_count,
-                "size_bytes": os.path.getsize(path)
-            })
-        except Exception as e:
-            print(f"Error reading file {file}: {e}")
+    for entry in catalog.entries():
+        file_info.append({
+            "date": entry["filename"].replace('keystrokes_', '').replace('.csv', ''),
+            "filename": entry["filename"],
+            "keystroke_count": entry["row_count"],
+            "size_bytes": entry["size_bytes"],
+            "username": entry["username"],
+            "model_type": entry["model_type"],
+            "first_timestamp": entry["first_timestamp"],
+            "last_timestamp": entry["last_timestamp"]
+        })
     
     return file_info
 
@@ -354,16 +371,19 @@ def get_csv_file_by_date(date_str):
         # Validate date format
         datetime.strptime(date_str, '%Y-%m-%d')
         file_path = os.path.join(key_log_dir, f'keystrokes_{date_str}.csv')
+        segment_path = keystroke_segment.segment_path_for(file_path)
         
-        if not os.path.exists(file_path):
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                csv_text = f.read()
+        elif os.path.exists(segment_path):
+            # Only the binary segment is left: export it in CSV layout
+            csv_text = keystroke_segment.export_csv(segment_path)
+        else:
             return [], False
             
-        # Read CSV file into list of dictionaries
-        data = []
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                data.append(row)
+        # Read CSV text into list of dictionaries
+        data = list(csv.DictReader(io.StringIO(csv_text)))
         
         return data, True
     except ValueError:
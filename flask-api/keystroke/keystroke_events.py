@@ -0,0 +1,105 @@
+"""
+In-process keystroke event bus.
+The collector publishes every completed keystroke as it is released; consumers
+(the anomaly-detection monitors) subscribe and are woken as soon as events
+arrive, instead of polling the collector and re-reading the day's CSV file.
+
+Each subscriber has its own bounded queue. A subscriber that falls behind
+loses its oldest events rather than slowing down the keyboard callback, and the
+number of events it lost is kept in its lag counter.
+"""
+
+import threading
+from collections import deque, namedtuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Wall-clock nanoseconds and interned key / application codes
+KeystrokeEvent = namedtuple("KeystrokeEvent", ["press_ns", "release_ns", "key_code", "app_code"])
+
+
+class Subscription:
+    """A subscriber's bounded event queue."""
+
+    def __init__(self, bus, name, max_queue_size):
+        self.bus = bus
+        self.name = name
+        self.max_queue_size = max_queue_size
+        self.delivered_count = 0
+        self.lag_count = 0  # Events dropped because the queue was full
+        self._events = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def _push(self, event):
+        with self._cond:
+            if len(self._events) >= self.max_queue_size:
+                self._events.popleft()
+                self.lag_count += 1
+                if self.lag_count == 1 or self.lag_count % 1000 == 0:
+                    logger.warning(f"Subscriber {self.name} is lagging, dropped {self.lag_count} events so far")
+            self._events.append(event)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Wait up to `timeout` seconds for events and return all queued ones (possibly none)."""
+        with self._cond:
+            if not self._events and not self._closed:
+                self._cond.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+        self.delivered_count += len(events)
+        return events
+
+    def pending(self):
+        return len(self._events)
+
+    def close(self):
+        """Unsubscribe and wake any waiting consumer."""
+        self.bus.unsubscribe(self)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "pending": self.pending(),
+            "delivered": self.delivered_count,
+            "lag": self.lag_count
+        }
+
+
+class KeystrokeEventBus:
+    """Fan-out of keystroke events to any number of subscribers."""
+
+    def __init__(self):
+        self._subscribers = ()
+        self._lock = threading.Lock()
+        self.published_count = 0
+
+    def subscribe(self, name, max_queue_size=10000):
+        subscription = Subscription(self, name, max_queue_size)
+        with self._lock:
+            self._subscribers = self._subscribers + (subscription,)
+        logger.info(f"Keystroke event subscriber {name} registered")
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscription)
+
+    def publish(self, event):
+        """Deliver an event to every subscriber. Never blocks on a slow consumer."""
+        self.published_count += 1
+        # Copy-on-write tuple: no lock needed to iterate
+        for subscription in self._subscribers:
+            subscription._push(event)
+
+    def stats(self):
+        return [s.stats() for s in self._subscribers]
+
+
+# Shared bus the collector publishes to
+bus = KeystrokeEventBus()
@@ -0,0 +1,301 @@
+"""
+Binary columnar segment format for collected keystrokes.
+
+A segment sits next to each daily CSV (`keystrokes_<user>_<model type>_<date>.kseg`)
+and holds the same rows as fixed-size records:
+
+    press_ns    int64   press time, nanoseconds since the epoch (local wall clock)
+    release_ns  int64   release time, same clock
+    key_id      int32   code in utils.symbol_table.key_symbols
+    app_id      int32   index in the segment's title table
+
+after a 16-byte header. Hold time is not stored: it is release_ns - press_ns.
+Records are appended in place, and a whole day loads with a single memory map
+whose columns are NumPy views, with no text parsing.
+
+Window titles are open-ended, so each segment keeps its own title table
+(`<segment>.titles`, one JSON string per line, appended as new titles show
+up) rather than codes in a table shared by every day. In version 1 segments
+app_id is a code in utils.symbol_table.app_symbols.
+"""
+
+import csv
+import io
+import os
+import json
+import struct
+import threading
+import logging
+import numpy as np
+
+from keystroke.keystroke_clock import format_duration_ns
+from utils.symbol_table import key_symbols, app_symbols
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".kseg"
+SEGMENT_MAGIC = b"KSEG"
+TITLES_SUFFIX = ".titles"
+SEGMENT_VERSION = 2
+SEGMENT_DTYPE = np.dtype([
+    ("press_ns", "<i8"),
+    ("release_ns", "<i8"),
+    ("key_id", "<i4"),
+    ("app_id", "<i4")
+])
+# magic, version, reserved, record size, reserved
+_HEADER = struct.Struct("<4sHHII")
+HEADER_SIZE = _HEADER.size
+
+CSV_HEADERS = ["Timestamp_Press", "Timestamp_Release", "Key Stroke", "Application", "Hold Time"]
+
+
+def segment_path_for(csv_path):
+    """Segment file that mirrors a keystroke CSV."""
+    root, _ = os.path.splitext(csv_path)
+    return root + SEGMENT_SUFFIX
+
+
+def csv_path_for(segment_path):
+    """Keystroke CSV that a segment mirrors."""
+    root, _ = os.path.splitext(segment_path)
+    return root + ".csv"
+
+
+def timestamps_to_ns(timestamps):
+    """Parse collector timestamp strings ('%Y-%m-%d %H:%M:%S.%f') into int64 ns."""
+    return np.asarray(timestamps, dtype="datetime64[ns]").astype(np.int64)
+
+
+def ns_to_timestamps(ns):
+    """Format int64 ns back into the collector's timestamp strings."""
+    text = np.datetime_as_string(np.asarray(ns, dtype=np.int64).astype("datetime64[ns]"), unit="us")
+    return np.char.replace(text, "T", " ")
+
+
+def titles_path_for(segment_path):
+    """Title table of a segment."""
+    root, _ = os.path.splitext(segment_path)
+    return root + TITLES_SUFFIX
+
+
+def _read_header(f):
+    """Check a segment header; returns the segment version."""
+    raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise ValueError("Truncated segment header")
+    magic, version, _, record_size, _ = _HEADER.unpack(raw)
+    if magic != SEGMENT_MAGIC:
+        raise ValueError("Not a keystroke segment file")
+    if version not in (1, SEGMENT_VERSION) or record_size != SEGMENT_DTYPE.itemsize:
+        raise ValueError(f"Unsupported segment version {version} (record size {record_size})")
+    return version
+
+
+def segment_version(path):
+    with open(path, "rb") as f:
+        return _read_header(f)
+
+
+def read_titles(segment_path):
+    """Titles of a segment's table, in index order."""
+    titles = []
+    path = titles_path_for(segment_path)
+    if not os.path.exists(path):
+        return titles
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break  # Partial line of an interrupted write; no record uses it
+            titles.append(json.loads(line))
+    return titles
+
+
+# Title tables of the segments appended to by this process:
+# segment path -> {app_symbols code: index in the segment's table}
+_segment_titles = {}
+_append_lock = threading.Lock()
+
+
+def _segment_title_index(path, app_ids, is_new):
+    """Indexes of `app_ids` (app_symbols codes) in the segment's title table,
+    appending titles it doesn't have yet."""
+    titles_path = titles_path_for(path)
+    index = None if is_new else _segment_titles.get(path)
+    if index is None:
+        if is_new:
+            titles = []
+            if os.path.exists(titles_path):
+                os.remove(titles_path)
+        else:
+            titles = read_titles(path)
+            # Drop a partial line so new titles start on a line of their own
+            with open(titles_path, "a", encoding="utf-8") as f:
+                f.truncate(sum(len(json.dumps(title).encode("utf-8")) + 1 for title in titles))
+        index = _segment_titles[path] = {app_symbols.intern(title): i for i, title in enumerate(titles)}
+
+    codes, inverse = np.unique(np.asarray(app_ids, dtype=np.int32), return_inverse=True)
+    new_codes = [int(code) for code in codes if int(code) not in index]
+    if new_codes:
+        # Titles reach disk before the records that use them
+        with open(titles_path, "a", encoding="utf-8") as f:
+            for code in new_codes:
+                index[code] = len(index)
+                f.write(json.dumps(app_symbols.symbol(code)) + "\n")
+    return np.array([index[int(code)] for code in codes], dtype=np.int32)[inverse]
+
+
+def append_records(path, press_ns, release_ns, key_ids, app_ids):
+    """Append rows to a segment, creating it if needed. Returns the rows written.
+
+    `app_ids` are codes in app_symbols; they are stored as indexes in the
+    segment's own title table.
+    """
+    with _append_lock:
+        is_new = not os.path.exists(path) or os.path.getsize(path) < HEADER_SIZE
+        if not is_new and segment_version(path) == 1:
+            _upgrade_segment(path)
+
+        records = np.empty(len(press_ns), dtype=SEGMENT_DTYPE)
+        records["press_ns"] = press_ns
+        records["release_ns"] = release_ns
+        records["key_id"] = key_ids
+        records["app_id"] = _segment_title_index(path, app_ids, is_new)
+
+        # Key codes must be decodable before they reach disk; the table is
+        # only rewritten when it gained symbols
+        if key_symbols.dirty:
+            key_symbols.save()
+
+        _write_records(path, records, is_new)
+    return len(records)
+
+
+def _write_records(path, records, is_new):
+    with open(path, "ab") as f:
+        if is_new:
+            f.truncate(0)
+            f.write(_HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, 0, SEGMENT_DTYPE.itemsize, 0))
+        else:
+            # Drop a partial record left behind by an interrupted write
+            excess = (os.path.getsize(path) - HEADER_SIZE) % SEGMENT_DTYPE.itemsize
+            if excess:
+                f.truncate(os.path.getsize(path) - excess)
+        f.write(records.tobytes())
+
+
+def _upgrade_segment(path):
+    """Rewrite a version 1 segment (app_symbols codes) with its own title table."""
+    records = read_segment(path)
+    records["app_id"] = _segment_title_index(path, records["app_id"], True)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    _write_records(tmp_path, records, True)
+    os.replace(tmp_path, path)
+    logger.info(f"Upgraded keystroke segment {path} to version {SEGMENT_VERSION}")
+
+
+def remove_segment(path):
+    """Delete a segment and its title table."""
+    with _append_lock:
+        _segment_titles.pop(path, None)
+        for file_path in (path, titles_path_for(path)):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+
+def append_rows(path, rows):
+    """Append collector CSV rows ([press, release, key, application, hold]) to a segment."""
+    if not rows:
+        return 0
+    press, release, keys, apps = zip(*((r[0], r[1], r[2], r[3]) for r in rows))
+    return append_records(
+        path,
+        timestamps_to_ns(press),
+        timestamps_to_ns(release),
+        key_symbols.intern_many(keys),
+        app_symbols.intern_many(apps)
+    )
+
+
+def load_segment(path):
+    """Memory-map a segment as a structured array (columns are zero-copy views).
+
+    app_id is as stored: see decode_titles().
+    """
+    with open(path, "rb") as f:
+        _read_header(f)
+    count = (os.path.getsize(path) - HEADER_SIZE) // SEGMENT_DTYPE.itemsize
+    if count == 0:
+        return np.empty(0, dtype=SEGMENT_DTYPE)
+    return np.memmap(path, dtype=SEGMENT_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+def decode_titles(path, app_ids):
+    """Window titles of a segment's app_id values, as an object array."""
+    if segment_version(path) == 1:
+        return app_symbols.decode(app_ids)
+    return np.array(read_titles(path), dtype=object)[np.asarray(app_ids, dtype=np.intp)]
+
+
+def read_segment(path):
+    """A segment's records in memory, with app_id as codes in app_symbols."""
+    records = np.array(load_segment(path))
+    if len(records) and segment_version(path) != 1:
+        records["app_id"] = app_symbols.intern_many(read_titles(path))[records["app_id"]]
+    return records
+
+
+def segment_row_count(path):
+    """Number of complete records in a segment (from its size alone)."""
+    if not os.path.exists(path):
+        return 0
+    return max(0, (os.path.getsize(path) - HEADER_SIZE) // SEGMENT_DTYPE.itemsize)
+
+
+def import_csv(csv_path, segment_path=None):
+    """Build a segment from a keystroke CSV. Returns the segment path."""
+    if segment_path is None:
+        segment_path = segment_path_for(csv_path)
+    rows = []
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Header
+        for row in reader:
+            if len(row) >= 4:
+                rows.append(row)
+    remove_segment(segment_path)
+    append_rows(segment_path, rows)
+    logger.info(f"Imported {len(rows)} keystrokes from {csv_path} into {segment_path}")
+    return segment_path
+
+
+def export_csv(segment_path, output=None):
+    """Write a segment out in the collector's CSV layout.
+
+    `output` may be a path or a text file object; with None the CSV text is returned.
+    """
+    records = load_segment(segment_path)
+    press = ns_to_timestamps(records["press_ns"])
+    release = ns_to_timestamps(records["release_ns"])
+    keys = key_symbols.decode(records["key_id"])
+    apps = decode_titles(segment_path, records["app_id"])
+    holds = records["release_ns"] - records["press_ns"]
+
+    def write(f):
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADERS)
+        for i in range(len(records)):
+            writer.writerow([press[i], release[i], keys[i], apps[i], format_duration_ns(holds[i])])
+
+    if output is None:
+        buffer = io.StringIO()
+        write(buffer)
+        return buffer.getvalue()
+    if isinstance(output, str):
+        with open(output, "w", encoding="utf-8", newline="") as f:
+            write(f)
+        return output
+    write(output)
+    return output
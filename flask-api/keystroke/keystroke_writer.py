@@ -0,0 +1,179 @@
+"""
+Background writer for the keystroke collector.
+Keyboard callbacks hand finished keystroke rows to a bounded in-memory queue and
+return immediately; a single writer thread appends them to the daily CSV files
+in batches (group commit).
+"""
+
+import csv
+import os
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CSV_HEADERS = ["Timestamp_Press", "Timestamp_Release", "Key Stroke", "Application", "Hold Time"]
+
+# Sentinel that tells the writer thread to exit after writing what it holds
+_STOP = object()
+
+
+class KeystrokeWriter:
+    """Group-commit writer for keystroke rows.
+
+    Rows are written when `batch_size` rows are pending or `flush_interval`
+    seconds after the first pending row arrived, whichever comes first.
+    `format_row(row)` turns a queued row into its CSV fields on the writer
+    thread, keeping that work out of the keyboard callback.
+    `on_flush(csv_file, rows)` is called from the writer thread with the queued
+    rows after each batch for a file has been written and flushed to disk.
+    """
+
+    def __init__(self, max_queue_size=10000, batch_size=256, flush_interval=0.5, on_flush=None, format_row=None):
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.format_row = format_row
+        self.written_count = 0
+        self.dropped_count = 0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def start(self):
+        """Start the writer thread if it is not already running."""
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="keystroke-writer")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def pending(self):
+        """Approximate number of rows waiting to be written."""
+        return self._queue.qsize()
+
+    def submit(self, csv_file, row):
+        """Queue a row for `csv_file`. Never blocks; returns False if the row was dropped."""
+        try:
+            self._queue.put_nowait((csv_file, row))
+            return True
+        except queue.Full:
+            self.dropped_count += 1
+            if self.dropped_count == 1 or self.dropped_count % 1000 == 0:
+                logger.warning(f"Keystroke write queue full, dropped {self.dropped_count} rows so far")
+            return False
+
+    def flush(self, timeout=5.0):
+        """Block until every row submitted before this call is on disk."""
+        if not self.is_running():
+            self._drain()
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            logger.error("Timed out waiting to flush keystroke writer")
+            return False
+        if not done.wait(timeout):
+            logger.error("Timed out waiting to flush keystroke writer")
+            return False
+        return True
+
+    def close(self, timeout=5.0):
+        """Write everything that is pending and stop the writer thread."""
+        with self._thread_lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None or not thread.is_alive():
+            self._drain()
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.error("Timed out stopping keystroke writer")
+            return
+        thread.join(timeout)
+
+    def _drain(self):
+        """Write whatever is queued from the calling thread (writer thread not running)."""
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, tuple):
+                batch.append(item)
+            elif isinstance(item, threading.Event):
+                item.set()
+        self._write_batch(batch)
+
+    def _run(self):
+        logger.info("Keystroke writer thread started")
+        running = True
+        while running:
+            item = self._queue.get()
+            batch = []
+            waiters = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    running = False
+                    break
+                if isinstance(item, threading.Event):
+                    # Explicit flush request: write now
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            self._write_batch(batch)
+            for waiter in waiters:
+                waiter.set()
+        logger.info("Keystroke writer thread stopped")
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+
+        # Keep arrival order; a batch only spans several files around midnight
+        rows_by_file = {}
+        for csv_file, row in batch:
+            rows_by_file.setdefault(csv_file, []).append(row)
+
+        for csv_file, rows in rows_by_file.items():
+            try:
+                file_exists = os.path.isfile(csv_file)
+                with open(csv_file, mode='a', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    if not file_exists:
+                        writer.writerow(CSV_HEADERS)
+                    if self.format_row is not None:
+                        writer.writerows(self.format_row(row) for row in rows)
+                    else:
+                        writer.writerows(rows)
+                    f.flush()
+                self.written_count += len(rows)
+            except Exception as e:
+                logger.error(f"Error writing {len(rows)} keystrokes to {csv_file}: {str(e)}")
+                continue
+
+            if self.on_flush is not None:
+                try:
+                    self.on_flush(csv_file, rows)
+                except Exception as e:
+                    logger.error(f"Error in keystroke writer flush callback: {str(e)}")
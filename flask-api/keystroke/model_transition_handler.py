@@ -252,100 +252,52 @@ def monitor_for_anomalies_only(free_text_collector, username):
     
     # Use a separate keystroke collector instance for anomaly detection only
     try:
-        # Import keystroke collector
+        # Import keystroke collector and the event bus it publishes to
         from keystroke import keystroke_collector
+        from keystroke import keystroke_events
+        
+        # Subscribe before collection starts so no keystroke is missed
+        subscription = keystroke_events.bus.subscribe("anomaly-detection")
         
         # Start a special collection mode for prediction only
         keystroke_collector.start_collection(username, "anomaly-detection")
         
         # Buffer for keystroke counting
         buffer_count = 0
-        last_known_count = keystroke_collector.get_collection_status().get("keystroke_count", 0)
         
-        # Monitor loop
-        while prediction_active and free_text_collector.prediction_active:
-            try:
-                # Get current keystroke count
-                collector_status = keystroke_collector.get_collection_status()
-                current_count = collector_status.get("keystroke_count", 0)
-                
-                # If there are new keystrokes
-                if current_count > last_known_count:
-                    new_keystrokes = current_count - last_known_count
-                    buffer_count += new_keystrokes
-                    
-                    # Get the latest keystrokes for anomaly detection
-                    csv_file = keystroke_collector.get_log_file_path()
+        try:
+            # Monitor loop
+            while prediction_active and free_text_collector.prediction_active:
+                try:
+                    # Wait for new keystrokes pushed by the collector
+                    events = subscription.get(timeout=1.0)
                     
-                    if os.path.exists(csv_file):
-                        try:
-                            # Read the latest keystrokes with more robust error handling
-                            import pandas as pd
-                            
-                            # Use error_bad_lines=False (renamed to on_bad_lines in newer pandas versions)
-                            try:
-                                # For newer pandas versions (1.3+)
-                                df = pd.read_csv(csv_file, on_bad_lines='skip')
-                            except TypeError:
-                                # For older pandas versions
-                                df = pd.read_csv(csv_file, error_bad_lines=False, warn_bad_lines=True)
-                            
-                            # Ensure only rows with the expected column count are used
-                            expected_columns = ["Timestamp_Press", "Timestamp_Release", "Key Stroke", "Application", "Hold Time"]
-                            if df.shape[1] != len(expected_columns):
-                                logger.warning(f"CSV has unexpected column count: {df.shape[1]} (expected {len(expected_columns)})")
-                                # Only select rows that have complete data for required columns
-                                df = df.iloc[:, :len(expected_columns)]
-                                df.columns = expected_columns
-                            
-                            # Validate data
-                            if df.empty:
-                                logger.warning("No valid keystroke data after filtering")
-                                last_known_count = current_count
-                                continue
-                            
-                            # Get only the new ones, being careful about length
-                            valid_rows = min(len(df), new_keystrokes)
-                            if valid_rows > 0:
-                                latest_keystrokes = df.iloc[-valid_rows:]
-                                
-                                # Append to the prediction buffer
-                                buffer_path = free_text_collector.PREDICTION_BUFFER_PATH
-                                
-                                # Make sure the buffer path directory exists
-                                os.makedirs(os.path.dirname(buffer_path), exist_ok=True)
-                                
-                                if os.path.exists(buffer_path):
-                                    # Append to existing buffer, making sure to include proper header
-                                    with open(buffer_path, 'a', newline='') as f:
-                                        latest_keystrokes.to_csv(f, header=False, index=False)
-                                else:
-                                    # Create new buffer file with proper header
-                                    latest_keystrokes.to_csv(buffer_path, index=False)
+                    # If there are new keystrokes
+                    if events:
+                        buffer_count += len(events)
                         
-                        except Exception as e:
-                            logger.error(f"Error processing keystroke CSV file: {str(e)}")
-                            # Continue with the loop even if there was an error
-                    
-                    # Check if we should make an anomaly detection
-                    if buffer_count >= free_text_collector.keystroke_threshold:
                         try:
-                            # Process for anomaly detection
-                            free_text_collector.process_for_anomaly_detection()
+                            # Append to the prediction buffer
+                            free_text_collector._append_to_prediction_buffer(events)
                         except Exception as e:
-                            logger.error(f"Error in anomaly detection processing: {str(e)}")
+                            logger.error(f"Error buffering keystroke events: {str(e)}")
+                            # Continue with the loop even if there was an error
                         
-                        # Reset buffer count regardless of success/failure
-                        buffer_count = 0
-                    
-                    # Update last known count
-                    last_known_count = current_count
-                
-                # Sleep for a bit
-                time.sleep(1)
-            except Exception as e:
-                logger.error(f"Error in anomaly detection monitoring: {str(e)}")
-                time.sleep(5)
+                        # Check if we should make an anomaly detection
+                        if buffer_count >= free_text_collector.keystroke_threshold:
+                            try:
+                                # Process for anomaly detection
+                                free_text_collector.process_for_anomaly_detection()
+                            except Exception as e:
+                                logger.error(f"Error in anomaly detection processing: {str(e)}")
+                            
+                            # Reset buffer count regardless of success/failure
+                            buffer_count = 0
+                except Exception as e:
+                    logger.error(f"Error in anomaly detection monitoring: {str(e)}")
+                    time.sleep(5)
+        finally:
+            subscription.close()
     except Exception as e:
         logger.error(f"Error setting up anomaly detection monitoring: {str(e)}")
     
@@ -13,7 +13,11 @@ import pickle
 import uuid
 
 from keystroke import keystroke_collector
+from keystroke import keystroke_events
+from keystroke.prediction_buffer import PredictionBuffer
 from preprocessing import keystroke_processor
+from preprocessing import feature_spec
+from preprocessing.hold_time_filter import get_hold_time_filter
 
 logger = logging.getLogger(__name__)
 
@@ -30,21 +34,28 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 STORAGE_DIR = os.path.join(BASE_DIR, "storage")
 ALERTS_DIR = os.path.join(STORAGE_DIR, "alerts")
 COLLECTION_STATUS_PATH = os.path.join(STORAGE_DIR, "multi_binary_collection_status.json")
-PREDICTION_BUFFER_PATH = os.path.join(STORAGE_DIR, "multi_binary_prediction_buffer.csv")
+# Mirror of the in-memory prediction buffer, only read back after a crash
+PREDICTION_BUFFER_PATH = os.path.join(STORAGE_DIR, "multi_binary_prediction_buffer.kseg")
 MULTI_BINARY_MODEL_PATH = os.path.join(STORAGE_DIR, "models", "multi_binary_classifier.pkl")
 
 # Ensure directories exist
 os.makedirs(ALERTS_DIR, exist_ok=True)
 
+# Pending keystrokes for the next prediction window
+prediction_buffer = PredictionBuffer(capacity=1024, mirror_path=PREDICTION_BUFFER_PATH)
+
 # Global variable to hold the loaded model
 multi_binary_model = None
+# Column layout the classifier was trained on
+multi_binary_spec = feature_spec.current_spec()
 
 def load_multi_binary_model():
     """Load the multi-binary classifier model."""
-    global multi_binary_model
+    global multi_binary_model, multi_binary_spec
     try:
         with open(MULTI_BINARY_MODEL_PATH, 'rb') as f:
             multi_binary_model = pickle.load(f)
+        multi_binary_spec = feature_spec.load_spec(MULTI_BINARY_MODEL_PATH)
         logger.info("Successfully loaded multi-binary classifier model")
         return True
     except Exception as e:
@@ -88,23 +99,22 @@ def save_status():
 
 def _get_buffer_size():
     """Get the current size of the prediction buffer."""
-    if os.path.exists(PREDICTION_BUFFER_PATH):
-        try:
-            with open(PREDICTION_BUFFER_PATH, 'r') as f:
-                return sum(1 for _ in f) - 1  # Subtract 1 for header
-        except Exception as e:
-            logger.error(f"Error reading prediction buffer: {str(e)}")
-    return 0
+    return len(prediction_buffer)
+
+def _hold_time_filter():
+    """Hold-time outlier filter of the user being monitored."""
+    return get_hold_time_filter(keystroke_collector.get_collection_status().get("username", "unknown"))
+
+def _append_to_prediction_buffer(events):
+    """Append keystroke events to the prediction buffer."""
+    prediction_buffer.append(events)
+    # Each keystroke counts once towards the hold-time cutoff, however
+    # often its window is preprocessed
+    _hold_time_filter().update_events(events)
 
 def _reset_prediction_buffer():
-    """Reset the prediction buffer file."""
-    try:
-        # Create a new empty file with headers
-        with open(PREDICTION_BUFFER_PATH, 'w', newline='') as f:
-            writer = pd.DataFrame(columns=["Timestamp_Press", "Timestamp_Release", "Key Stroke", "Application", "Hold Time"])
-            writer.to_csv(f, index=False)
-    except Exception as e:
-        logger.error(f"Error resetting prediction buffer: {str(e)}")
+    """Reset the prediction buffer."""
+    prediction_buffer.clear()
 
 def start_multi_binary_collection(username):
     """Start collecting keystrokes for multi-binary anomaly detection."""
@@ -245,57 +255,33 @@ def process_for_anomaly_detection():
     global last_prediction_time
     
     try:
-        # Check if prediction buffer exists
-        if not os.path.exists(PREDICTION_BUFFER_PATH):
-            logger.warning("Prediction buffer does not exist")
-            return
+        if len(prediction_buffer) < keystroke_threshold:
+            return  # Not enough keystrokes for prediction
         
-        # Read the prediction buffer
+        # Take the pending window from the in-memory buffer
         try:
-            df = pd.read_csv(PREDICTION_BUFFER_PATH)
-            if len(df) < keystroke_threshold:
-                return  # Not enough keystrokes for prediction
+            df = prediction_buffer.to_frame()
         except Exception as e:
             logger.error(f"Error reading prediction buffer: {str(e)}")
             return
         
-        # Preprocess data for prediction
+        # Preprocess data for prediction, with the hold-time cutoff of the
+        # user whose session is monitored
         try:
-            processed_data = keystroke_processor.preprocess_keystroke_data(df)
+            hold_filter = _hold_time_filter()
+            processed_data = keystroke_processor.preprocess_keystroke_matrix(df, multi_binary_spec, hold_filter)
+            hold_filter.save()
         except Exception as e:
             logger.error(f"Error preprocessing data: {str(e)}")
             return
         
         # Make prediction with multi-binary model
         try:
-            # Use the prediction method
-            predicted_classes, probabilities = multi_binary_model.predict(processed_data)
-            
-            # Get the prediction for the first sample (usually there's only one)
-            predicted_class = predicted_classes[0] if predicted_classes else "Unknown"
+            # Probabilities of all users at once, decided on the matrix
+            decision = multi_binary_model.decide(processed_data)
             
-            # Determine if this is an anomaly
-            is_anomaly = (predicted_class == "Unknown")
-            
-            # Get confidence for each class
-            confidence_values = {}
-            max_confidence = 0
-            
-            for class_name, probs in probabilities.items():
-                confidence = float(probs[0]) if len(probs) > 0 else 0
-                confidence_values[class_name] = confidence
-                
-                if confidence > max_confidence:
-                    max_confidence = confidence
-            
-            # Create result structure
-            result = {
-                'success': True,
-                'predicted_user': predicted_class,
-                'is_anomaly': is_anomaly,
-                'confidence': max_confidence if not is_anomaly else 0,
-                'all_confidences': confidence_values
-            }
+            # Result of the first sample (usually there's only one)
+            result = decision.sample_result(multi_binary_model.names)
             
         except Exception as e:
             logger.error(f"Error making prediction: {str(e)}")
@@ -324,62 +310,44 @@ def monitor_collection():
     
     logger.info("Started multi-binary collection monitoring thread")
     
-    # Keep track of last known keystroke count
-    last_known_count = 0
+    # New keystrokes are pushed by the collector; rows already in today's
+    # file are counted as before
+    subscription = keystroke_events.bus.subscribe("multi-binary")
+    keystroke_count += keystroke_collector.get_collection_status().get("keystroke_count", 0)
     buffer_count = 0
+    last_status_save = 0.0
     
-    while collection_active:
-        try:
-            # Get the current status from the keystroke collector
-            collector_status = keystroke_collector.get_collection_status()
-            current_count = collector_status.get("keystroke_count", 0)
+    try:
+        while collection_active:
+            try:
+                # Wait for new keystrokes, waking up regularly to check the flags
+                events = subscription.get(timeout=1.0)
             
-            # If there are new keystrokes
-            if current_count > last_known_count:
-                new_keystrokes = current_count - last_known_count
-                keystroke_count += new_keystrokes
-                logger.debug(f"Detected {new_keystrokes} new keystrokes, total: {keystroke_count}")
-                
-                # Get the latest keystrokes for anomaly detection
-                try:
-                    # Get the csv file path
-                    csv_file = keystroke_collector.get_log_file_path()
-                    
-                    if os.path.exists(csv_file):
-                        # Read the latest keystrokes
-                        df = pd.read_csv(csv_file)
-                        
-                        # Get only the new ones
-                        if len(df) >= new_keystrokes:
-                            latest_keystrokes = df.iloc[-new_keystrokes:]
-                            
-                            # Append to the prediction buffer
-                            if os.path.exists(PREDICTION_BUFFER_PATH):
-                                # Append to existing buffer
-                                with open(PREDICTION_BUFFER_PATH, 'a', newline='') as f:
-                                    latest_keystrokes.to_csv(f, header=False, index=False)
-                            else:
-                                # Create new buffer file
-                                latest_keystrokes.to_csv(PREDICTION_BUFFER_PATH, index=False)
-                            
-                            buffer_count += new_keystrokes
-                except Exception as e:
-                    logger.error(f"Error updating prediction buffer: {str(e)}")
+                # If there are new keystrokes
+                if events:
+                    new_keystrokes = len(events)
+                    keystroke_count += new_keystrokes
+                    logger.debug(f"Detected {new_keystrokes} new keystrokes, total: {keystroke_count}")
                 
-                # Check if we should make an anomaly detection
-                if buffer_count >= keystroke_threshold and prediction_active:
-                    # Process for anomaly detection
-                    process_for_anomaly_detection()
-                    buffer_count = 0
+                    # Append the new keystrokes to the prediction buffer
+                    try:
+                        _append_to_prediction_buffer(events)
+                        buffer_count += new_keystrokes
+                    except Exception as e:
+                        logger.error(f"Error updating prediction buffer: {str(e)}")
                 
-                # Update last known count
-                last_known_count = current_count
+                    # Check if we should make an anomaly detection
+                    if buffer_count >= keystroke_threshold and prediction_active:
+                        # Process for anomaly detection
+                        process_for_anomaly_detection()
+                        buffer_count = 0
             
-            # Save status
-            save_status()
-            
-            # Sleep for a bit
-            time.sleep(1)
-        except Exception as e:
-            logger.error(f"Error in monitor_collection: {str(e)}")
-            time.sleep(1)  # Sleep before retrying
\ No newline at end of file
+                # Save status (at most once a second)
+                if time.monotonic() - last_status_save >= 1.0:
+                    save_status()
+                    last_status_save = time.monotonic()
+            except Exception as e:
+                logger.error(f"Error in monitor_collection: {str(e)}")
+                time.sleep(1)  # Sleep before retrying
+    finally:
+        subscription.close()
\ No newline at end of file
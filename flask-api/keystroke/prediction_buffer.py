@@ -0,0 +1,133 @@
+"""
+In-memory prediction window for real-time anomaly detection.
+Keystrokes waiting to be scored are kept in a fixed-capacity ring of typed
+arrays and handed to preprocessing as a DataFrame, with no file round trip.
+The buffer can be mirrored to a segment file, which is only read back to
+recover the pending window after a crash.
+"""
+
+import os
+import threading
+import logging
+import numpy as np
+import pandas as pd
+
+from keystroke import keystroke_segment
+from keystroke.keystroke_clock import format_duration_ns
+from utils.symbol_table import key_symbols, app_symbols
+
+logger = logging.getLogger(__name__)
+
+# Same record layout as the collection segments
+BUFFER_DTYPE = keystroke_segment.SEGMENT_DTYPE
+
+
+class PredictionBuffer:
+    """Ring buffer of pending keystrokes.
+
+    When full, the oldest keystrokes are overwritten and counted in
+    `dropped_count`. With `mirror_path` every append is also written to a
+    segment file, which is cleared with the buffer.
+    """
+
+    def __init__(self, capacity=1024, mirror_path=None):
+        self.capacity = capacity
+        self.mirror_path = mirror_path
+        self.dropped_count = 0
+        self._records = np.zeros(capacity, dtype=BUFFER_DTYPE)
+        self._start = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self._recover()
+
+    def __len__(self):
+        return self._size
+
+    def _recover(self):
+        """Reload a window left in the mirror by a previous run."""
+        if not self.mirror_path or not os.path.exists(self.mirror_path):
+            return
+        try:
+            records = keystroke_segment.read_segment(self.mirror_path)
+            if len(records):
+                self._put(records)
+                logger.info(f"Recovered {self._size} pending keystrokes from {self.mirror_path}")
+        except Exception as e:
+            logger.error(f"Error recovering prediction buffer: {str(e)}")
+
+    def _put(self, records):
+        if len(records) > self.capacity:
+            self.dropped_count += len(records) - self.capacity
+            records = records[-self.capacity:]
+        n = len(records)
+        overflow = max(0, self._size + n - self.capacity)
+        if overflow:
+            self.dropped_count += overflow
+            self._start = (self._start + overflow) % self.capacity
+            self._size -= overflow
+        end = (self._start + self._size) % self.capacity
+        first = min(n, self.capacity - end)
+        self._records[end:end + first] = records[:first]
+        self._records[:n - first] = records[first:]
+        self._size += n
+
+    def append(self, events):
+        """Add keystroke events (press_ns, release_ns, key code, app code tuples)."""
+        if len(events) == 0:
+            return
+        records = to_records(events)
+        with self._lock:
+            self._put(records)
+        if self.mirror_path:
+            try:
+                keystroke_segment.append_records(
+                    self.mirror_path,
+                    records["press_ns"],
+                    records["release_ns"],
+                    records["key_id"],
+                    records["app_id"]
+                )
+            except Exception as e:
+                logger.error(f"Error mirroring prediction buffer: {str(e)}")
+
+    def snapshot(self):
+        """Copy of the pending keystrokes, oldest first."""
+        with self._lock:
+            index = (self._start + np.arange(self._size)) % self.capacity
+            return self._records[index]
+
+    def clear(self):
+        with self._lock:
+            self._start = 0
+            self._size = 0
+        if self.mirror_path:
+            try:
+                keystroke_segment.remove_segment(self.mirror_path)
+            except OSError as e:
+                logger.error(f"Error clearing prediction buffer mirror: {str(e)}")
+
+    def to_frame(self):
+        """Pending keystrokes in the collector's column layout, ready for preprocessing."""
+        return records_to_frame(self.snapshot())
+
+
+def to_records(events):
+    """Keystroke events (press_ns, release_ns, key code, app code tuples) as BUFFER_DTYPE records."""
+    return np.array([tuple(event) for event in events], dtype=BUFFER_DTYPE)
+
+
+def records_to_frame(records):
+    """Buffer records as a DataFrame in the collector's column layout."""
+    holds = records["release_ns"] - records["press_ns"]
+    df = pd.DataFrame({
+        "Timestamp_Press": records["press_ns"].astype("datetime64[ns]"),
+        "Timestamp_Release": records["release_ns"].astype("datetime64[ns]"),
+        "Key Stroke": key_symbols.decode(records["key_id"]),
+        "Application": app_symbols.decode(records["app_id"]),
+        # Kept as text, as in the collection files and alert payloads
+        "Hold Time": [format_duration_ns(hold) for hold in holds]
+    })
+    # Empty keys and window titles read back from CSV as missing values,
+    # which preprocessing drops
+    df[["Key Stroke", "Application"]] = df[["Key Stroke", "Application"]].replace("", np.nan)
+    return df
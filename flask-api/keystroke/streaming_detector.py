@@ -0,0 +1,63 @@
+"""
+Sliding-window streaming inference for real-time anomaly detection.
+Instead of waiting for a full window of keystrokes and preprocessing it from
+scratch, features are computed once for each 5-key group as it completes and
+kept; every `stride` keystrokes the most recent groups form a window that is
+scored, so consecutive windows overlap and share their group features.
+"""
+
+import math
+from collections import deque, namedtuple
+import numpy as np
+
+from keystroke.prediction_buffer import BUFFER_DTYPE, to_records, records_to_frame
+from preprocessing.feature_extractor import KeystrokeFeatureExtractor
+
+# Model input for a window (a matrix in the feature spec's layout) and the raw
+# keystrokes it covers (for alerts)
+StreamingWindow = namedtuple("StreamingWindow", ["features", "keystrokes"])
+
+
+class StreamingDetector:
+    """Builds overlapping scoring windows from a stream of keystroke events.
+
+    A window spans `window_size` keystrokes (rounded up to whole groups) and a
+    new one is emitted each time `stride` more keystrokes (at least one group)
+    have arrived. Hold-time outliers are dropped with the user's
+    `hold_filter`, if one is given.
+    """
+
+    def __init__(self, window_size=30, stride=5, group_size=5, hold_filter=None):
+        self.group_size = group_size
+        self.window_groups = max(1, math.ceil(window_size / group_size))
+        self.stride_groups = max(1, math.ceil(stride / group_size))
+        self.extractor = KeystrokeFeatureExtractor(group_size, hold_filter)
+        self.reset()
+
+    def reset(self):
+        """Forget buffered keystrokes and cached group features."""
+        self.extractor.reset()
+        self._rows = deque(maxlen=self.window_groups)
+        self._keystrokes = np.empty(0, dtype=BUFFER_DTYPE)
+        self._groups_since_window = 0
+
+    def feed(self, events):
+        """Add keystroke events; returns the windows that became due (possibly none)."""
+        if not len(events):
+            return []
+        records = to_records(events)
+        # Raw keystrokes of about the last window, for the alert payload
+        self._keystrokes = np.concatenate([self._keystrokes, records])[-self.window_groups * self.group_size:]
+
+        windows = []
+        for row in self.extractor.feed(records):
+            self._rows.append(row)
+            self._groups_since_window += 1
+            if (len(self._rows) == self.window_groups
+                    and self._groups_since_window >= self.stride_groups):
+                windows.append(self._window())
+                self._groups_since_window = 0
+        return windows
+
+    def _window(self):
+        return StreamingWindow(np.stack(self._rows), records_to_frame(self._keystrokes))
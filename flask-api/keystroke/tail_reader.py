@@ -0,0 +1,143 @@
+"""
+Incremental reader for keystroke collection CSVs.
+Remembers how far into the file it has read and, on each call, parses only
+the complete lines appended since then. Daily rotation (the path changes) and
+truncation or replacement of the file are detected and handled.
+"""
+
+import csv
+import os
+import logging
+import numpy as np
+
+from utils.symbol_table import key_symbols, app_symbols
+
+logger = logging.getLogger(__name__)
+
+# Rows returned by TailReader.read_new(); hold_ns is release_ns - press_ns
+TAIL_DTYPE = np.dtype([
+    ("press_ns", "<i8"),
+    ("release_ns", "<i8"),
+    ("key_code", "<i4"),
+    ("app_code", "<i4"),
+    ("hold_ns", "<i8")
+])
+
+_HEADER_PREFIX = b"Timestamp_Press"
+
+
+def _parse_timestamps(values):
+    return np.asarray(values, dtype="datetime64[ns]").astype(np.int64)
+
+
+class TailReader:
+    """Follows a keystroke CSV, returning newly appended rows as typed arrays.
+
+    `path` is a file path or a callable returning the current path (e.g.
+    `keystroke_collector.get_log_file_path`), in which case the reader moves
+    to the new file when the day rolls over, after finishing the old one.
+    `offset` is the byte position to start from on the first file.
+    """
+
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.offset = offset
+        self.malformed_count = 0
+        self._current = None
+        self._file_id = None
+        self._pending = b""
+
+    @property
+    def committed_offset(self):
+        """Byte offset just past the last complete line returned."""
+        return self.offset - len(self._pending)
+
+    def current_path(self):
+        return self.path() if callable(self.path) else self.path
+
+    def read_new(self):
+        """Rows appended since the previous call, as an array of TAIL_DTYPE."""
+        path = self.current_path()
+        lines = []
+        if self._current is None:
+            self._current = path
+        elif path != self._current:
+            # Rotation: finish the old file, then start the new one from the top
+            lines.extend(self._read_lines(self._current))
+            self._current = path
+            self._reset()
+        lines.extend(self._read_lines(path))
+        return self._parse(lines)
+
+    def _reset(self):
+        self.offset = 0
+        self._pending = b""
+        self._file_id = None
+
+    def _read_lines(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return []
+        file_id = (stat.st_dev, stat.st_ino)
+        if self._file_id is not None and file_id != self._file_id:
+            # Same name, different file: it was replaced
+            self._reset()
+        elif stat.st_size < self.offset:
+            # Truncated underneath us
+            self._reset()
+        self._file_id = file_id
+
+        if stat.st_size == self.offset:
+            return []
+        with open(path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        self.offset += len(data)
+
+        data = self._pending + data
+        end = data.rfind(b"\n")
+        if end < 0:
+            self._pending = data
+            return []
+        self._pending = data[end + 1:]
+        return [line for line in data[:end + 1].splitlines()
+                if line.strip() and not line.startswith(_HEADER_PREFIX)]
+
+    def _parse(self, lines):
+        if not lines:
+            return np.empty(0, dtype=TAIL_DTYPE)
+
+        press, release, keys, apps = [], [], [], []
+        for fields in csv.reader(line.decode("utf-8", errors="replace") for line in lines):
+            if len(fields) < 4:
+                self.malformed_count += 1
+                continue
+            press.append(fields[0])
+            release.append(fields[1])
+            keys.append(fields[2])
+            apps.append(fields[3])
+
+        try:
+            press_ns = _parse_timestamps(press)
+            release_ns = _parse_timestamps(release)
+            valid = np.ones(len(press), dtype=bool)
+        except ValueError:
+            # Isolate the rows with unparseable timestamps
+            press_ns = np.zeros(len(press), dtype=np.int64)
+            release_ns = np.zeros(len(press), dtype=np.int64)
+            valid = np.zeros(len(press), dtype=bool)
+            for i in range(len(press)):
+                try:
+                    press_ns[i], release_ns[i] = _parse_timestamps([press[i], release[i]])
+                    valid[i] = True
+                except ValueError:
+                    self.malformed_count += 1
+
+        records = np.empty(len(press), dtype=TAIL_DTYPE)
+        records["press_ns"] = press_ns
+        records["release_ns"] = release_ns
+        records["key_code"] = key_symbols.intern_many(keys)
+        records["app_code"] = app_symbols.intern_many(apps)
+        records["hold_ns"] = release_ns - press_ns
+        return records[valid]
@@ -0,0 +1,191 @@
+"""
+Active-window context for the keystroke collector.
+Looking up the foreground window is expensive on some platforms (macOS forks
+`osascript`), so the collector reads it through a provider that caches the
+result instead of querying the OS inside every keyboard callback.
+"""
+
+import platform
+import re
+import subprocess
+import threading
+import time
+import ctypes
+import logging
+
+logger = logging.getLogger(__name__)
+
+_MACOS_WINDOW_SCRIPT = """
+tell application "System Events"
+    set frontApp to name of first application process whose frontmost is true
+end tell
+if frontApp is "Safari" then
+    tell application "Safari"
+        return URL of current tab of window 1
+    end tell
+else if frontApp is "Google Chrome" then
+    tell application "Google Chrome"
+        return URL of active tab of front window
+    end tell
+else
+    return "No supported browser is active"
+end if
+"""
+
+
+def query_active_window_title():
+    """Ask the OS for the title of the currently active window (uncached)."""
+    if platform.system() == "Windows":
+        try:
+            user32 = ctypes.windll.user32
+            hwnd = user32.GetForegroundWindow()
+            length = user32.GetWindowTextLengthW(hwnd)
+            buff = ctypes.create_unicode_buffer(length + 1)
+            user32.GetWindowTextW(hwnd, buff, length + 1)
+            return buff.value
+        except Exception as e:
+            return f"Error: {e}"
+    elif platform.system() == "Darwin":
+        try:
+            # Check if the frontmost app is Safari or Chrome
+            result = subprocess.run(["osascript", "-e", _MACOS_WINDOW_SCRIPT], capture_output=True, text=True)
+            return result.stdout.strip()
+        except Exception as e:
+            return f"Error: {e}"
+    return "Unknown"
+
+
+class WindowContextProvider:
+    """Interface for active-window lookups used by the collector."""
+
+    def current_title(self):
+        """Title of the foreground window."""
+        raise NotImplementedError("Subclasses must implement current_title()")
+
+    def invalidate(self):
+        """Drop any cached value, e.g. when a focus-change notification arrives."""
+
+    def close(self):
+        """Release background resources, if any."""
+
+
+class CachedWindowContextProvider(WindowContextProvider):
+    """Caches the foreground window title for `ttl` seconds.
+
+    With `background=True` a daemon thread refreshes the cache every `ttl`
+    seconds, so callers never wait on the OS query; otherwise the cache is
+    refreshed lazily by the first caller after it expires. The thread runs
+    until close() and is started again by the next lookup.
+    """
+
+    def __init__(self, ttl=0.5, background=False, query=query_active_window_title):
+        self.ttl = ttl
+        self.background = background
+        self._query = query
+        self._title = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread = None
+
+    def current_title(self):
+        if self.background:
+            self._ensure_refresher()
+            if self._title is not None:
+                return self._title
+        elif self._title is not None and time.monotonic() - self._fetched_at < self.ttl:
+            return self._title
+        return self._refresh()
+
+    def invalidate(self):
+        if self.background:
+            # Refresh right away; the cached title is served until then
+            self._wake_event.set()
+            return
+        with self._lock:
+            self._fetched_at = 0.0
+            self._title = None
+
+    def close(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def _refresh(self):
+        title = self._query()
+        with self._lock:
+            self._title = title
+            self._fetched_at = time.monotonic()
+        return title
+
+    def _ensure_refresher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop_event.clear()
+                self._thread = threading.Thread(target=self._refresh_loop, name="window-context")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _refresh_loop(self):
+        while not self._stop_event.is_set():
+            self._wake_event.clear()
+            try:
+                self._refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing active window: {str(e)}")
+            self._wake_event.wait(self.ttl)
+
+
+class FakeWindowContextProvider(WindowContextProvider):
+    """Provider with a settable title, for running the collector without a desktop."""
+
+    def __init__(self, title="Unknown"):
+        self.title = title
+        self.query_count = 0
+
+    def set_title(self, title):
+        self.title = title
+
+    def current_title(self):
+        self.query_count += 1
+        return self.title
+
+
+class SensitiveFieldMatcher:
+    """Case-insensitive keyword matcher for window titles.
+
+    Keywords are compiled into a single regular expression once, and the
+    result is remembered per title, since the same few titles repeat for
+    thousands of keystrokes.
+    """
+
+    def __init__(self, keywords, cache_size=256):
+        self.keywords = [k.lower() for k in keywords if k]
+        self._pattern = None
+        if self.keywords:
+            self._pattern = re.compile("|".join(re.escape(k) for k in self.keywords), re.IGNORECASE)
+        self._cache_size = cache_size
+        self._cache = {}
+
+    def matches(self, title):
+        if self._pattern is None or not title:
+            return False
+        result = self._cache.get(title)
+        if result is None:
+            result = self._pattern.search(title) is not None
+            if len(self._cache) >= self._cache_size:
+                self._cache.clear()
+            self._cache[title] = result
+        return result
+
+
+def default_provider():
+    """Provider suited to the current platform."""
+    if platform.system() == "Darwin":
+        # osascript takes tens of milliseconds: keep it off the callback thread
+        return CachedWindowContextProvider(ttl=1.0, background=True)
+    if platform.system() == "Windows":
+        return CachedWindowContextProvider(ttl=0.2)
+    return CachedWindowContextProvider(ttl=5.0)
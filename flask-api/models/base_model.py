@@ -9,6 +9,8 @@ import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
 
+from preprocessing import feature_spec
+
 logger = logging.getLogger(__name__)
 
 class BaseModel:
@@ -25,6 +27,8 @@ class BaseModel:
     
             
         self.model = None
+        # Column order and dtype of the model input, saved next to the model
+        self.feature_spec = feature_spec.current_spec()
         # Ensure the model directory exists
         os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
         self._load_model()
@@ -34,6 +38,7 @@ class BaseModel:
         try:
             if os.path.exists(self.model_path):
                 self.model = joblib.load(self.model_path)
+                self.feature_spec = feature_spec.load_spec(self.model_path)
                 logger.info(f"Loaded {self.model_type} model for user {self.username} from {self.model_path}")
             else:
                 logger.info(f"No saved {self.model_type} model found for user {self.username}")
@@ -47,6 +52,7 @@ class BaseModel:
             # Ensure the directory exists before saving
             os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
             joblib.dump(self.model, self.model_path)
+            self.feature_spec.save(feature_spec.spec_path(self.model_path))
             logger.info(f"Saved {self.model_type} model for user {self.username} to {self.model_path}")
             return True
         except Exception as e:
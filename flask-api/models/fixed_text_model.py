@@ -1,5 +1,7 @@
 # models/fixed_text_model.py
 from models.base_model import BaseModel
+from preprocessing import feature_spec
+from preprocessing.training_set import load_training_set
 import logging
 import os
 import pandas as pd
@@ -16,33 +18,34 @@ class FixedTextModel(BaseModel):
     
     def __init__(self, username=None):
         super().__init__('fixed-text', username)
-        self.data_path = 'flask-api/storage/data/fixed_text_data_preprocessed.csv'
+        self.data_path = 'flask-api/storage/data/fixed_text_data_preprocessed.npz'
     
     def train(self, parameters=None):
         """Train the model with the given parameters"""
         try:
-            # Check if training data exists
-            if not os.path.exists(self.data_path):
-                logger.error("No training data found for fixed-text model")
+            # Load the training set (float32 features and User labels)
+            try:
+                training_set = load_training_set(self.data_path, 'User')
+            except ValueError as e:
+                logger.error(str(e))
                 return {
                     'success': False,
-                    'error': 'No training data found'
+                    'error': 'Label column not found in training data'
                 }
             
-            # Load the data
-            df = pd.read_csv(self.data_path)
-            
-            # Check if label column exists
-            if 'User' not in df.columns:
-                logger.error("Label column not found in training data")
+            # Check if training data exists
+            if training_set is None or not len(training_set):
+                logger.error("No training data found for fixed-text model")
                 return {
                     'success': False,
-                    'error': 'Label column not found in training data'
+                    'error': 'No training data found'
                 }
             
             # Prepare features and target
-            X = df.drop(columns=['User'])
-            y = df['User']
+            # Train on the current feature layout; it is saved with the model
+            self.feature_spec = feature_spec.current_spec()
+            X = training_set.feature_frame(self.feature_spec)
+            y = pd.Series(training_set.labels)
 
             # Encoding y
             first_user = y.iloc[0]  # Get the first user
@@ -119,8 +122,8 @@ class FixedTextModel(BaseModel):
                     'error': 'Model is not trained yet'
                 }
             
-            # Preprocess the input data to match training data format
-            # Assume data is already preprocessed to match the expected format
+            # Lay the preprocessed features out exactly as in training
+            data = self.feature_spec.to_matrix(data)
             
             # Make prediction
             prediction = self.model.predict(data)
@@ -1,6 +1,8 @@
 # models/free_text_model.py
 import json
 from models.base_model import BaseModel
+from preprocessing import feature_spec
+from preprocessing.training_set import load_training_set
 import logging
 import os
 import pandas as pd
@@ -18,7 +20,7 @@ class FreeTextModel(BaseModel):
     def __init__(self, username):
         """Initialize the free-text model."""
         super().__init__('free-text', username)
-        self.data_path = 'flask-api/storage/data/free_text_data.csv'
+        self.data_path = 'flask-api/storage/data/free_text_data.npz'
         self.collection_path = 'flask-api/storage/data/keystroke_collection.json'
         self.model = None
         self.is_trained = False
@@ -117,28 +119,29 @@ class FreeTextModel(BaseModel):
                     'target': collection_status['target']
                 }
             
-            # Check if training data exists
-            if not os.path.exists(self.data_path):
-                logger.error("No training data found for free-text model")
+            # Load the training set (float32 features and binary labels)
+            try:
+                training_set = load_training_set(self.data_path, 'label')
+            except ValueError as e:
+                logger.error(str(e))
                 return {
                     'success': False,
-                    'error': 'No training data found'
+                    'error': 'Label column not found in training data'
                 }
             
-            # Load the data
-            df = pd.read_csv(self.data_path)
-            
-            # Check if label column exists
-            if 'label' not in df.columns:
-                logger.error("Label column not found in training data")
+            # Check if training data exists
+            if training_set is None or not len(training_set):
+                logger.error("No training data found for free-text model")
                 return {
                     'success': False,
-                    'error': 'Label column not found in training data'
+                    'error': 'No training data found'
                 }
             
             # Prepare features and target
-            X = df.drop(columns=['label'])
-            y = df['label']
+            # Train on the current feature layout; it is saved with the model
+            self.feature_spec = feature_spec.current_spec()
+            X = training_set.feature_frame(self.feature_spec)
+            y = pd.Series(training_set.labels)
             
             # Split data
             X_train, X_test, y_train, y_test = train_test_split(
@@ -217,8 +220,8 @@ class FreeTextModel(BaseModel):
                     'error': 'Model is not trained yet'
                 }
             
-            # Preprocess the input data to match training data format
-            # Assume data is already preprocessed to match the expected format
+            # Lay the preprocessed features out exactly as in training
+            data = self.feature_spec.to_matrix(data)
             
             # Make prediction
             prediction = self.model.predict(data)
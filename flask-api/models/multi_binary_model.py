@@ -5,8 +5,12 @@ This version integrates the MultiBinaryClassifier from the notebook with the Fla
 """
 
 import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import os
 import json
+import time
+import threading
 import logging
 import numpy as np
 import pandas as pd
@@ -18,9 +22,85 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
 
 from models.base_model import BaseModel
+from preprocessing import feature_spec
+from utils.shared_executor import SharedExecutor
 
 logger = logging.getLogger(__name__)
 
+# Threads evaluating the per-user models of an ensemble (0 or 1 to evaluate
+# them one after another)
+prediction_workers = 0
+_prediction_pool = SharedExecutor(lambda workers: ThreadPoolExecutor(
+    max_workers=workers,
+    thread_name_prefix="multi-binary-predict"
+))
+
+# Latency of each user's model (ms) by model name: last call, running mean, calls
+_model_latency = {}
+_latency_lock = threading.Lock()
+
+
+def set_prediction_workers(workers):
+    """
+    Evaluate the user models of the multi-binary ensemble in parallel on
+    `workers` threads (0 or 1 to turn it off).
+
+    CatBoost releases the GIL while predicting, so the models run
+    concurrently; each call is then limited to its share of the CPU cores
+    so the model threads and CatBoost's own threads don't oversubscribe.
+    Predictions already running keep the pool they started with.
+
+    Returns:
+        tuple: (success, message)
+    """
+    global prediction_workers
+    workers = max(0, int(workers))
+    _prediction_pool.resize(workers)
+    prediction_workers = workers
+    logger.info(f"Multi-binary prediction workers set to {workers}")
+    return True, f"Multi-binary prediction workers set to {workers}"
+
+
+def _record_latency(name, ms):
+    with _latency_lock:
+        stats = _model_latency.setdefault(name, {'last_ms': 0.0, 'mean_ms': 0.0, 'calls': 0})
+        stats['calls'] += 1
+        stats['last_ms'] = ms
+        stats['mean_ms'] += (ms - stats['mean_ms']) / stats['calls']
+
+
+def get_model_latencies():
+    """
+    Prediction latency of each user's model.
+
+    Returns:
+        dict: {model name: {'last_ms', 'mean_ms', 'calls'}}
+    """
+    with _latency_lock:
+        return {name: dict(stats) for name, stats in _model_latency.items()}
+
+
+def _predict_positive(model, X, thread_count=None):
+    """
+    Positive class probability of one binary model, with CatBoost limited
+    to `thread_count` threads (its default of all cores if None).
+    """
+    if thread_count is not None and isinstance(model, CatBoostClassifier):
+        probs = np.asarray(model.predict_proba(X, thread_count=thread_count))
+    else:
+        probs = np.asarray(model.predict_proba(X))
+    if probs.ndim == 1:
+        return probs
+    if probs.shape[1] == 2:
+        # Second column contains positive class probabilities
+        return probs[:, 1]
+    if probs.shape[1] == 1:
+        # Model trained on a single class
+        logger.warning("predict_proba returned a single column, using it as the positive class probability")
+        return probs[:, 0]
+    raise ValueError(f"Expected binary class probabilities, got {probs.shape[1]} columns")
+
+
 class MultiBinaryClassifier:
     def __init__(self, models, names=None):
         """
@@ -36,6 +116,91 @@ class MultiBinaryClassifier:
         else:
             self.names = names
 
+    def positive_probabilities(self, X):
+        """
+        Probability of the positive class from every model, stacked.
+
+        Models are evaluated on the shared prediction thread pool when
+        prediction workers are set, one after another otherwise; the
+        latency of each is recorded (see get_model_latencies).
+
+        Args:
+            X: Input features
+
+        Returns:
+            np.ndarray: (n_samples, n_models) matrix, columns in `names` order
+        """
+        n_samples = len(X)
+        matrix = np.empty((n_samples, len(self.models)), dtype=float)
+
+        with _prediction_pool.use() as pool:
+            if pool is None or len(self.models) < 2:
+                for i in range(len(self.models)):
+                    matrix[:, i] = self._model_column(i, X, None)
+                return matrix
+
+            # Each model gets its share of the cores
+            thread_count = max(1, (os.cpu_count() or 1) // min(max(prediction_workers, 1), len(self.models)))
+            futures = [pool.submit(self._model_column, i, X, thread_count) for i in range(len(self.models))]
+            for i, future in enumerate(futures):
+                matrix[:, i] = future.result()
+        return matrix
+
+    def _model_column(self, i, X, thread_count):
+        """Positive class probabilities of model `i`, timed"""
+        model = self.models[i]
+        start = time.perf_counter()
+        try:
+            # CatBoost models support predict_proba
+            column = _predict_positive(model, X, thread_count)
+        except Exception as e:
+            # Fallback to raw predictions if predict_proba fails
+            logger.warning(f"Warning: predict_proba failed for model {self.names[i]}, using predict: {e}")
+            column = np.asarray(model.predict(X), dtype=float).reshape(len(X))
+        _record_latency(self.names[i], (time.perf_counter() - start) * 1000)
+        return column
+
+    def decide(self, X, min_confidence=0.5, min_margin=0.0):
+        """
+        Predictions for a batch of samples, computed on the probability matrix.
+
+        A sample gets the class of its most confident model, or "Unknown"
+        when that confidence is below `min_confidence` or leads the runner-up
+        by less than `min_margin`.
+
+        Args:
+            X: Input features
+            min_confidence: Threshold for minimum confidence to accept a prediction
+            min_margin: Minimum lead of the best class over the second best
+
+        Returns:
+            MultiBinaryDecision: Labels, best class index, its confidence,
+            top-2 margin and the probability matrix, per sample
+        """
+        probabilities = self.positive_probabilities(X)
+        n_samples, n_classes = probabilities.shape
+
+        if n_classes == 0:
+            return MultiBinaryDecision(
+                np.full(n_samples, "Unknown", dtype=object),
+                np.full(n_samples, -1),
+                np.zeros(n_samples),
+                np.zeros(n_samples),
+                probabilities
+            )
+
+        best = probabilities.argmax(axis=1)
+        confidence = probabilities[np.arange(n_samples), best]
+        if n_classes > 1:
+            runner_up = np.partition(probabilities, n_classes - 2, axis=1)[:, n_classes - 2]
+            margin = confidence - runner_up
+        else:
+            margin = confidence.copy()
+
+        labels = np.asarray(self.names, dtype=object)[best]
+        labels[~((confidence >= min_confidence) & (margin >= min_margin))] = "Unknown"
+        return MultiBinaryDecision(labels, best, confidence, margin, probabilities)
+
     def predict(self, X, min_confidence=0.5):
         """
         Predict class for input data using ensemble of binary classifiers.
@@ -49,47 +214,44 @@ class MultiBinaryClassifier:
             predicted_classes: List of predicted class names (including "Unknown")
             probabilities: Dict of probabilities for each class
         """
-        # Get probabilities from each model
-        probabilities = {}
-
-        for i, model in enumerate(self.models):
-            # CatBoost models support predict_proba
-            try:
-                # Get probability of positive class (class 1)
-                probs = model.predict_proba(X)
-                pos_probs = probs[:, 1]  # Second column contains positive class probabilities
-            except IndexError:
-                # Handle case where predict_proba returns only one column
-                pos_probs = model.predict_proba(X)
-            except Exception as e:
-                # Fallback to raw predictions if predict_proba fails
-                logger.warning(f"Warning: predict_proba failed for model {self.names[i]}, using predict: {e}")
-                preds = model.predict(X)
-                pos_probs = np.array(preds, dtype=float)
+        decision = self.decide(X, min_confidence)
+        return decision.labels.tolist(), decision.class_probabilities(self.names)
 
-            probabilities[self.names[i]] = pos_probs
 
-        # Make predictions based on highest probability
-        predicted_classes = []
+class MultiBinaryDecision(namedtuple("MultiBinaryDecision", ["labels", "best_index", "confidence", "margin", "probabilities"])):
+    """Batch result of MultiBinaryClassifier.decide (arrays with one entry per sample)."""
 
-        # For each sample
-        for i in range(len(next(iter(probabilities.values())))):
-            max_prob = -1
-            predicted_class = "Unknown"  # Default to Unknown
+    __slots__ = ()
 
-            # Find class with highest probability
-            for class_name, probs in probabilities.items():
-                if probs[i] > max_prob:
-                    max_prob = probs[i]
-                    predicted_class = class_name
+    def class_probabilities(self, names):
+        """Probabilities by class name (columns of the matrix, not copied)"""
+        return {name: self.probabilities[:, i] for i, name in enumerate(names)}
 
-            # Check if the confidence meets the minimum threshold
-            if max_prob < min_confidence:
-                predicted_class = "Unknown"
-
-            predicted_classes.append(predicted_class)
-
-        return predicted_classes, probabilities
+    def sample_result(self, names, index=0):
+        """
+        Prediction result of one sample, as the collectors and the API
+        report it.
+        """
+        if len(self.labels) == 0:
+            return {
+                'success': True,
+                'predicted_user': "Unknown",
+                'is_anomaly': True,
+                'confidence': 0,
+                'margin': 0,
+                'all_confidences': {name: 0 for name in names}
+            }
+        predicted_class = self.labels[index]
+        is_anomaly = (predicted_class == "Unknown")
+        confidence = max(float(self.confidence[index]), 0)
+        return {
+            'success': True,
+            'predicted_user': predicted_class,
+            'is_anomaly': is_anomaly,
+            'confidence': confidence if not is_anomaly else 0,
+            'margin': float(self.margin[index]),
+            'all_confidences': {name: float(p) for name, p in zip(names, self.probabilities[index])}
+        }
 
 
 class MultiBinaryModel(BaseModel):
@@ -119,6 +281,7 @@ class MultiBinaryModel(BaseModel):
         
         # Load or initialize the MultiBinaryClassifier
         self.classifier = self._load_classifier()
+        self.feature_spec = feature_spec.load_spec(self.classifier_path)
     
     def _init_users(self):
         """Initialize users file"""
@@ -196,6 +359,7 @@ class MultiBinaryModel(BaseModel):
                 classifier = MultiBinaryClassifier(models=models, names=names)
                 with open(self.classifier_path, 'wb') as f:
                     pickle.dump(classifier, f)
+                feature_spec.current_spec().save(feature_spec.spec_path(self.classifier_path))
                 
                 logger.info(f"Created new MultiBinaryClassifier with {len(models)} models")
                 return classifier
@@ -464,6 +628,8 @@ class MultiBinaryModel(BaseModel):
             self.classifier = MultiBinaryClassifier(models=models, names=names)
             with open(self.classifier_path, 'wb') as f:
                 pickle.dump(self.classifier, f)
+            self.feature_spec = feature_spec.current_spec()
+            self.feature_spec.save(feature_spec.spec_path(self.classifier_path))
             
             # Update model info
             info = self.get_info()
@@ -509,34 +675,14 @@ class MultiBinaryModel(BaseModel):
                     'error': 'Model is not trained yet'
                 }
             
-            # Get prediction
-            predicted_classes, probabilities = self.classifier.predict(data, min_confidence=min_confidence)
-            
-            # Get the prediction for the first sample (usually there's only one)
-            predicted_class = predicted_classes[0] if predicted_classes else "Unknown"
-            
-            # Determine if this is an anomaly
-            is_anomaly = (predicted_class == "Unknown")
+            # Lay the preprocessed features out exactly as in training
+            data = self.feature_spec.to_matrix(data)
             
-            # Get confidence for each class
-            confidence_values = {}
-            max_confidence = 0
-            
-            for class_name, probs in probabilities.items():
-                confidence = float(probs[0]) if len(probs) > 0 else 0
-                confidence_values[class_name] = confidence
-                
-                if confidence > max_confidence:
-                    max_confidence = confidence
+            # Get prediction
+            decision = self.classifier.decide(data, min_confidence=min_confidence)
             
-            # Create response
-            return {
-                'success': True,
-                'predicted_user': predicted_class,
-                'is_anomaly': is_anomaly,
-                'confidence': max_confidence if not is_anomaly else 0,
-                'all_confidences': confidence_values
-            }
+            # Report the first sample (usually there's only one)
+            return decision.sample_result(self.classifier.names)
         except Exception as e:
             logger.error(f"Error predicting with multi-binary model: {str(e)}")
             return {
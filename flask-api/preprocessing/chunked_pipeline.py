@@ -0,0 +1,308 @@
+# preprocessing/chunked_pipeline.py
+
+import os
+import multiprocessing
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from utils.symbol_table import key_symbols
+from utils.shared_executor import SharedExecutor
+from preprocessing import keystroke_processor, feature_engine
+from preprocessing.keystroke_csv import iter_keystroke_csv, read_keystroke_csv
+from preprocessing.feature_cache import CachedFeatures, feature_cache
+
+logger = logging.getLogger(__name__)
+
+GROUP_SIZE = keystroke_processor.GROUP_SIZE
+
+# Process pool for preprocessing users in parallel; created on first use and
+# kept for later calls. 0 workers preprocesses users one after another.
+# Workers are spawned, not forked: a fork taken while another thread of the
+# server holds a lock (logging, the symbol tables) can deadlock the worker.
+preprocessing_workers = 0
+_pool = SharedExecutor(lambda workers: ProcessPoolExecutor(
+    max_workers=workers,
+    mp_context=multiprocessing.get_context("spawn")
+))
+
+
+def _iter_source_chunks(source, chunksize):
+    """Raw keystroke rows of one user, `chunksize` rows at a time (all at once if None)."""
+    if isinstance(source, str) and os.path.exists(source):
+        if chunksize is None:
+            yield read_keystroke_csv(source)
+        else:
+            yield from iter_keystroke_csv(source, chunksize)
+        return
+    if isinstance(source, dict):
+        source = pd.DataFrame.from_dict(source)
+    elif isinstance(source, list):
+        source = pd.DataFrame(source)
+    if chunksize is None:
+        yield source.copy()
+        return
+    for start in range(0, len(source), chunksize):
+        yield source.iloc[start:start + chunksize].copy()
+
+
+def _iter_user_keystrokes(source, chunksize):
+    """
+    Cleaned and standardized keystrokes of one user, as
+    (press_ns, release_ns, hold_ns, key_codes) arrays.
+
+    Matches process_keystroke_data row for row as long as the source is in
+    release order across chunk boundaries (the collectors append rows as keys
+    are released). Combining shortcuts shortens the key sequence while the
+    timings keep their rows, so keys and timings are queued separately and
+    paired by position; the timings left over at the end are dropped, as in
+    the batch path.
+    """
+    pending_key = []
+    key_queue = []
+    press_queue = np.empty(0, dtype=np.int64)
+    release_queue = np.empty(0, dtype=np.int64)
+    hold_queue = np.empty(0, dtype=np.int64)
+    last_release = None
+    out_of_order = 0
+
+    def pair(keys, press, release, hold):
+        n = min(len(keys), len(press))
+        labels = pd.Series(keys[:n], dtype=object).replace(keystroke_processor.SINGLE_KEY_SHORTCUTS)
+        codes = keystroke_processor.encode_symbols(labels, key_symbols)
+        return (press[:n], release[:n], hold[:n], codes), keys[n:], press[n:], release[n:], hold[n:]
+
+    for chunk in _iter_source_chunks(source, chunksize):
+        df = keystroke_processor.clean_keystroke_rows(chunk)
+        if df.empty:
+            continue
+        if last_release is not None and df['Timestamp_Release'].iloc[0] < last_release:
+            out_of_order += 1
+        last_release = df['Timestamp_Release'].iloc[-1]
+
+        df['Key Stroke'] = df['Key Stroke'].astype(str).str.strip("'")
+        df = keystroke_processor.standardize_keystrokes(df)
+        keys = pd.Series(pending_key + list(df['Key Stroke'].replace(keystroke_processor.CTRL_KEY_MAPPING)), dtype=object)
+        labels, keep = keystroke_processor.match_shortcuts(keys)
+        # An unmatched last key may still pair with the next chunk's first
+        if keep[-1]:
+            pending_key = [labels[-1]]
+            labels, keep = labels[:-1], keep[:-1]
+        else:
+            pending_key = []
+        key_queue.extend(label for label, kept in zip(labels, keep) if kept)
+
+        press_queue = np.concatenate([press_queue, df['Timestamp_Press'].astype('datetime64[ns]').astype('int64').to_numpy()])
+        release_queue = np.concatenate([release_queue, df['Timestamp_Release'].astype('datetime64[ns]').astype('int64').to_numpy()])
+        if 'Hold Time' in df.columns:
+            hold = pd.to_timedelta(df['Hold Time'], errors='coerce').fillna(pd.Timedelta(0))
+            hold = hold.astype('timedelta64[ns]').astype('int64').to_numpy()
+        else:
+            hold = np.zeros(len(df), dtype=np.int64)
+        hold_queue = np.concatenate([hold_queue, hold])
+
+        rows, key_queue, press_queue, release_queue, hold_queue = pair(key_queue, press_queue, release_queue, hold_queue)
+        yield rows
+
+    if out_of_order:
+        logger.warning(f"{out_of_order} chunks started before the previous one ended; rows are only sorted within a chunk")
+
+    key_queue.extend(pending_key)
+    rows = pair(key_queue, press_queue, release_queue, hold_queue)[0]
+    yield rows
+
+
+def user_keystrokes(source):
+    """
+    All cleaned and standardized keystrokes of one user, as
+    (press_ns, release_ns, hold_ns, key_codes) arrays.
+    """
+    rows = list(_iter_user_keystrokes(source, None))
+    return tuple(np.concatenate(arrays) for arrays in zip(*rows))
+
+
+def _iter_user_groups(source, chunksize, group_size=GROUP_SIZE):
+    """
+    Keystrokes of one user in blocks of whole groups, as
+    ((press_ns, release_ns, hold_ns, key_codes), group_lengths); only the
+    user's last group may be short.
+    """
+    carry = None
+    for rows in _iter_user_keystrokes(source, chunksize):
+        if carry is not None:
+            rows = tuple(np.concatenate([c, r]) for c, r in zip(carry, rows))
+        n_full = len(rows[0]) // group_size * group_size
+        carry = tuple(r[n_full:] for r in rows)
+        if n_full:
+            yield tuple(r[:n_full] for r in rows), np.full(n_full // group_size, group_size)
+    if carry is not None and len(carry[0]):
+        yield carry, np.array([len(carry[0])])
+
+
+def _features(rows, group_lengths, prev, user_name=None, group_size=GROUP_SIZE):
+    """Encoded feature rows of a block of groups following the keystroke in `prev`."""
+    press, release, hold, codes = rows
+    block = feature_engine.group_features(
+        press, release, group_lengths,
+        hold=hold / 1e9,
+        keys=codes,
+        prev_press=prev["press"],
+        prev_release=prev["release"],
+        width=group_size
+    )
+    prev["press"], prev["release"] = int(press[-1]), int(release[-1])
+    if user_name is not None:
+        block.insert(0, "User", user_name)
+    return keystroke_processor.encode_features(block, user_name)
+
+
+def _build_cached_features(source, chunksize, group_size=GROUP_SIZE):
+    """Features of a reference file on its own, for the feature cache."""
+    prev = {"press": None, "release": None}
+    blocks = []
+    first_group = None
+    for rows, group_lengths in _iter_user_groups(source, chunksize, group_size):
+        if first_group is None:
+            press, release, hold, codes = (r[:group_lengths[0]] for r in rows)
+            first_group = (press, release, hold, key_symbols.decode(codes).astype(str).tolist())
+        blocks.append(_features(rows, group_lengths, prev, group_size=group_size))
+    if not blocks:
+        empty = np.empty(0, dtype=np.int64)
+        return CachedFeatures([], np.empty((0, 0)), (empty, empty, empty, []), group_size=group_size)
+    features = pd.concat(blocks, ignore_index=True)
+    return CachedFeatures(
+        features.columns,
+        features.to_numpy(dtype=float),
+        first_group,
+        prev["press"],
+        prev["release"],
+        group_size
+    )
+
+
+def iter_preprocessed_chunks(keystroke_data, user_name, additional_users=None, chunksize=10000, use_cache=True,
+                             group_size=GROUP_SIZE):
+    """
+    Labelled training features, produced chunk by chunk.
+
+    Same rows and values as preprocess_keystroke_data(keystroke_data,
+    user_name, additional_users), but each user's data is read `chunksize`
+    rows at a time (None reads it whole) and finished feature rows are
+    yielded as soon as their group is complete, so memory stays flat
+    however many users are added. Groups and the previous-keystroke chaining
+    carry across chunk boundaries and from one user to the next.
+
+    Additional users given as files are static reference datasets; with
+    `use_cache` their features come from the feature cache and are only
+    computed the first time a file's content is seen.
+
+    Args:
+        keystroke_data (dict, DataFrame, or str): Raw keystroke data or filepath
+        user_name (str): User's name for labeling
+        additional_users (dict): Dictionary with {username: data} for additional users
+        chunksize (int): Rows read per chunk
+        use_cache (bool): Use the feature cache for additional user files
+        group_size (int): Keystrokes per group
+
+    Yields:
+        pd.DataFrame: Feature rows ready for ML, with a User column
+    """
+    users = [(user_name, keystroke_data)] + list((additional_users or {}).items())
+    prev = {"press": None, "release": None}
+
+    for index, (name, source) in enumerate(users):
+        if use_cache and index and isinstance(source, str) and os.path.exists(source):
+            cached = feature_cache.get_or_build(
+                source, lambda: _build_cached_features(source, chunksize, group_size), group_size
+            )
+            if len(cached):
+                yield cached.block(name, prev["press"], prev["release"])
+                prev["press"], prev["release"] = cached.last_press, cached.last_release
+            continue
+        for rows, group_lengths in _iter_user_groups(source, chunksize, group_size):
+            yield _features(rows, group_lengths, prev, name, group_size)
+
+
+def set_preprocessing_workers(workers):
+    """
+    Preprocess the users of a labelled training set in parallel with
+    `workers` processes (0 or 1 to turn it off).
+
+    Workers are spawned and kept for later calls, so each pays for a fresh
+    interpreter (and an import of the main module) once. Preprocessing
+    already running keeps the pool it started with.
+
+    Returns:
+        tuple: (success, message)
+    """
+    global preprocessing_workers
+    workers = max(0, int(workers))
+    _pool.resize(workers)
+    preprocessing_workers = workers
+    logger.info(f"Preprocessing workers set to {workers}")
+    return True, f"Preprocessing workers set to {workers}"
+
+
+def preprocess_users_parallel(keystroke_data, user_name, additional_users=None, use_cache=True, group_size=GROUP_SIZE):
+    """
+    Labelled training features with each user preprocessed in its own worker.
+
+    Every user's data is processed whole and on its own; the blocks are then
+    merged in the order the users were given, the first row of each
+    recomputed to chain from the user before it, so the result is the same
+    as preprocess_keystroke_data's. Runs in-process when no pool is
+    configured.
+
+    Returns:
+        list: Feature DataFrames (with a User column), one per user with data
+    """
+    with _pool.use() as pool:
+        users = [(user_name, keystroke_data)] + list((additional_users or {}).items())
+
+        jobs = []
+        for index, (name, source) in enumerate(users):
+            cacheable = use_cache and index and isinstance(source, str) and os.path.exists(source)
+            entry = feature_cache.load(source, group_size) if cacheable else None
+            if entry is None:
+                if pool is not None:
+                    entry = pool.submit(_build_cached_features, source, None, group_size)
+                else:
+                    entry = _build_cached_features(source, None, group_size)
+            else:
+                cacheable = False
+            jobs.append((name, source, entry, cacheable))
+
+        blocks = []
+        prev_press = prev_release = None
+        for name, source, entry, cacheable in jobs:
+            if isinstance(entry, Future):
+                entry = entry.result()
+            if cacheable:
+                feature_cache.store(source, entry)
+            if len(entry):
+                blocks.append(entry.block(name, prev_press, prev_release))
+                prev_press, prev_release = entry.last_press, entry.last_release
+    return blocks
+
+
+def preprocess_keystroke_stream(input_filepath, output_filepath, user_name, additional_users=None, chunksize=10000,
+                                group_size=GROUP_SIZE):
+    """
+    Preprocess labelled keystroke data chunk by chunk, appending feature rows
+    to a CSV as they are produced.
+
+    Returns:
+        int: Number of feature rows written
+    """
+    try:
+        os.makedirs(os.path.dirname(output_filepath) or '.', exist_ok=True)
+        rows_written = 0
+        for chunk in iter_preprocessed_chunks(input_filepath, user_name, additional_users, chunksize,
+                                              group_size=group_size):
+            chunk.to_csv(output_filepath, mode='a' if rows_written else 'w', header=not rows_written, index=False)
+            rows_written += len(chunk)
+        return rows_written
+    except Exception as e:
+        logger.error(f"Error in chunked preprocessing: {str(e)}")
+        raise
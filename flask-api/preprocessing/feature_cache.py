@@ -0,0 +1,149 @@
+# preprocessing/feature_cache.py
+
+import os
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+
+from utils.symbol_table import key_symbols
+from preprocessing import keystroke_processor, feature_engine
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(BASE_DIR, "storage", "cache", "features")
+
+# Part of every cache key: bump it whenever preprocessing output changes so
+# entries computed by older code are no longer used
+PREPROCESSING_VERSION = 3
+
+
+def file_digest(path):
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CachedFeatures:
+    """
+    Encoded feature rows of one reference file, computed as if it had no
+    predecessor.
+
+    The first group's PPD/RRD chain from whatever keystroke precedes the file
+    in a training set, so that group's keystrokes are kept and its row is
+    recomputed when the block is placed after other data.
+    """
+
+    def __init__(self, columns, values, first_group, last_press=None, last_release=None,
+                 group_size=keystroke_processor.GROUP_SIZE):
+        self.columns = list(columns)
+        self.group_size = group_size
+        self.values = values
+        # (press_ns, release_ns, hold_ns, key labels) of the first group
+        self.first_group = first_group
+        self.last_press = last_press
+        self.last_release = last_release
+
+    def __len__(self):
+        return len(self.values)
+
+    def block(self, user_name, prev_press=None, prev_release=None):
+        """Feature rows labelled with `user_name`, following the given keystroke."""
+        df = pd.DataFrame(self.values, columns=self.columns)
+        if len(df) and prev_press is not None:
+            press, release, hold, keys = self.first_group
+            first = feature_engine.group_features(
+                press, release, np.array([len(press)]),
+                hold=hold / 1e9,
+                keys=key_symbols.intern_many(list(keys)),
+                prev_press=prev_press,
+                prev_release=prev_release,
+                width=self.group_size
+            )
+            first = keystroke_processor.encode_features(first)
+            df.loc[0, self.columns] = first.loc[0, self.columns].to_numpy(dtype=float)
+        df.insert(0, "User", user_name)
+        return df
+
+    def save(self, path):
+        press, release, hold, keys = self.first_group
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                columns=np.array(self.columns, dtype=str),
+                values=self.values,
+                first_press=press,
+                first_release=release,
+                first_hold=hold,
+                first_keys=np.array(keys, dtype=str),
+                last=np.array([self.last_press, self.last_release] if self.last_press is not None else [], dtype=np.int64),
+                group_size=np.array(self.group_size)
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            last = data['last']
+            return cls(
+                data['columns'].tolist(),
+                data['values'],
+                (data['first_press'], data['first_release'], data['first_hold'], data['first_keys'].tolist()),
+                int(last[0]) if len(last) else None,
+                int(last[1]) if len(last) else None,
+                int(data['group_size'])
+            )
+
+
+class FeatureCache:
+    """
+    Feature rows of static reference files (the impostor datasets), keyed by
+    file content hash, group size and PREPROCESSING_VERSION and stored as
+    .npz files.
+    """
+
+    def __init__(self, directory=CACHE_DIR, version=PREPROCESSING_VERSION):
+        self.directory = directory
+        self.version = version
+
+    def entry_path(self, digest, group_size=keystroke_processor.GROUP_SIZE):
+        return os.path.join(self.directory, f"{digest}-g{group_size}-v{self.version}.npz")
+
+    def load(self, path, group_size=keystroke_processor.GROUP_SIZE):
+        """Cached features of the file at `path`, or None on a miss."""
+        try:
+            entry_path = self.entry_path(file_digest(path), group_size)
+            if os.path.exists(entry_path):
+                return CachedFeatures.load(entry_path)
+        except Exception as e:
+            logger.error(f"Error loading cached features of {path}: {str(e)}")
+        return None
+
+    def store(self, path, entry):
+        try:
+            entry_path = self.entry_path(file_digest(path), entry.group_size)
+            entry.save(entry_path)
+            logger.info(f"Cached features of {path} in {entry_path}")
+        except Exception as e:
+            logger.error(f"Error caching features of {path}: {str(e)}")
+
+    def get_or_build(self, path, build, group_size=keystroke_processor.GROUP_SIZE):
+        """
+        Cached features of the file at `path`; on a miss they are computed
+        with `build()` (returning CachedFeatures) and stored.
+        """
+        entry = self.load(path, group_size)
+        if entry is None:
+            entry = build()
+            self.store(path, entry)
+        return entry
+
+
+# Shared cache for the reference datasets in storage/data
+feature_cache = FeatureCache()
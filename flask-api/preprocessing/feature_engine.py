@@ -0,0 +1,237 @@
+# preprocessing/feature_engine.py
+
+import itertools
+import numpy as np
+import pandas as pd
+
+from utils.symbol_table import key_symbols
+
+
+def _flatten(column):
+    """Concatenate a column of per-group lists into one flat list."""
+    return list(itertools.chain.from_iterable(column))
+
+
+def _timestamps_ns(values):
+    """Flat timestamps (int ns or Timestamp-like) as an int64 ns array."""
+    if values and isinstance(values[0], (int, np.integer)):
+        return np.asarray(values, dtype=np.int64)
+    return pd.to_datetime(pd.Series(values)).astype("datetime64[ns]").astype("int64").to_numpy()
+
+
+def _hold_seconds(values):
+    """Flat hold times in seconds: int ns, timedelta text or seconds as-is."""
+    if values and all(isinstance(v, (int, np.integer)) for v in values):
+        return np.asarray(values, dtype=np.int64) / 1e9
+    seconds = np.empty(len(values), dtype=float)
+    for i, ht in enumerate(values):
+        if isinstance(ht, str):
+            try:
+                seconds[i] = pd.Timedelta(ht).total_seconds()
+            except:
+                seconds[i] = 0
+        elif isinstance(ht, (int, np.integer)):
+            seconds[i] = ht / 1e9
+        else:
+            seconds[i] = ht
+    return seconds
+
+
+def _key_codes(values):
+    """Flat keys as codes in key_symbols (strings are interned)."""
+    if values and isinstance(values[0], (int, np.integer)):
+        return np.asarray(values, dtype=np.int32)
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    return key_symbols.intern_many([str(value) for value in uniques])[codes]
+
+
+def keystroke_differences(press, release, prev_press=None, prev_release=None):
+    """
+    Press/release differences of every keystroke to the one before it, in ns.
+
+    These don't depend on how keystrokes are grouped (the first keystroke of
+    a group chains onto the last of the previous one), so several groupings
+    of the same keystrokes can share them; only RPD/PRD are zeroed at group
+    starts, by group_feature_columns.
+
+    Returns:
+        tuple: (ppd, rrd, rpd, prd) int64 arrays
+    """
+    total = len(press)
+    ppd = np.zeros(total, dtype=np.int64)
+    rrd = np.zeros(total, dtype=np.int64)
+    rpd = np.zeros(total, dtype=np.int64)
+    prd = np.zeros(total, dtype=np.int64)
+    if total:
+        ppd[1:] = press[1:] - press[:-1]
+        rrd[1:] = release[1:] - release[:-1]
+        rpd[1:] = press[1:] - release[:-1]
+        prd[1:] = release[1:] - press[:-1]
+        ppd[0] = press[0] - prev_press if prev_press is not None else 0
+        rrd[0] = release[0] - prev_release if prev_release is not None else 0
+    return ppd, rrd, rpd, prd
+
+
+def group_feature_columns(press, release, group_lengths, hold=None, keys=None, prev_press=None, prev_release=None, width=None,
+                          differences=None, key_codes=None):
+    """
+    Compute per-group keystroke features from flat arrays, as a dict of
+    column name -> array (in model column order).
+
+    Keystrokes are laid out group after group; `group_lengths` gives the size
+    of each group. Values are scattered into padded (n_groups, max_len)
+    matrices so every feature is a handful of array operations.
+
+    Args:
+        press, release (np.ndarray): int64 ns timestamps
+        group_lengths (np.ndarray): Number of keystrokes in each group
+        hold (np.ndarray, optional): Hold times in seconds
+        keys (np.ndarray, optional): Key codes in key_symbols; key types and
+            sections come out as their numeric codes
+        prev_press, prev_release (int, optional): Last press/release (ns)
+            before the first group, if it has a predecessor
+        width (int, optional): Minimum number of per-position columns, so
+            blocks of groups computed separately line up
+        differences (tuple, optional): keystroke_differences of these
+            keystrokes, if already computed
+        key_codes (tuple, optional): (key type codes, key section codes) of
+            `keys`, if already looked up
+
+    Returns:
+        dict: Feature columns, as compute_and_expand_features_with_prev names them
+    """
+    group_lengths = np.asarray(group_lengths, dtype=np.int64)
+    n_groups = len(group_lengths)
+    width = max(int(group_lengths.max()) if n_groups else 0, width or 0)
+    total = int(group_lengths.sum())
+
+    starts = np.cumsum(group_lengths) - group_lengths
+    group_ids = np.repeat(np.arange(n_groups), group_lengths)
+    positions = np.arange(total) - np.repeat(starts, group_lengths)
+    first = positions == 0
+
+    # Differences to the previous keystroke; groups chain onto the previous group
+    if differences is None:
+        differences = keystroke_differences(press, release, prev_press, prev_release)
+    ppd, rrd, rpd, prd = differences
+
+    def matrix(values, fill=np.nan, dtype=float):
+        out = np.full((n_groups, width), fill, dtype=dtype)
+        out[group_ids, positions] = values
+        return out
+
+    ppd_m = matrix(ppd / 1e9)
+    rrd_m = matrix(rrd / 1e9)
+    rpd_m = matrix(rpd / 1e9)
+    prd_m = matrix(prd / 1e9)
+    rpd_m[:, 0] = 0
+    prd_m[:, 0] = 0
+
+    columns = {}
+    for name, values in (("PPD", ppd_m), ("RRD", rrd_m), ("RPD", rpd_m), ("PRD", prd_m)):
+        for i in range(width):
+            columns[f"{name}_{i}"] = np.abs(values[:, i])
+
+    if hold is not None:
+        hold_m = matrix(hold)
+        for i in range(width):
+            columns[f"Hold_Time_{i}"] = hold_m[:, i]
+
+        columns["PPD_Sum"] = np.nansum(ppd_m, axis=1)
+        columns["RRD_Sum"] = np.nansum(rrd_m, axis=1)
+        columns["RPD_Sum"] = np.nansum(rpd_m, axis=1)
+        columns["PRD_Sum"] = np.nansum(prd_m, axis=1)
+
+        columns["Typing_Speed_Avg"] = np.nanmean(ppd_m, axis=1)
+        columns["Typing_Speed_Max"] = np.nanmax(ppd_m, axis=1)
+        columns["Typing_Speed_Min"] = np.nanmin(ppd_m, axis=1)
+
+        columns["HT_Sum"] = np.nansum(hold_m, axis=1)
+        columns["Hold_Time_Avg"] = np.nanmean(hold_m, axis=1)
+        columns["Hold_Time_Std"] = np.nanstd(hold_m, axis=1)
+
+    if keys is not None or key_codes is not None:
+        if key_codes is None:
+            key_codes = (key_symbols.lookup("key_type_code", keys), key_symbols.lookup("key_section_code", keys))
+        key_types = matrix(key_codes[0])
+        key_sections = matrix(key_codes[1])
+        for i in range(width):
+            columns[f"Key_Type_{i + 1}"] = key_types[:, i]
+        for i in range(width):
+            columns[f"Key_Section_{i + 1}"] = key_sections[:, i]
+
+    return columns
+
+
+def group_lengths_for(user_lengths, group_size):
+    """
+    Group lengths when each user's keystrokes are split into groups of
+    `group_size` (the last group of a user may be short).
+    """
+    lengths = []
+    for n in user_lengths:
+        full, rest = divmod(int(n), group_size)
+        lengths.append(np.full(full, group_size, dtype=np.int64))
+        if rest:
+            lengths.append(np.array([rest], dtype=np.int64))
+    return np.concatenate(lengths) if lengths else np.empty(0, dtype=np.int64)
+
+
+def multi_resolution_feature_columns(press, release, group_sizes, user_lengths=None, hold=None, keys=None,
+                                     prev_press=None, prev_release=None):
+    """
+    Features of the same keystrokes grouped several ways, in one pass.
+
+    The keystroke differences and key type/section lookups are computed
+    once and shared; each group size only scatters them into its own group
+    matrices.
+
+    Args:
+        press, release (np.ndarray): int64 ns timestamps
+        group_sizes (iterable): Keystrokes per group for each resolution
+        user_lengths (list, optional): Keystrokes of each user, in order;
+            groups don't span users. Defaults to a single user.
+        hold, keys, prev_press, prev_release: As for group_feature_columns
+
+    Returns:
+        dict: group size -> feature columns (as group_feature_columns)
+    """
+    if user_lengths is None:
+        user_lengths = [len(press)]
+    differences = keystroke_differences(press, release, prev_press, prev_release)
+    key_codes = None
+    if keys is not None:
+        key_codes = (key_symbols.lookup("key_type_code", keys), key_symbols.lookup("key_section_code", keys))
+
+    return {
+        group_size: group_feature_columns(
+            press, release, group_lengths_for(user_lengths, group_size),
+            hold=hold,
+            width=group_size,
+            differences=differences,
+            key_codes=key_codes
+        )
+        for group_size in group_sizes
+    }
+
+
+def group_features(press, release, group_lengths, **kwargs):
+    """Per-group keystroke features (see group_feature_columns) as a DataFrame."""
+    return pd.DataFrame(group_feature_columns(press, release, group_lengths, **kwargs))
+
+
+def expand_grouped(grouped_df):
+    """
+    Features for a grouped DataFrame (lists per group, as produced by
+    process_keystroke_data); each group follows the row before it.
+    """
+    if len(grouped_df) == 0:
+        return pd.DataFrame()
+
+    group_lengths = grouped_df["Timestamp_Press"].map(len).to_numpy()
+    press = _timestamps_ns(_flatten(grouped_df["Timestamp_Press"]))
+    release = _timestamps_ns(_flatten(grouped_df["Timestamp_Release"]))
+    hold = _hold_seconds(_flatten(grouped_df["Hold Time"])) if "Hold Time" in grouped_df.columns else None
+    keys = _key_codes(_flatten(grouped_df["Key Stroke"])) if "Key Stroke" in grouped_df.columns else None
+
+    return group_features(press, release, group_lengths, hold=hold, keys=keys)
@@ -0,0 +1,142 @@
+# preprocessing/feature_extractor.py
+
+import numpy as np
+
+from utils.symbol_table import key_symbols, app_symbols
+from preprocessing import keystroke_processor, feature_engine, feature_spec
+
+# Local wall-clock days, for dropping keystrokes that span midnight
+_DAY_NS = 86_400 * 1_000_000_000
+
+# Per-key cleanup, computed once per distinct key code: the label after the
+# per-key standardization, and the final label after shortcut combining
+key_symbols.register_attribute(
+    "standard_code", lambda key: key_symbols.intern(keystroke_processor.standardize_key(key)), dtype=np.int32
+)
+key_symbols.register_attribute(
+    "renamed_code", lambda key: key_symbols.intern(keystroke_processor.SINGLE_KEY_SHORTCUTS.get(key, key)), dtype=np.int32
+)
+
+# Empty keys and window titles are missing values in the collection files,
+# which batch cleanup drops
+key_symbols.register_attribute("is_empty", lambda key: key == "", dtype=bool)
+app_symbols.register_attribute("is_empty", lambda app: app == "", dtype=bool)
+
+
+class KeystrokeFeatureExtractor:
+    """
+    Incremental feature extraction for a live keystroke stream.
+
+    Keystroke events go in as they are released; each call returns the
+    feature rows of the groups that were completed by it, and nothing is
+    recomputed for earlier keystrokes. Everything that ties consecutive
+    calls together is kept between them: the previous keystroke (for
+    PPD/RRD of the next group), a key that may still start a shortcut, the
+    alignment of keys and timings after shortcuts were combined, and the
+    keystrokes of the group being filled.
+
+    Rows match unlabelled batch preprocessing, for keystrokes in release
+    order. Hold-time outliers are dropped with the user's `hold_filter`
+    (which is updated with every keystroke) once it has warmed up; there is
+    no window to take a percentile of, so without it none are dropped. Rows
+    are laid out as the current FeatureSpec.
+    """
+
+    def __init__(self, group_size=keystroke_processor.GROUP_SIZE, hold_filter=None):
+        self.group_size = group_size
+        self.hold_filter = hold_filter
+        self.spec = feature_spec.current_spec(group_size)
+        self.reset()
+
+    def reset(self):
+        """Start over, as if no keystrokes had been seen."""
+        self._pending_key = np.empty(0, dtype=np.int32)
+        self._keys = np.empty(0, dtype=np.int32)
+        self._press = np.empty(0, dtype=np.int64)
+        self._release = np.empty(0, dtype=np.int64)
+        self._hold = np.empty(0, dtype=np.int64)
+        self._prev_press = None
+        self._prev_release = None
+
+    def feed(self, events):
+        """
+        Add keystroke events ((press_ns, release_ns, key code, app code)
+        tuples or BUFFER_DTYPE records).
+
+        Returns:
+            np.ndarray: Feature rows of the newly completed groups, shape
+            (n, len(self.spec.columns)); usually zero or one row
+        """
+        if len(events) == 0:
+            return self._empty()
+        if isinstance(events, np.ndarray) and events.dtype.names:
+            press, release, keys, apps = events["press_ns"], events["release_ns"], events["key_id"], events["app_id"]
+        else:
+            press, release, keys, apps = (np.array(values) for values in list(zip(*events))[:4])
+        press = press.astype(np.int64)
+        release = release.astype(np.int64)
+
+        # Keystrokes spanning midnight or with an empty key or application
+        # are dropped, as in batch cleanup
+        valid = press // _DAY_NS == release // _DAY_NS
+        valid &= ~key_symbols.lookup("is_empty", keys)
+        valid &= ~app_symbols.lookup("is_empty", apps)
+        if not valid.all():
+            press, release, keys = press[valid], release[valid], keys[valid]
+            if len(press) == 0:
+                return self._empty()
+
+        # Hold-time outliers, against the user's cutoff
+        if self.hold_filter is not None:
+            hold_seconds = (release - press) // 1000 * 1000 / 1e9
+            self.hold_filter.update(hold_seconds)
+            keep = self.hold_filter.keep(hold_seconds)
+            if not keep.all():
+                press, release, keys = press[keep], release[keep], keys[keep]
+                if len(press) == 0:
+                    return self._empty()
+
+        # Keys: per-key standardization, then shortcuts, holding back a last
+        # key that may pair with the next call's first
+        keys = np.concatenate([self._pending_key, key_symbols.lookup("standard_code", keys)])
+        keys, keep = keystroke_processor.combine_shortcut_codes(keys)
+        if keep[-1]:
+            self._pending_key = keys[-1:]
+            keys, keep = keys[:-1], keep[:-1]
+        else:
+            self._pending_key = keys[:0]
+        self._keys = np.concatenate([self._keys, key_symbols.lookup("renamed_code", keys[keep])])
+
+        # Timings keep their rows; hold times are whole microseconds, as in
+        # the collection files
+        self._press = np.concatenate([self._press, press])
+        self._release = np.concatenate([self._release, release])
+        self._hold = np.concatenate([self._hold, (release - press) // 1000 * 1000])
+
+        return self._complete_groups()
+
+    def _complete_groups(self):
+        n = min(len(self._keys), len(self._press)) // self.group_size * self.group_size
+        if n == 0:
+            return self._empty()
+
+        press, release = self._press[:n], self._release[:n]
+        columns = feature_engine.group_feature_columns(
+            press, release,
+            np.full(n // self.group_size, self.group_size),
+            hold=self._hold[:n] / 1e9,
+            keys=self._keys[:n],
+            prev_press=self._prev_press,
+            prev_release=self._prev_release,
+            width=self.group_size
+        )
+        self._prev_press, self._prev_release = int(press[-1]), int(release[-1])
+        self._keys = self._keys[n:]
+        self._press, self._release, self._hold = self._press[n:], self._release[n:], self._hold[n:]
+
+        rows = np.column_stack([columns[name] for name in self.spec.columns]).astype(self.spec.dtype)
+        # Positions a short group doesn't have are 0, as in encode_features
+        return np.nan_to_num(rows, copy=False)
+
+    def _empty(self):
+        return np.empty((0, len(self.spec.columns)), dtype=self.spec.dtype)
@@ -0,0 +1,133 @@
+# preprocessing/feature_spec.py
+
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Version of the model input layout produced by preprocessing; bump it (and
+# register the new layout) whenever feature columns are added or reordered
+FEATURE_SPEC_VERSION = 1
+
+
+def keystroke_feature_columns(group_size=5):
+    """Model input columns for groups of `group_size` keystrokes, in preprocessing order."""
+    columns = []
+    for name in ("PPD", "RRD", "RPD", "PRD", "Hold_Time"):
+        columns += [f"{name}_{i}" for i in range(group_size)]
+    columns += [
+        "PPD_Sum", "RRD_Sum", "RPD_Sum", "PRD_Sum",
+        "Typing_Speed_Avg", "Typing_Speed_Max", "Typing_Speed_Min",
+        "HT_Sum", "Hold_Time_Avg", "Hold_Time_Std"
+    ]
+    columns += [f"Key_Type_{i + 1}" for i in range(group_size)]
+    columns += [f"Key_Section_{i + 1}" for i in range(group_size)]
+    return columns
+
+
+class FeatureSpec:
+    """
+    Fixed column order and dtype of a model's input.
+
+    Saved next to every trained model so prediction builds exactly the
+    matrix the model was trained on, whatever columns a window of
+    keystrokes happened to produce.
+    """
+
+    def __init__(self, version, columns, dtype="float32"):
+        self.version = version
+        self.columns = list(columns)
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def group_size(self):
+        """Keystrokes per group the layout was built for"""
+        return sum(column.startswith("Key_Type_") for column in self.columns)
+
+    def __eq__(self, other):
+        return (isinstance(other, FeatureSpec) and self.version == other.version
+                and self.columns == other.columns and self.dtype == other.dtype)
+
+    def to_frame(self, features):
+        """Features reordered to the spec (missing columns are 0, extra ones dropped)."""
+        missing = [column for column in self.columns if column not in features.columns]
+        if missing:
+            logger.warning(f"Feature columns missing from input, filled with 0: {missing}")
+        return features.reindex(columns=self.columns, fill_value=0).astype(self.dtype)
+
+    def to_matrix(self, features):
+        """
+        Contiguous matrix in the spec's column order and dtype, ready to be
+        handed to the model without a copy.
+
+        Args:
+            features (pd.DataFrame or np.ndarray): Encoded features; arrays
+                must already be in the spec's column order
+        """
+        if isinstance(features, pd.DataFrame):
+            features = self.to_frame(features).to_numpy()
+        elif features.ndim != 2 or features.shape[1] != len(self.columns):
+            raise ValueError(f"Expected {len(self.columns)} feature columns, got shape {features.shape}")
+        return np.ascontiguousarray(features, dtype=self.dtype)
+
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'dtype': self.dtype.name,
+            'columns': self.columns
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['version'], data['columns'], data.get('dtype', 'float32'))
+
+    def save(self, path):
+        """Write the spec as JSON"""
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(self.to_dict(), f)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving feature spec {path}: {str(e)}")
+            return False
+
+
+# Registered layouts by version
+FEATURE_SPECS = {
+    1: FeatureSpec(1, keystroke_feature_columns(5))
+}
+
+
+def current_spec(group_size=5):
+    """Layout produced by the current preprocessing for groups of `group_size` keystrokes"""
+    spec = FEATURE_SPECS[FEATURE_SPEC_VERSION]
+    if group_size == spec.group_size:
+        return spec
+    return FeatureSpec(FEATURE_SPEC_VERSION, keystroke_feature_columns(group_size), spec.dtype)
+
+
+def spec_path(model_path):
+    """Where the spec of a model is kept: `x_model.pkl` -> `x_features.json`"""
+    base = os.path.splitext(model_path)[0]
+    if base.endswith('_model'):
+        base = base[:-len('_model')]
+    return base + '_features.json'
+
+
+def load_spec(model_path):
+    """
+    Spec saved with the model at `model_path`. Models trained before specs
+    were saved used the version 1 layout.
+    """
+    path = spec_path(model_path)
+    try:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return FeatureSpec.from_dict(json.load(f))
+    except Exception as e:
+        logger.error(f"Error loading feature spec {path}: {str(e)}")
+    return FEATURE_SPECS[1]
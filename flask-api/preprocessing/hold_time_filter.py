@@ -0,0 +1,122 @@
+# preprocessing/hold_time_filter.py
+
+import os
+import re
+import json
+import threading
+import logging
+import numpy as np
+
+from utils.quantile_sketch import P2Quantile
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROFILES_DIR = os.path.join(BASE_DIR, "storage", "profiles")
+
+# Hold times at or above this quantile of the user's hold times are outliers
+HOLD_TIME_QUANTILE = 0.99
+
+# Observations before the user's cutoff is trusted; until then batch
+# preprocessing falls back to the quantile of each window
+MIN_SAMPLES = 300
+
+
+class HoldTimeFilter:
+    """
+    Hold-time outlier cutoff of one user, learned from the keystrokes as
+    they arrive.
+
+    The cutoff is a P² estimate of the user's 99th hold-time percentile, so
+    it stays the same from one prediction window to the next and checking a
+    keystroke against it is a single comparison. It is persisted with the
+    user's profile.
+    """
+
+    def __init__(self, path=None, quantile=HOLD_TIME_QUANTILE, min_samples=MIN_SAMPLES):
+        self.path = path
+        self.min_samples = min_samples
+        self.sketch = P2Quantile(quantile)
+        self._lock = threading.Lock()
+        self._saved_count = 0
+        self._load()
+
+    def _load(self):
+        """Load the sketch from disk if available"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self.sketch = P2Quantile.from_dict(json.load(f)['sketch'])
+            self._saved_count = self.sketch.count
+        except Exception as e:
+            logger.error(f"Error loading hold-time filter {self.path}: {str(e)}")
+
+    def save(self):
+        """Persist the sketch if it was updated since the last save"""
+        if not self.path or self.sketch.count == self._saved_count:
+            return True
+        try:
+            with self._lock:
+                data = {'sketch': self.sketch.to_dict(), 'min_samples': self.min_samples}
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self._saved_count = data['sketch']['count']
+            return True
+        except Exception as e:
+            logger.error(f"Error saving hold-time filter {self.path}: {str(e)}")
+            return False
+
+    @property
+    def threshold(self):
+        """Cutoff in seconds, or None while there are too few observations"""
+        if self.sketch.count < self.min_samples:
+            return None
+        return self.sketch.value()
+
+    def update(self, hold_seconds):
+        """Add hold times (seconds) of new keystrokes"""
+        with self._lock:
+            self.sketch.update_many(np.asarray(hold_seconds, dtype=float).tolist())
+
+    def update_events(self, events):
+        """Add the hold times of keystroke events (press_ns, release_ns, key code, app code tuples)"""
+        if len(events) == 0:
+            return
+        times = np.array([(event[0], event[1]) for event in events], dtype=np.int64)
+        holds = times[:, 1] - times[:, 0]
+        # Microsecond precision, as written to the collection files
+        self.update(holds[holds >= 0] // 1000 * 1000 / 1e9)
+
+    def keep(self, hold_seconds):
+        """
+        Mask of the hold times (seconds) below the cutoff; all True while the
+        filter is warming up.
+        """
+        hold_seconds = np.asarray(hold_seconds, dtype=float)
+        threshold = self.threshold
+        if threshold is None:
+            return np.ones(len(hold_seconds), dtype=bool)
+        return hold_seconds < threshold
+
+
+def profile_path(username):
+    """Where a user's hold-time filter is kept"""
+    safe_name = re.sub(r"[^\w.-]", "_", str(username))
+    return os.path.join(PROFILES_DIR, f"{safe_name}_hold_time.json")
+
+
+_filters = {}
+_filters_lock = threading.Lock()
+
+
+def get_hold_time_filter(username):
+    """Shared filter of `username`, loaded from their profile on first use."""
+    with _filters_lock:
+        hold_filter = _filters.get(username)
+        if hold_filter is None:
+            hold_filter = _filters[username] = HoldTimeFilter(profile_path(username))
+        return hold_filter
@@ -0,0 +1,148 @@
+# preprocessing/keystroke_csv.py
+
+import logging
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Raw keystroke CSV schema, as written by the collectors
+KEYSTROKE_COLUMNS = ['Timestamp_Press', 'Timestamp_Release', 'Key Stroke', 'Application', 'Hold Time']
+
+# Timestamps are written with datetime.strftime
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+_EPOCH = pd.Timestamp('1970-01-01')
+
+
+def _parse_timestamps(values):
+    """Parse with the collector's format; only values that don't fit it are inferred."""
+    parsed = pd.to_datetime(values, format=TIMESTAMP_FORMAT, errors='coerce')
+    retry = parsed.isna() & values.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry], format='mixed', errors='coerce')
+    return parsed.astype('datetime64[ns]')
+
+
+def _parse_durations(values):
+    """
+    Parse str(timedelta) hold times ('H:MM:SS.ffffff'). Those under a day are
+    parsed as clock times with a fixed format; the rest go through to_timedelta.
+    """
+    parsed = pd.to_datetime('1970-01-01 ' + values, format=TIMESTAMP_FORMAT, errors='coerce') - _EPOCH
+    retry = parsed.isna() & values.notna()
+    if retry.any():
+        parsed[retry] = pd.to_timedelta(values[retry], errors='coerce')
+    return parsed.astype('timedelta64[ns]')
+
+
+def _convert(df, malformed, source):
+    valid = pd.Series(True, index=df.index)
+    for column in ('Timestamp_Press', 'Timestamp_Release'):
+        if column in df.columns:
+            raw = df[column]
+            df[column] = _parse_timestamps(raw)
+            valid &= df[column].notna() | raw.isna()
+    if 'Hold Time' in df.columns:
+        raw = df['Hold Time']
+        df['Hold Time'] = _parse_durations(raw)
+        valid &= df['Hold Time'].notna() | raw.isna()
+    for column in ('Key Stroke', 'Application'):
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+
+    if not valid.all():
+        malformed += int((~valid).sum())
+        df = df[valid].reset_index(drop=True)
+
+    df.attrs['malformed_lines'] = malformed
+    if malformed:
+        logger.warning(f"Skipped {malformed} malformed lines in {source}")
+    return df
+
+
+_READ_OPTIONS = {
+    'dtype': {column: str for column in KEYSTROKE_COLUMNS}
+}
+
+
+class _BadLineCounter:
+    """on_bad_lines callable of the python parser: skips and counts lines with too many fields."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, fields):
+        self.count += 1
+        return None
+
+
+def _rewind(source):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+
+def _read_counting(source, **options):
+    """
+    read_csv with the python parser, which reports bad lines one by one to
+    the returned counter. Used only once the C parser found one, as it is
+    several times slower.
+    """
+    counter = _BadLineCounter()
+    _rewind(source)
+    return pd.read_csv(source, engine='python', on_bad_lines=counter, **options, **_READ_OPTIONS), counter
+
+
+def read_keystroke_csv(source):
+    """
+    Read a raw keystroke CSV with a fixed schema.
+
+    Timestamps become datetime64[ns], Hold Time timedelta64[ns], Key Stroke
+    and Application categoricals. Lines with the wrong number of fields or
+    with unparseable timings are skipped; how many is logged and kept in
+    `df.attrs['malformed_lines']`. Columns outside the schema are read as-is.
+
+    Args:
+        source (str or file-like): Path or buffer of the CSV
+
+    Returns:
+        pd.DataFrame: Typed keystroke rows
+    """
+    try:
+        return _convert(pd.read_csv(source, on_bad_lines='error', **_READ_OPTIONS), 0, source)
+    except pd.errors.ParserError:
+        pass
+    df, counter = _read_counting(source)
+    return _convert(df, counter.count, source)
+
+
+def iter_keystroke_csv(source, chunksize=10000):
+    """
+    Read a raw keystroke CSV in chunks of `chunksize` lines, typed and
+    checked like read_keystroke_csv.
+
+    Yields:
+        pd.DataFrame: Typed keystroke rows (at most `chunksize` per chunk)
+    """
+    rows_done = 0
+    try:
+        with pd.read_csv(source, chunksize=chunksize, on_bad_lines='error', **_READ_OPTIONS) as reader:
+            for chunk in reader:
+                rows_done += len(chunk)
+                yield _convert(chunk, 0, source)
+        return
+    except pd.errors.ParserError:
+        pass
+
+    # A malformed line: carry on with the counting parser after the rows
+    # already yielded (all lines before them were well-formed)
+    reader, counter = _read_counting(source, chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            if rows_done:
+                skip = min(rows_done, len(chunk))
+                rows_done -= skip
+                chunk = chunk.iloc[skip:].reset_index(drop=True)
+            # Chunks of only bad lines come out empty; still report them
+            if len(chunk) or counter.count:
+                malformed, counter.count = counter.count, 0
+                yield _convert(chunk, malformed, source)
@@ -7,6 +7,11 @@ import logging
 import os
 from datetime import datetime
 
+from utils.symbol_table import key_symbols, app_symbols
+from preprocessing import feature_engine
+from preprocessing.keystroke_csv import read_keystroke_csv
+from preprocessing import feature_spec
+
 # Configure logging
 logging.basicConfig(
     level=logging.DEBUG,
@@ -23,173 +28,344 @@ logger = logging.getLogger(__name__)
 # Set logging level for this module
 logger.setLevel(logging.DEBUG)
 
+# Keystrokes per feature row
+GROUP_SIZE = 5
+
+# Key aliases normalized to one label
+KEY_ALIASES = [
+    ('^Key.alt_gr$', 'Key.alt_r'),
+    ('^Key.shift$', 'Key.shift_l'),
+    ('^Key.cmd$', 'Key.cmd_l')
+]
+
 def standardize_keystrokes(df):
     """Standardize keystroke labels to ensure consistency."""
-    df["Key Stroke"] = df["Key Stroke"].str.replace('^Key.alt_gr$', 'Key.alt_r', regex=True)
-    df["Key Stroke"] = df["Key Stroke"].str.replace('^Key.shift$', 'Key.shift_l', regex=True)
-    df["Key Stroke"] = df["Key Stroke"].str.replace('^Key.cmd$', 'Key.cmd_l', regex=True)
+    for pattern, replacement in KEY_ALIASES:
+        df["Key Stroke"] = df["Key Stroke"].str.replace(pattern, replacement, regex=True)
     
     return df
 
+# Ctrl key mappings (special character codes)
+CTRL_KEY_MAPPING = {
+    "'\\x01'": "Ctrl + A", "'\\x02'": "Ctrl + B", "'\\x03'": "Ctrl + C",
+    "'\\x04'": "Ctrl + D", "'\\x05'": "Ctrl + E", "'\\x06'": "Ctrl + F",
+    "'\\x07'": "Ctrl + G", "'\\x08'": "Ctrl + H", "'\\x09'": "Ctrl + I",
+    "'\\x0a'": "Ctrl + J", "'\\x0b'": "Ctrl + K", "'\\x0c'": "Ctrl + L",
+    "'\\x0d'": "Ctrl + M", "'\\x0e'": "Ctrl + N", "'\\x0f'": "Ctrl + O",
+    "'\\x10'": "Ctrl + P", "'\\x11'": "Ctrl + Q", "'\\x12'": "Ctrl + R",
+    "'\\x13'": "Ctrl + S", "'\\x14'": "Ctrl + T", "'\\x15'": "Ctrl + U",
+    "'\\x16'": "Ctrl + V", "'\\x17'": "Ctrl + W", "'\\x18'": "Ctrl + X",
+    "'\\x19'": "Ctrl + Y", "'\\x1a'": "Ctrl + Z", "<48>": "Ctrl + 0",
+    "<49>": "Ctrl + 1", "<50>": "Ctrl + 2", "<51>": "Ctrl + 3",
+    "<52>": "Ctrl + 4", "<53>": "Ctrl + 5", "<54>": "Ctrl + 6",
+    "<55>": "Ctrl + 7", "<56>": "Ctrl + 8", "<57>": "Ctrl + 9",
+    "<192>": "Ctrl + `", "<189>": "Ctrl + -", "<187>": "Ctrl + =",
+    "\\x1b": "Ctrl + [", "\\x1d": "Ctrl + ]", "\\x1c": "Ctrl + \\",
+    "<186>": "Ctrl + ;", "<222>": "Ctrl + '", "<188>": "Ctrl + ,",
+    "<190>": "Ctrl + .", "<191>": "Ctrl + /"
+}
+
+# Multi-key shortcuts stored in separate rows
+MULTI_KEY_SHORTCUTS = {
+    ("Key.cmd", "Key.tab"): "Win + Tab",
+    ("Key.alt_l", "Key.tab"): "Alt + Tab",  # Switch between open apps
+    ("Key.alt_l", "Key.f4"): "Alt + F4",  # Close application
+    ("Key.ctrl_l", "Key.shift", "Key.esc"): "Ctrl + Shift + Esc",  # Open Task Manager
+    ("Key.win", "Key.down"): "Win + Down Arrow",  # Minimize window
+    ("Key.win", "Key.up"): "Win + Up Arrow",  # Maximize window
+    ("Key.win", "Key.left"): "Win + Left Arrow",  # Snap window to left
+    ("Key.win", "Key.right"): "Win + Right Arrow",  # Snap window to right
+    ("Key.ctrl_l", "Key.home"): "Ctrl + Home",  # Move to beginning of document
+    ("Key.ctrl_l", "Key.end"): "Ctrl + End",  # Move to end of document
+    ("Key.shift", "Key.home"): "Shift + Home",  # Select line (start)
+    ("Key.shift", "Key.end"): "Shift + End",  # Select line (end)
+    ("Key.prtscn",): "PrtScn",  # Capture full screen
+    ("Key.win", "Key.shift", "Key.s"): "Win + Shift + S",  # Capture selected area
+    ("Key.alt_l", "Key.prtscn"): "Alt + PrtScn",  # Capture active window
+    ("Key.ctrl_l", "Key.shift", "Key.t"): "Ctrl + Shift + T",  # Reopen closed tab
+    ("Key.f12",): "F12",  # Open Developer Tools
+    ("Key.ctrl_l", "Key.shift", "Key.i"): "Ctrl + Shift + I"  # Open Developer Tools (Alternative)
+}
+
+# Single-key shortcuts that need renaming
+SINGLE_KEY_SHORTCUTS = {
+    "Key.home": "Home",
+    "Key.end": "End",
+    "Key.backspace": "Backspace",
+    "Key.delete": "Delete",
+    "Key.space": "Space",
+    "Key.esc": "Escape",
+    "Key.enter": "Enter",
+    "Key.tab": "Tab",
+    "Key.prtscn": "PrtScn"
+}
+
+# Two-key shortcuts compiled over key codes: sorted (first << 32 | second)
+# pair keys, and the combined name and its code for each, built on first use
+_shortcut_pairs = None
+
+def _compile_shortcuts():
+    """
+    Compile MULTI_KEY_SHORTCUTS into a pair table over key_symbols codes.
+
+    Shortcuts are combined by pairing a pending key with the next one, so
+    only the two-key entries can ever match.
+    """
+    global _shortcut_pairs
+    if _shortcut_pairs is None:
+        pairs = {keys: name for keys, name in MULTI_KEY_SHORTCUTS.items() if len(keys) == 2}
+        first = key_symbols.intern_many([keys[0] for keys in pairs]).astype(np.int64)
+        second = key_symbols.intern_many([keys[1] for keys in pairs]).astype(np.int64)
+        pair_keys = (first << 32) | second
+        order = np.argsort(pair_keys)
+        names = np.array(list(pairs.values()), dtype=object)[order]
+        _shortcut_pairs = (pair_keys[order], names, key_symbols.intern_many(list(names)))
+    return _shortcut_pairs
+
+def shortcut_matches(codes):
+    """
+    Positions where a key and the one after it combine into a shortcut.
+
+    Scanning left to right, a key and the next one form a match when they
+    are a shortcut; the second key is then not paired again.
+
+    Args:
+        codes (np.ndarray): Key codes in typing order
+
+    Returns:
+        tuple: (positions, slots) - the first key of each match and its
+        entry in the compiled shortcut table
+    """
+    if len(codes) < 2:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    pair_keys = _compile_shortcuts()[0]
+    codes = np.asarray(codes, dtype=np.int64)
+    pairs = (codes[:-1] << 32) | codes[1:]
+    slots = np.minimum(np.searchsorted(pair_keys, pairs), len(pair_keys) - 1)
+    candidates = np.flatnonzero(pair_keys[slots] == pairs)
+    if len(candidates) == 0:
+        # Common case: no shortcut anywhere in the data
+        return candidates, candidates
+
+    # A candidate is taken unless its first key was the second key of the
+    # previous match
+    taken = []
+    last_taken = -2
+    for i in candidates:
+        if i == last_taken + 1:
+            continue
+        taken.append(i)
+        last_taken = i
+    taken = np.array(taken, dtype=np.intp)
+    return taken, slots[taken]
+
+def combine_shortcut_codes(codes):
+    """
+    Combine multi-key shortcuts in an array of key codes.
+
+    Returns:
+        tuple: (codes, keep) - the codes with the shortcut's code in place of
+        the first key of each match, and a boolean array that is False for
+        the second key of each match
+    """
+    codes = np.array(codes, dtype=np.int32)
+    keep = np.ones(len(codes), dtype=bool)
+    positions, slots = shortcut_matches(codes)
+    if len(positions):
+        codes[positions] = _compile_shortcuts()[2][slots]
+        keep[positions + 1] = False
+    return codes, keep
+
+def match_shortcuts(keys):
+    """
+    Find multi-key shortcuts in a sequence of key labels.
+
+    Args:
+        keys (pd.Series): Key labels in typing order
+
+    Returns:
+        tuple: (labels, keep) - the labels with the shortcut name in place of
+        the first key of each match, and a boolean array that is False for
+        the second key of each match
+    """
+    labels = list(keys)
+    keep = np.ones(len(labels), dtype=bool)
+    if len(labels) < 2:
+        return labels, keep
+
+    positions, slots = shortcut_matches(encode_symbols(keys, key_symbols))
+    names = _compile_shortcuts()[1]
+    for i, slot in zip(positions, slots):
+        labels[i] = names[slot]
+        keep[i + 1] = False
+
+    return labels, keep
+
+def combine_shortcuts(keys):
+    """
+    Combine multi-key shortcuts in a sequence of key labels.
+
+    Args:
+        keys (pd.Series): Key labels in typing order
+
+    Returns:
+        list: Key labels with shortcuts combined (shorter by one per match)
+    """
+    labels, keep = match_shortcuts(keys)
+    return [label for label, kept in zip(labels, keep) if kept]
+
+def standardize_key(key):
+    """
+    Per-key part of the keystroke cleanup for a single label: quotes
+    stripped, aliases normalized and Ctrl key codes mapped (shortcuts are
+    combined afterwards, then SINGLE_KEY_SHORTCUTS renamed).
+    """
+    key = str(key).strip("'")
+    for pattern, replacement in KEY_ALIASES:
+        key = re.sub(pattern, replacement, key)
+    return CTRL_KEY_MAPPING.get(key, key)
+
 def standardize_windows_keystrokes(df):
     """
     Standardizes Windows keystrokes by:
     1. Mapping special Ctrl key sequences.
     2. Combining multi-key shortcuts into a single row.
     """
-    # Ctrl key mappings (special character codes)
-    ctrl_key_mapping = {
-        "'\\x01'": "Ctrl + A", "'\\x02'": "Ctrl + B", "'\\x03'": "Ctrl + C",
-        "'\\x04'": "Ctrl + D", "'\\x05'": "Ctrl + E", "'\\x06'": "Ctrl + F",
-        "'\\x07'": "Ctrl + G", "'\\x08'": "Ctrl + H", "'\\x09'": "Ctrl + I",
-        "'\\x0a'": "Ctrl + J", "'\\x0b'": "Ctrl + K", "'\\x0c'": "Ctrl + L",
-        "'\\x0d'": "Ctrl + M", "'\\x0e'": "Ctrl + N", "'\\x0f'": "Ctrl + O",
-        "'\\x10'": "Ctrl + P", "'\\x11'": "Ctrl + Q", "'\\x12'": "Ctrl + R",
-        "'\\x13'": "Ctrl + S", "'\\x14'": "Ctrl + T", "'\\x15'": "Ctrl + U",
-        "'\\x16'": "Ctrl + V", "'\\x17'": "Ctrl + W", "'\\x18'": "Ctrl + X",
-        "'\\x19'": "Ctrl + Y", "'\\x1a'": "Ctrl + Z", "<48>": "Ctrl + 0",
-        "<49>": "Ctrl + 1", "<50>": "Ctrl + 2", "<51>": "Ctrl + 3",
-        "<52>": "Ctrl + 4", "<53>": "Ctrl + 5", "<54>": "Ctrl + 6",
-        "<55>": "Ctrl + 7", "<56>": "Ctrl + 8", "<57>": "Ctrl + 9",
-        "<192>": "Ctrl + `", "<189>": "Ctrl + -", "<187>": "Ctrl + =",
-        "\\x1b": "Ctrl + [", "\\x1d": "Ctrl + ]", "\\x1c": "Ctrl + \\",
-        "<186>": "Ctrl + ;", "<222>": "Ctrl + '", "<188>": "Ctrl + ,",
-        "<190>": "Ctrl + .", "<191>": "Ctrl + /"
-    }
-
-    # Multi-key shortcuts stored in separate rows
-    multi_key_shortcuts = {
-        ("Key.cmd", "Key.tab"): "Win + Tab",
-        ("Key.alt_l", "Key.tab"): "Alt + Tab",  # Switch between open apps
-        ("Key.alt_l", "Key.f4"): "Alt + F4",  # Close application
-        ("Key.ctrl_l", "Key.shift", "Key.esc"): "Ctrl + Shift + Esc",  # Open Task Manager
-        ("Key.win", "Key.down"): "Win + Down Arrow",  # Minimize window
-        ("Key.win", "Key.up"): "Win + Up Arrow",  # Maximize window
-        ("Key.win", "Key.left"): "Win + Left Arrow",  # Snap window to left
-        ("Key.win", "Key.right"): "Win + Right Arrow",  # Snap window to right
-        ("Key.ctrl_l", "Key.home"): "Ctrl + Home",  # Move to beginning of document
-        ("Key.ctrl_l", "Key.end"): "Ctrl + End",  # Move to end of document
-        ("Key.shift", "Key.home"): "Shift + Home",  # Select line (start)
-        ("Key.shift", "Key.end"): "Shift + End",  # Select line (end)
-        ("Key.prtscn",): "PrtScn",  # Capture full screen
-        ("Key.win", "Key.shift", "Key.s"): "Win + Shift + S",  # Capture selected area
-        ("Key.alt_l", "Key.prtscn"): "Alt + PrtScn",  # Capture active window
-        ("Key.ctrl_l", "Key.shift", "Key.t"): "Ctrl + Shift + T",  # Reopen closed tab
-        ("Key.f12",): "F12",  # Open Developer Tools
-        ("Key.ctrl_l", "Key.shift", "Key.i"): "Ctrl + Shift + I"  # Open Developer Tools (Alternative)
-    }
-
-    # Single-key shortcuts that need renaming
-    single_key_shortcuts = {
-        "Key.home": "Home",
-        "Key.end": "End",
-        "Key.backspace": "Backspace",
-        "Key.delete": "Delete",
-        "Key.space": "Space",
-        "Key.esc": "Escape",
-        "Key.enter": "Enter",
-        "Key.tab": "Tab",
-        "Key.prtscn": "PrtScn"
-    }
-    
     # Step 1: Replace Ctrl key mappings
-    df["Key Stroke"] = df["Key Stroke"].replace(ctrl_key_mapping)
+    df["Key Stroke"] = df["Key Stroke"].replace(CTRL_KEY_MAPPING)
 
     # Step 2: Combine multi-key shortcuts
-    combined_keystrokes = []
-    previous_keys = []
-
-    for index, row in df.iterrows():
-        key = row["Key Stroke"]
-
-        if previous_keys:
-            potential_shortcut = tuple(previous_keys + [key])
-            if potential_shortcut in multi_key_shortcuts:
-                combined_keystrokes.append(multi_key_shortcuts[potential_shortcut])
-                previous_keys = []  # Reset
-                continue  # Skip adding individual keys
-            else:
-                # If no match, add the previous key separately
-                combined_keystrokes.append(previous_keys[0])
-                previous_keys = [key]  # Store the current key for next iteration
-        else:
-            previous_keys.append(key)  # Store first key
-
-    # If any leftover key remains, add it
-    if previous_keys:
-        combined_keystrokes.append(previous_keys[0])
+    combined_keystrokes = combine_shortcuts(df["Key Stroke"])
 
     # Update DataFrame
     df = df.iloc[:len(combined_keystrokes)].copy()
     df["Key Stroke"] = combined_keystrokes
-    df["Key Stroke"] = df["Key Stroke"].replace(single_key_shortcuts)
+    df["Key Stroke"] = df["Key Stroke"].replace(SINGLE_KEY_SHORTCUTS)
 
     return df
 
-def process_keystroke_data(keystroke_data, user_name=None):
+def encode_symbols(values, table):
+    """Intern a column of strings into int32 codes, touching each distinct value once."""
+    codes, uniques = pd.factorize(values)
+    return table.intern_many([str(value) for value in uniques])[codes]
+
+def clean_keystroke_rows(df):
     """
-    Process keystroke data from a DataFrame or dict.
+    Convert timestamps to datetime, drop rows whose press and release fall on
+    different dates or that have missing values, and sort by release time.
+    """
+    df['Timestamp_Press'] = pd.to_datetime(df['Timestamp_Press'])
+    df['Timestamp_Release'] = pd.to_datetime(df['Timestamp_Release'])
+    
+    df.reset_index(drop=True, inplace=True)
+
+    # Clean the data (remove rows with mismatched dates)
+    mismatched = df['Timestamp_Press'].dt.normalize() != df['Timestamp_Release'].dt.normalize()
+    df.drop(df.index[mismatched], axis=0, inplace=True)
+    df.reset_index(drop=True, inplace=True)
+
+    df.dropna(inplace=True)
+    df.sort_values(by='Timestamp_Release', inplace=True)
+    df.reset_index(drop=True, inplace=True)
+    
+    return df
+
+def prepare_keystroke_rows(keystroke_data, user_name=None, remove_outliers=True, hold_filter=None):
+    """
+    Clean and standardize raw keystrokes, one row per keystroke (the part of
+    process_keystroke_data before grouping).
     
     Args:
         keystroke_data (dict or pd.DataFrame): Raw keystroke data
         user_name (str, optional): User's name for labeling
+        remove_outliers (bool): Without a user name, drop hold times at or
+            above the 99th percentile of this data
+        hold_filter (HoldTimeFilter, optional): The user's hold-time filter;
+            once warmed up, its cutoff replaces the percentile of this data.
+            It is only read: the collectors update it as keystrokes arrive
         
     Returns:
-        pd.DataFrame: Processed grouped DataFrame
+        pd.DataFrame: Keystroke rows; timestamps and hold times as int64
+        nanoseconds, keys and applications as codes in `key_symbols` /
+        `app_symbols`
     """
-    try:
-        # Convert to DataFrame if needed
-        if isinstance(keystroke_data, dict):
-            df = pd.DataFrame.from_dict(keystroke_data)
-        elif isinstance(keystroke_data, list):
-            df = pd.DataFrame(keystroke_data)
-        else:
-            df = keystroke_data
+    # Convert to DataFrame if needed
+    if isinstance(keystroke_data, dict):
+        df = pd.DataFrame.from_dict(keystroke_data)
+    elif isinstance(keystroke_data, list):
+        df = pd.DataFrame(keystroke_data)
+    else:
+        df = keystroke_data
+    
+    # Add user label if provided
+    if user_name:
+        df['User'] = user_name
         
-        # Add user label if provided
-        if user_name:
-            df['User'] = user_name
+    df = clean_keystroke_rows(df)
+    
+    if user_name==None and remove_outliers:
+        # Convert hold time to seconds
+        if 'Hold Time' in df.columns:
+            df['Hold Time (seconds)'] = pd.to_timedelta(df['Hold Time']).dt.total_seconds()
             
-        # Convert timestamps to datetime
-        df['Timestamp_Press'] = pd.to_datetime(df['Timestamp_Press'])
-        df['Timestamp_Release'] = pd.to_datetime(df['Timestamp_Release'])
-        
-        df.reset_index(drop=True, inplace=True)
+            # Remove outliers, with the user's cutoff once it is known
+            cutoff = None
+            if hold_filter is not None:
+                cutoff = hold_filter.threshold
+            if cutoff is None:
+                cutoff = df['Hold Time (seconds)'].quantile(0.99)
+            df = df[df['Hold Time (seconds)'] < cutoff]
+
+    # Clean Keystrokes
+    if 'Key Stroke' in df.columns:
+        df['Key Stroke'] = df['Key Stroke'].astype(str)
+        df['Key Stroke'] = df['Key Stroke'].str.strip("'")
+
+        # Standardize Keystrokes
+        df = standardize_keystrokes(df)
+        df = standardize_windows_keystrokes(df)
+
+        # Timings are grouped as integer nanoseconds
+        df["Timestamp_Press"] = df["Timestamp_Press"].astype("datetime64[ns]").astype("int64")
+        df["Timestamp_Release"] = df["Timestamp_Release"].astype("datetime64[ns]").astype("int64")
+        if "Hold Time" in df.columns:
+            hold_time = pd.to_timedelta(df["Hold Time"], errors="coerce")
+            df["Hold Time"] = hold_time.fillna(pd.Timedelta(0)).astype("timedelta64[ns]").astype("int64")
+
+        # Keys and applications are grouped as interned codes
+        df["Key Stroke"] = encode_symbols(df["Key Stroke"], key_symbols)
+        if "Application" in df.columns:
+            df["Application"] = encode_symbols(df["Application"], app_symbols)
 
-        # Clean the data (remove rows with mismatched dates)
-        rows_to_drop = []
-        for index, row in df.iterrows():
-            if row['Timestamp_Press'].date() != row['Timestamp_Release'].date():
-                rows_to_drop.append(index)
-        
-        df.drop(rows_to_drop, axis=0, inplace=True)
         df.reset_index(drop=True, inplace=True)
 
-        df.dropna(inplace=True)
-        df.sort_values(by='Timestamp_Release', inplace=True)
-        df.reset_index(drop=True, inplace=True)
-        
-        if user_name==None:
-            # Convert hold time to seconds
-            if 'Hold Time' in df.columns:
-                df['Hold Time (seconds)'] = pd.to_timedelta(df['Hold Time']).dt.total_seconds()
-                
-                # Remove outliers
-                quantile_99 = df['Hold Time (seconds)'].quantile(0.99)
-                df = df[df['Hold Time (seconds)'] < quantile_99]
-
-        # Clean Keystrokes
-        if 'Key Stroke' in df.columns:
-            df['Key Stroke'] = df['Key Stroke'].astype(str)
-            df['Key Stroke'] = df['Key Stroke'].str.strip("'")
+    return df
 
-            # Standardize Keystrokes
-            df = standardize_keystrokes(df)
-            df = standardize_windows_keystrokes(df)
+def process_keystroke_data(keystroke_data, user_name=None, remove_outliers=True, group_size=GROUP_SIZE, hold_filter=None):
+    """
+    Process keystroke data from a DataFrame or dict.
+    
+    Args:
+        keystroke_data (dict or pd.DataFrame): Raw keystroke data
+        user_name (str, optional): User's name for labeling
+        remove_outliers (bool): Without a user name, drop hold times at or
+            above the 99th percentile of this data
+        group_size (int): Keystrokes per group
+        hold_filter (HoldTimeFilter, optional): The user's hold-time filter
+            (see prepare_keystroke_rows)
+        
+    Returns:
+        pd.DataFrame: Processed grouped DataFrame; timestamps and hold times
+        are grouped as int64 nanoseconds, keys and applications as codes in
+        `key_symbols` / `app_symbols`
+    """
+    try:
+        df = prepare_keystroke_rows(keystroke_data, user_name, remove_outliers, hold_filter)
 
+        if 'Key Stroke' in df.columns:
             # Group data
-            df.reset_index(drop=True, inplace=True)
-            df["Group"] = df.index // 5
+            df["Group"] = df.index // group_size
             
             # Create aggregation dictionary based on available columns
             agg_dict = {
@@ -218,30 +394,37 @@ def process_keystroke_data(keystroke_data, user_name=None):
         logger.error(f"Error processing keystroke data: {str(e)}")
         raise
 
-def process_keystroke_file(filepath, user_name):
+def process_keystroke_file(filepath, user_name=None, group_size=GROUP_SIZE, hold_filter=None):
     """
     Process keystroke data from a CSV file.
     
     Args:
         filepath (str): Path to the CSV file
-        user_name (str): User's name for labeling
+        user_name (str, optional): User's name for labeling
+        group_size (int): Keystrokes per group
+        hold_filter (HoldTimeFilter, optional): The user's hold-time filter
         
     Returns:
         pd.DataFrame: Processed grouped DataFrame
     """
     try:
-        df = pd.read_csv(filepath)
-        return process_keystroke_data(df, user_name)
+        df = read_keystroke_csv(filepath)
+        return process_keystroke_data(df, user_name, group_size=group_size, hold_filter=hold_filter)
     except Exception as e:
         logger.error(f"Error processing keystroke file {filepath}: {str(e)}")
         raise
 
+# Compiled once; categorize_key runs for every new key
+FUNCTION_KEY_PATTERN = re.compile(r"Key\.f\d+")
+MEDIA_KEY_PATTERN = re.compile(r"^Key\.media.*")
+PUNCTUATION = "`~!@#$%^&*()-_=+[{]};:'\",<.>/?\\|"
+
 def categorize_key(key):
     """Categorize a key into a type."""
     key = str(key).strip("'")
-    if re.fullmatch(r"Key\.f\d+", key):
+    if FUNCTION_KEY_PATTERN.fullmatch(key):
         category = "Function Key"
-    elif re.fullmatch(r"^Key\.media.*", key):
+    elif MEDIA_KEY_PATTERN.fullmatch(key):
         category = "Media Key"
     elif key.isupper():
         category = "Upper Alpha"
@@ -249,7 +432,7 @@ def categorize_key(key):
         category = "Lower Alpha"
     elif key.isdigit():
         category = "Numeric"
-    elif key in "`~!@#$%^&*()-_=+[{]};:'\",<.>/?\\|":
+    elif key in PUNCTUATION:
         category = "Punctuation"
     elif "Key." in key:
         category = "Modifier"
@@ -262,44 +445,52 @@ def categorize_key(key):
     
     return category
 
+# Keyboard sections, checked in order (a key listed twice gets the first)
+KEY_SECTIONS = [
+    ("Section 1", frozenset({"`", "1", "Tab", "Q", "q", "Key.caps_lock", "A", "a", "Key.shift_l", "Z", "z", "Key.alt_l", "Key.ctrl_l", "Key.cmd_l", "Escape", "Key.f1"})),
+    ("Section 2", frozenset({"2", "3", "W", "E", "S", "D", "X", "C", "w", "e", "s", "d", "x", "c", "Key.f2", "Key.f3"})),
+    ("Section 3", frozenset({"4", "5", "R", "F", "V", "G", "B", "T", "r", "t", "f", "v", "g", "b", "t", "Key.f4", "Key.f5"})),
+    ("Section 4", frozenset({"6", "7", "Y", "U", "J", "N", "M", "H", "y", "u", "j", "n", "m", "h", "Key.f6", "Key.f7"})),
+    ("Section 5", frozenset({"8", "9", "I", "O", "K", "L", ",", ".", "i", "o", "k", "l", "Key.f8", "Key.f9"})),
+    ("Section 6", frozenset({"0", "-", "P", "[", ";", "'", "/", "Key.shift_r", "p", "Key.f10", "Key.f11"})),
+    ("Section 7", frozenset({"Key.f12", "Home", "End", "Delete", "\\", "Backspace", "Enter", "Key.shift_r", "Key.page_up", "Key.page_down"})),
+    ("Section 8", frozenset({"Key.up", "Key.down", "Key.left", "Key.right"})),
+    ("Section 9", frozenset({"Space", "Key.alt_r", "Key.ctrl_l", "Key.cmd_r"})),
+]
+
 def assign_key_section(keystroke):
     """Assign a keyboard section to a keystroke."""
-    section1_keys = {"`", "1", "Tab", "Q", "q", "Key.caps_lock", "A", "a", "Key.shift_l", "Z", "z", "Key.alt_l", "Key.ctrl_l", "Key.cmd_l", "Escape", "Key.f1"}
-    section2_keys = {"2", "3", "W", "E", "S", "D", "X", "C", "w", "e", "s", "d", "x", "c", "Key.f2", "Key.f3"}
-    section3_keys = {"4", "5", "R", "F", "V", "G", "B", "T", "r", "t", "f", "v", "g", "b", "t", "Key.f4", "Key.f5"}
-    section4_keys = {"6", "7", "Y", "U", "J", "N", "M", "H", "y", "u", "j", "n", "m", "h", "Key.f6", "Key.f7"}
-    section5_keys = {"8", "9", "I", "O", "K", "L", ",", ".", "i", "o", "k", "l", "Key.f8", "Key.f9"}
-    section6_keys = {"0", "-", "P", "[", ";", "'", "/", "Key.shift_r", "p", "Key.f10", "Key.f11"}
-    section7_keys = {"Key.f12", "Home", "End", "Delete", "\\", "Backspace", "Enter", "Key.shift_r", "Key.page_up", "Key.page_down"}
-    section8_keys = {"Key.up", "Key.down", "Key.left", "Key.right"}
-    section9_keys = {"Space", "Key.alt_r", "Key.ctrl_l", "Key.cmd_r"}
-
-    section = "Other Section"
-    if keystroke in section1_keys:
-        section = "Section 1"
-    elif keystroke in section2_keys:
-        section = "Section 2"
-    elif keystroke in section3_keys:
-        section = "Section 3"
-    elif keystroke in section4_keys:
-        section = "Section 4"
-    elif keystroke in section5_keys:
-        section = "Section 5"
-    elif keystroke in section6_keys:
-        section = "Section 6"
-    elif keystroke in section7_keys:
-        section = "Section 7"
-    elif keystroke in section8_keys:
-        section = "Section 8"
-    elif keystroke in section9_keys:
-        section = "Section 9"
-
-    return section
+    for section, keys in KEY_SECTIONS:
+        if keystroke in keys:
+            return section
+    return "Other Section"
+
+# Numeric model encoding of the key type and section labels
+KEY_TYPE_CODES = {
+    'Function Key': 1, 'Media Key': 2, 'Upper Alpha': 3, 'Lower Alpha': 4,
+    'Numeric': 5, 'Punctuation': 6, 'Modifier': 7, 'Delete/Backspace': 8,
+    'Shortcut': 9, 'Other': 0
+}
+KEY_SECTION_CODES = {
+    'Section 1': 1, 'Section 2': 2, 'Section 3': 3, 'Section 4': 4,
+    'Section 5': 5, 'Section 6': 6, 'Section 7': 7, 'Section 8': 8,
+    'Section 9': 9, 'Other Section': 0
+}
+
+# Per-key type and section codes, indexed by key code. Filled for the known
+# keys at import and extended as new keys are interned.
+key_symbols.register_attribute("key_type_code", lambda key: KEY_TYPE_CODES[categorize_key(key)], dtype=np.int8)
+key_symbols.register_attribute("key_section_code", lambda key: KEY_SECTION_CODES[assign_key_section(key)], dtype=np.int8)
+key_symbols.attribute("key_type_code")
+key_symbols.attribute("key_section_code")
 
 def compute_and_expand_features_with_prev(row, prev_row=None):
     """
     Compute and expand features from a grouped keystroke row.
 
+    Timestamps and hold times may be integer nanoseconds (as grouped by
+    process_keystroke_data) or Timestamp / timedelta values.
+
     Args:
         row: Current row with grouped keystroke data
         prev_row: Previous row for sequential features
@@ -320,27 +511,35 @@ def compute_and_expand_features_with_prev(row, prev_row=None):
     else:
         prev_press = prev_release = prev_apps = None
 
+    if len(press) and isinstance(press[0], (int, np.integer)):
+        # Integer nanoseconds: no Timedelta objects in the loop
+        def seconds(delta):
+            return delta / 1e9
+    else:
+        def seconds(delta):
+            return delta.total_seconds()
+
     ppd, rrd, rpd, prd = [], [], [], []
 
     if prev_press is None:
         ppd.append(0)
     else:
-        ppd.append((press[0] - prev_press[-1]).total_seconds())
+        ppd.append(seconds(press[0] - prev_press[-1]))
 
     for i in range(len(press) - 1):
-        ppd.append((press[i + 1] - press[i]).total_seconds())
+        ppd.append(seconds(press[i + 1] - press[i]))
 
     if prev_release is None:
         rrd.append(0)
     else:
-        rrd.append((release[0] - prev_release[-1]).total_seconds())
+        rrd.append(seconds(release[0] - prev_release[-1]))
 
     for i in range(len(release) - 1):
-        rrd.append((release[i + 1] - release[i]).total_seconds())
+        rrd.append(seconds(release[i + 1] - release[i]))
 
     for i in range(len(press)):
-        rpd.append((press[i] - release[i - 1]).total_seconds() if i > 0 else 0)
-        prd.append((release[i] - press[i - 1]).total_seconds() if i > 0 else 0)
+        rpd.append(seconds(press[i] - release[i - 1]) if i > 0 else 0)
+        prd.append(seconds(release[i] - press[i - 1]) if i > 0 else 0)
 
     features = {}
     features.update({f"PPD_{i}": abs(value) for i, value in enumerate(ppd)})
@@ -357,6 +556,8 @@ def compute_and_expand_features_with_prev(row, prev_row=None):
                     hold_seconds.append(pd.Timedelta(ht).total_seconds())
                 except:
                     hold_seconds.append(0)
+            elif isinstance(ht, (int, np.integer)):
+                hold_seconds.append(ht / 1e9)
             else:
                 hold_seconds.append(ht)
 
@@ -376,13 +577,19 @@ def compute_and_expand_features_with_prev(row, prev_row=None):
         features["Hold_Time_Std"] = np.std(hold_seconds)
 
     # Add key categorization if keys are present
-    if keys:
-        key_types = [categorize_key(key) for key in keys]
+    if len(keys):
+        if isinstance(keys[0], (int, np.integer)):
+            # Interned codes: metadata is an array lookup
+            key_types = key_symbols.lookup("key_type_code", keys)
+            key_sections = key_symbols.lookup("key_section_code", keys)
+        else:
+            key_types = [categorize_key(key) for key in keys]
+            key_sections = [assign_key_section(key) for key in keys]
+
         for i, key_type in enumerate(key_types):
             features[f"Key_Type_{i + 1}"] = key_type
 
         # Add key section info
-        key_sections = [assign_key_section(key) for key in keys]
         for i, key_section in enumerate(key_sections):
             features[f"Key_Section_{i + 1}"] = key_section
 
@@ -398,18 +605,65 @@ def expand_features(grouped_df):
     Returns:
         pd.DataFrame: DataFrame with expanded features
     """
-    previous_row = None
-    expanded_features_df = []
+    # Same features as compute_and_expand_features_with_prev row by row,
+    # computed for all groups at once
+    return feature_engine.expand_grouped(grouped_df)
+
+def encode_features(final_df, user_name=None):
+    """
+    Turn grouped + expanded keystroke features into the numeric model input.
+    
+    Drops the raw grouped columns, maps key sections and types to numbers and
+    coerces everything else (except a labelled User column) to numeric.
     
-    for idx, row in grouped_df.iterrows():
-        expanded_row = compute_and_expand_features_with_prev(row, prev_row=previous_row)
-        expanded_features_df.append(expanded_row)
-        previous_row = row
+    Args:
+        final_df (pd.DataFrame): Grouped and expanded features
+        user_name (str, optional): Whether the data is labelled with users
         
-    expanded_features_df = pd.DataFrame(expanded_features_df)
-    return expanded_features_df
+    Returns:
+        pd.DataFrame: Feature DataFrame ready for ML
+    """
+    # Cleanup unnecessary columns
+    columns_to_drop = ['Hold Time', 'Application', 'Key Stroke', 
+                      'Timestamp_Release', 'Timestamp_Press']
+    
+    for col in columns_to_drop:
+        if col in final_df.columns:
+            final_df = final_df.drop(columns=[col])
+    
+    # Encode categorical features (except User column if it exists)
+    key_section_columns = [col for col in final_df.columns if col.startswith('Key_Section_')]
+    key_type_columns = [col for col in final_df.columns if col.startswith('Key_Type_')]
+    
+    # Key features computed from key codes are already numeric; labels
+    # (from string keys) are mapped here
+    for column in key_section_columns:
+        if pd.api.types.is_object_dtype(final_df[column]):
+            final_df[column] = final_df[column].map(KEY_SECTION_CODES).fillna(0)
+    
+    for column in key_type_columns:
+        if pd.api.types.is_object_dtype(final_df[column]):
+            final_df[column] = final_df[column].map(KEY_TYPE_CODES).fillna(0)
+    
+    # Handle any remaining non-numeric columns, but keep User column as is if it exists
+    for col in final_df.columns:
+        if col == 'User' and user_name is not None:
+            # Keep User column as categorical/string only if user_name was provided
+            continue
+        elif pd.api.types.is_object_dtype(final_df[col]):
+            try:
+                final_df[col] = pd.to_numeric(final_df[col], errors='coerce')
+            except:
+                # If conversion fails, drop the column
+                final_df = final_df.drop(columns=[col])
+    
+    # Fill NA values except for User column if it exists
+    columns_to_fill = [col for col in final_df.columns if col != 'User' or user_name is None]
+    final_df[columns_to_fill] = final_df[columns_to_fill].fillna(0)
+    
+    return final_df
 
-def preprocess_keystroke_data(keystroke_data, user_name=None, additional_users=None):
+def preprocess_keystroke_data(keystroke_data, user_name=None, additional_users=None, group_size=GROUP_SIZE, hold_filter=None):
     """
     Main function to preprocess keystroke data and extract features.
     
@@ -417,6 +671,9 @@ def preprocess_keystroke_data(keystroke_data, user_name=None, additional_users=N
         keystroke_data (dict, DataFrame, or str): Raw keystroke data or filepath
         user_name (str, optional): User's name for labeling
         additional_users (dict): Dictionary with {username: data} for additional users
+        group_size (int): Keystrokes per group (one feature row per group)
+        hold_filter (HoldTimeFilter, optional): Hold-time filter of the user
+            typing unlabelled data, for its outlier cutoff
         
     Returns:
         pd.DataFrame: Processed and feature-expanded DataFrame ready for ML
@@ -425,9 +682,9 @@ def preprocess_keystroke_data(keystroke_data, user_name=None, additional_users=N
         if user_name is None:
             # Process without user information
             if isinstance(keystroke_data, str) and os.path.exists(keystroke_data):
-                grouped_df = process_keystroke_file(keystroke_data)
+                grouped_df = process_keystroke_file(keystroke_data, group_size=group_size, hold_filter=hold_filter)
             else:
-                grouped_df = process_keystroke_data(keystroke_data)
+                grouped_df = process_keystroke_data(keystroke_data, group_size=group_size, hold_filter=hold_filter)
             
             # Expand features for the dataset
             expanded_df = expand_features(grouped_df)
@@ -435,89 +692,107 @@ def preprocess_keystroke_data(keystroke_data, user_name=None, additional_users=N
             # Merge grouped and expanded DataFrames
             final_df = pd.concat([grouped_df, expanded_df], axis=1)
             
+            return encode_features(final_df, user_name)
+
+        # Labelled training data: each user is processed whole (in parallel
+        # if preprocessing workers are configured) and the reference datasets
+        # come from the feature cache
+        from preprocessing import chunked_pipeline
+        if chunked_pipeline.preprocessing_workers > 1:
+            blocks = chunked_pipeline.preprocess_users_parallel(
+                keystroke_data, user_name, additional_users, group_size=group_size
+            )
         else:
-            # Original processing with user information
-            if isinstance(keystroke_data, str) and os.path.exists(keystroke_data):
-                grouped_df = process_keystroke_file(keystroke_data, user_name)
-            else:
-                grouped_df = process_keystroke_data(keystroke_data, user_name)
-            
-            # Process additional users if provided
-            all_grouped_dfs = [grouped_df]
-            
-            if additional_users:
-                for add_user_name, add_user_data in additional_users.items():
-                    if isinstance(add_user_data, str) and os.path.exists(add_user_data):
-                        add_grouped_df = process_keystroke_file(add_user_data, add_user_name)
-                    else:
-                        add_grouped_df = process_keystroke_data(add_user_data, add_user_name)
-                    
-                    all_grouped_dfs.append(add_grouped_df)
-            
-            # Combine all user data
-            combined_grouped_df = pd.concat(all_grouped_dfs, ignore_index=True)
-            
-            # Expand features for the combined dataset
-            expanded_df = expand_features(combined_grouped_df)
-            
-            # Merge grouped and expanded DataFrames
-            final_df = pd.concat([combined_grouped_df, expanded_df], axis=1)
-
-        # Cleanup unnecessary columns
-        columns_to_drop = ['Hold Time', 'Application', 'Key Stroke', 
-                          'Timestamp_Release', 'Timestamp_Press']
-        
-        for col in columns_to_drop:
-            if col in final_df.columns:
-                final_df = final_df.drop(columns=[col])
-        
-        # Encode categorical features (except User column if it exists)
-        key_section_columns = [col for col in final_df.columns if col.startswith('Key_Section_')]
-        key_type_columns = [col for col in final_df.columns if col.startswith('Key_Type_')]
-        
-        # Simple encoding for demonstration
-        # In production, you should use a consistent encoder across all predictions
-        for column in key_section_columns:
-            if column in final_df.columns:
-                # Map to numeric values (consistent mapping would be best)
-                section_mapping = {
-                    'Section 1': 1, 'Section 2': 2, 'Section 3': 3, 'Section 4': 4,
-                    'Section 5': 5, 'Section 6': 6, 'Section 7': 7, 'Section 8': 8,
-                    'Section 9': 9, 'Other Section': 0
-                }
-                final_df[column] = final_df[column].map(section_mapping).fillna(0)
-        
-        for column in key_type_columns:
-            if column in final_df.columns:
-                # Map to numeric values
-                type_mapping = {
-                    'Function Key': 1, 'Media Key': 2, 'Upper Alpha': 3, 'Lower Alpha': 4,
-                    'Numeric': 5, 'Punctuation': 6, 'Modifier': 7, 'Delete/Backspace': 8,
-                    'Shortcut': 9, 'Other': 0
-                }
-                final_df[column] = final_df[column].map(type_mapping).fillna(0)
-        
-        # Handle any remaining non-numeric columns, but keep User column as is if it exists
-        for col in final_df.columns:
-            if col == 'User' and user_name is not None:
-                # Keep User column as categorical/string only if user_name was provided
-                continue
-            elif pd.api.types.is_object_dtype(final_df[col]):
-                try:
-                    final_df[col] = pd.to_numeric(final_df[col], errors='coerce')
-                except:
-                    # If conversion fails, drop the column
-                    final_df = final_df.drop(columns=[col])
-        
-        # Fill NA values except for User column if it exists
-        columns_to_fill = [col for col in final_df.columns if col != 'User' or user_name is None]
+            blocks = list(chunked_pipeline.iter_preprocessed_chunks(
+                keystroke_data, user_name, additional_users, chunksize=None, group_size=group_size
+            ))
+        if not blocks:
+            return pd.DataFrame()
+        final_df = pd.concat(blocks, ignore_index=True)
+        columns_to_fill = [col for col in final_df.columns if col != 'User']
         final_df[columns_to_fill] = final_df[columns_to_fill].fillna(0)
-        
         return final_df
     except Exception as e:
         logger.error(f"Error preprocessing keystroke data: {str(e)}")
         raise
 
+def preprocess_keystroke_matrix(keystroke_data, spec=None, hold_filter=None):
+    """
+    Preprocess unlabelled keystroke data straight into model input.
+    
+    Args:
+        keystroke_data (dict, DataFrame, or str): Raw keystroke data or filepath
+        spec (FeatureSpec, optional): Layout of the model that will score the
+            data; defaults to the current one
+        hold_filter (HoldTimeFilter, optional): Hold-time filter of the user
+            typing, for its outlier cutoff
+        
+    Returns:
+        np.ndarray: Contiguous feature matrix in the spec's column order and dtype
+    """
+    spec = spec or feature_spec.current_spec()
+    return spec.to_matrix(preprocess_keystroke_data(keystroke_data, group_size=spec.group_size, hold_filter=hold_filter))
+
+def preprocess_keystroke_resolutions(keystroke_data, group_sizes=(5, 10, 20), user_name=None, additional_users=None):
+    """
+    Features for several group sizes in one pass over the keystrokes.
+    
+    Each user's keystrokes are cleaned once, and the timing differences and
+    key lookups are shared by all resolutions. For every group size the
+    result is the same as preprocess_keystroke_data with that `group_size`,
+    except that per-position columns always run to the group size.
+    
+    Args:
+        keystroke_data (dict, DataFrame, or str): Raw keystroke data or filepath
+        group_sizes (iterable): Keystrokes per group for each resolution
+        user_name (str, optional): User's name for labeling
+        additional_users (dict): Dictionary with {username: data} for additional users
+        
+    Returns:
+        dict: group size -> feature DataFrame ready for ML
+    """
+    try:
+        if user_name is None:
+            if isinstance(keystroke_data, str) and os.path.exists(keystroke_data):
+                keystroke_data = read_keystroke_csv(keystroke_data)
+            df = prepare_keystroke_rows(keystroke_data)
+            if 'Key Stroke' not in df.columns or df.empty:
+                return {group_size: pd.DataFrame() for group_size in group_sizes}
+            users = [(None, (
+                df["Timestamp_Press"].to_numpy(),
+                df["Timestamp_Release"].to_numpy(),
+                df["Hold Time"].to_numpy() if "Hold Time" in df.columns else np.zeros(len(df), dtype=np.int64),
+                df["Key Stroke"].to_numpy()
+            ))]
+        else:
+            from preprocessing import chunked_pipeline
+            sources = [(user_name, keystroke_data)] + list((additional_users or {}).items())
+            users = [(name, chunked_pipeline.user_keystrokes(source)) for name, source in sources]
+            users = [(name, rows) for name, rows in users if len(rows[0])]
+            if not users:
+                return {group_size: pd.DataFrame() for group_size in group_sizes}
+
+        press, release, hold, keys = (np.concatenate(arrays) for arrays in zip(*(rows for _, rows in users)))
+        user_lengths = [len(rows[0]) for _, rows in users]
+        resolutions = feature_engine.multi_resolution_feature_columns(
+            press, release, group_sizes,
+            user_lengths=user_lengths,
+            hold=hold / 1e9,
+            keys=keys
+        )
+
+        features = {}
+        for group_size, columns in resolutions.items():
+            df = pd.DataFrame(columns)
+            if user_name is not None:
+                group_counts = [-(-n // group_size) for n in user_lengths]
+                df.insert(0, "User", np.repeat([name for name, _ in users], group_counts))
+            features[group_size] = encode_features(df, user_name)
+        return features
+    except Exception as e:
+        logger.error(f"Error preprocessing keystroke resolutions: {str(e)}")
+        raise
+
 def preprocess_keystroke_files(input_filepath, output_filepath, user_name, additional_users=None):
     """
     Preprocess keystroke data from input CSV and save processed data to output CSV.
@@ -0,0 +1,174 @@
+# preprocessing/training_set.py
+
+import os
+import logging
+import numpy as np
+import pandas as pd
+
+from preprocessing import feature_spec, chunked_pipeline
+
+logger = logging.getLogger(__name__)
+
+
+def csv_export_path(path):
+    """Where the CSV export of a training set goes: `x.npz` -> `x.csv`"""
+    return os.path.splitext(path)[0] + '.csv'
+
+
+class TrainingSet:
+    """
+    Labelled feature matrix of a training set.
+
+    Features are kept as one contiguous matrix in a FeatureSpec layout and
+    dtype (float32) and stored as .npz, so a training set is loaded straight
+    into the array the model is trained on; CSV is only an export.
+    """
+
+    def __init__(self, spec, features, labels):
+        self.spec = spec
+        self.features = spec.to_matrix(features)
+        self.labels = np.asarray(labels)
+        # User names are stored as fixed-width strings (no pickled objects)
+        if self.labels.dtype == object:
+            self.labels = self.labels.astype(str)
+
+    def __len__(self):
+        return len(self.labels)
+
+    @classmethod
+    def from_frame(cls, df, label_column, spec=None):
+        """Training set from a labelled feature DataFrame (as preprocessing returns it)."""
+        spec = spec or feature_spec.current_spec()
+        return cls(spec, df.drop(columns=[label_column]), df[label_column].to_numpy())
+
+    def to_frame(self, label_column):
+        """Features and labels as a DataFrame, labels first"""
+        df = pd.DataFrame(self.features, columns=self.spec.columns)
+        df.insert(0, label_column, self.labels)
+        return df
+
+    def feature_frame(self, spec=None):
+        """
+        Features as a DataFrame in `spec`'s layout (the set's own by
+        default), without copying when the layouts match.
+        """
+        df = pd.DataFrame(self.features, columns=self.spec.columns, copy=False)
+        if spec is None or spec == self.spec:
+            return df
+        return spec.to_frame(df)
+
+    def save(self, path, export_csv=False, label_column='label'):
+        """
+        Write the set as .npz, and as CSV next to it if `export_csv`.
+
+        Returns:
+            bool: Success status
+        """
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    features=self.features,
+                    labels=self.labels,
+                    columns=np.array(self.spec.columns, dtype=str),
+                    version=np.array(self.spec.version),
+                    dtype=np.array(self.spec.dtype.name)
+                )
+            os.replace(tmp_path, path)
+            logger.info(f"Saved training set of {len(self)} rows to {path}")
+
+            if export_csv:
+                self.to_frame(label_column).to_csv(csv_export_path(path), index=False)
+                logger.info(f"Exported training set to {csv_export_path(path)}")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving training set {path}: {str(e)}")
+            return False
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            spec = feature_spec.FeatureSpec(
+                int(data['version']), data['columns'].tolist(), str(data['dtype'])
+            )
+            return cls(spec, data['features'], data['labels'])
+
+
+class TrainingSetBuilder:
+    """
+    Collects labelled feature blocks (e.g. from iter_preprocessed_chunks)
+    into a training set. Each block is converted to the spec's dtype as it
+    is added, so the whole set is never held as float64 DataFrames.
+    """
+
+    def __init__(self, label_column, spec=None):
+        self.label_column = label_column
+        self.spec = spec or feature_spec.current_spec()
+        self._features = []
+        self._labels = []
+
+    def __len__(self):
+        return sum(len(labels) for labels in self._labels)
+
+    def add(self, df):
+        self._labels.append(df[self.label_column].to_numpy())
+        self._features.append(self.spec.to_matrix(df.drop(columns=[self.label_column])))
+
+    def build(self):
+        if not self._features:
+            return TrainingSet(self.spec, np.empty((0, len(self.spec.columns)), dtype=self.spec.dtype), [])
+        return TrainingSet(self.spec, np.concatenate(self._features), np.concatenate(self._labels))
+
+
+def load_training_set(path, label_column):
+    """
+    Training set stored at `path` (.npz). Sets saved as CSV before training
+    sets were stored as arrays are read from the CSV next to it instead.
+
+    Returns:
+        TrainingSet: The set, or None if neither file exists
+    """
+    if os.path.exists(path):
+        return TrainingSet.load(path)
+    legacy_path = csv_export_path(path)
+    if os.path.exists(legacy_path):
+        logger.info(f"Reading training set from CSV {legacy_path}")
+        df = pd.read_csv(legacy_path)
+        if label_column not in df.columns:
+            raise ValueError(f"Label column '{label_column}' not found in {legacy_path}")
+        return TrainingSet.from_frame(df, label_column)
+    return None
+
+
+def build_training_set(keystroke_data, user_name, additional_users=None, label=None, chunksize=None):
+    """
+    Preprocess labelled keystroke data straight into a training set.
+
+    Same rows as preprocess_keystroke_data(keystroke_data, user_name,
+    additional_users), but each user's block of features is converted to
+    float32 as soon as it is produced.
+
+    Args:
+        keystroke_data (dict, DataFrame, or str): Raw keystroke data or filepath
+        user_name (str): User's name for labeling
+        additional_users (dict): Dictionary with {username: data} for additional users
+        label (callable, optional): Maps the User column to the stored labels
+            (e.g. binary labels for one user); users' names are kept if None
+        chunksize (int, optional): Rows read per chunk (None reads each user whole)
+
+    Returns:
+        TrainingSet: Features with their labels
+    """
+    if chunked_pipeline.preprocessing_workers > 1:
+        blocks = chunked_pipeline.preprocess_users_parallel(keystroke_data, user_name, additional_users)
+    else:
+        blocks = chunked_pipeline.iter_preprocessed_chunks(keystroke_data, user_name, additional_users, chunksize=chunksize)
+
+    builder = TrainingSetBuilder('User')
+    for block in blocks:
+        if label is not None:
+            block['User'] = label(block['User'])
+        builder.add(block)
+    return builder.build()
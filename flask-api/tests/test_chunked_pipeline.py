@@ -0,0 +1,54 @@
+# tests/test_chunked_pipeline.py
+
+import pandas as pd
+import pytest
+
+from benchmarks.keystroke_generator import generate_dataset
+from preprocessing import chunked_pipeline, keystroke_processor
+from preprocessing.feature_cache import FeatureCache
+
+
+@pytest.fixture
+def dataset_files(tmp_path):
+    """Synthetic keystrokes of three users, as CSV files"""
+    paths = {}
+    for name, df in generate_dataset(6000).items():
+        paths[name] = str(tmp_path / f"{name}.csv")
+        df.to_csv(paths[name], index=False)
+    return paths
+
+
+@pytest.fixture
+def empty_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunked_pipeline, "feature_cache", FeatureCache(str(tmp_path / "cache")))
+
+
+@pytest.fixture
+def workers():
+    """Sets preprocessing workers for a test, turning them off afterwards"""
+    yield chunked_pipeline.set_preprocessing_workers
+    chunked_pipeline.set_preprocessing_workers(0)
+
+
+def _preprocess(paths):
+    (user, path), *others = paths.items()
+    return keystroke_processor.preprocess_keystroke_data(path, user, dict(others))
+
+
+def test_cached_references_match_dataframe_references(dataset_files, empty_cache):
+    (user, path), *others = dataset_files.items()
+    expected = keystroke_processor.preprocess_keystroke_data(
+        path, user, {name: pd.read_csv(other) for name, other in others}
+    )
+
+    # Cold cache, then warm
+    for _ in range(2):
+        pd.testing.assert_frame_equal(_preprocess(dataset_files), expected)
+
+
+def test_parallel_matches_sequential(dataset_files, empty_cache, workers):
+    sequential = _preprocess(dataset_files)
+
+    assert workers(2)[0]
+    for _ in range(2):
+        pd.testing.assert_frame_equal(_preprocess(dataset_files), sequential)
@@ -0,0 +1,41 @@
+# tests/test_shared_executor.py
+
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.shared_executor import SharedExecutor
+
+
+def _shared():
+    return SharedExecutor(lambda workers: ThreadPoolExecutor(max_workers=workers))
+
+
+def test_no_executor_below_two_workers():
+    shared = _shared()
+    shared.resize(1)
+    with shared.use() as executor:
+        assert executor is None
+
+
+def test_executor_is_kept_between_calls():
+    shared = _shared()
+    shared.resize(2)
+    with shared.use() as first:
+        pass
+    with shared.use() as second:
+        assert second is first
+    shared.resize(0)
+
+
+def test_resize_does_not_shut_down_executor_in_use():
+    shared = _shared()
+    shared.resize(2)
+    with shared.use() as executor:
+        shared.resize(4)
+        # Still usable by the caller holding it
+        assert executor.submit(sum, [1, 2]).result() == 3
+        with shared.use() as resized:
+            assert resized is not executor
+    assert executor._shutdown
+    assert not resized._shutdown
+    shared.resize(0)
+    assert resized._shutdown
@@ -0,0 +1,114 @@
+# tests/test_window_context.py
+
+import os
+import importlib.util
+from types import SimpleNamespace
+
+import pytest
+
+# The keystroke package imports the collector (and pynput) at import;
+# window_context needs neither, so it is loaded from its file
+_spec = importlib.util.spec_from_file_location(
+    "window_context",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "keystroke", "window_context.py")
+)
+window_context = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(window_context)
+
+
+class CountingQuery:
+    def __init__(self, titles):
+        self.titles = list(titles)
+        self.calls = 0
+
+    def __call__(self):
+        title = self.titles[min(self.calls, len(self.titles) - 1)]
+        self.calls += 1
+        return title
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=100.0)
+    monkeypatch.setattr(window_context, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_cached_title_refreshed_after_ttl(clock):
+    query = CountingQuery(["Editor", "Browser"])
+    provider = window_context.CachedWindowContextProvider(ttl=0.5, query=query)
+
+    assert provider.current_title() == "Editor"
+    clock.value += 0.4
+    assert provider.current_title() == "Editor"
+    assert query.calls == 1
+
+    clock.value += 0.2
+    assert provider.current_title() == "Browser"
+    assert query.calls == 2
+
+
+def test_invalidate_forces_refresh(clock):
+    query = CountingQuery(["Editor", "Browser"])
+    provider = window_context.CachedWindowContextProvider(ttl=10, query=query)
+
+    provider.current_title()
+    provider.invalidate()
+    assert provider.current_title() == "Browser"
+    assert query.calls == 2
+
+
+def test_close_stops_background_refresher():
+    query = CountingQuery(["Editor"])
+    provider = window_context.CachedWindowContextProvider(ttl=0.01, background=True, query=query)
+
+    assert provider.current_title() == "Editor"
+    thread = provider._thread
+    assert thread.is_alive()
+
+    provider.close()
+    thread.join(timeout=2)
+    assert not thread.is_alive()
+
+    # Started again by the next lookup
+    provider.current_title()
+    assert provider._thread is not thread and provider._thread.is_alive()
+    provider.close()
+    provider._thread.join(timeout=2)
+
+
+def test_sensitive_field_matching_through_fake_provider():
+    provider = window_context.FakeWindowContextProvider()
+    matcher = window_context.SensitiveFieldMatcher(["password", "Credit Card", ""])
+
+    provider.set_title("Sign in - Enter PASSWORD")
+    assert matcher.matches(provider.current_title())
+    provider.set_title("Checkout: credit card details")
+    assert matcher.matches(provider.current_title())
+    provider.set_title("Notes")
+    assert not matcher.matches(provider.current_title())
+    provider.set_title("")
+    assert not matcher.matches(provider.current_title())
+    assert provider.query_count == 4
+
+
+def test_matcher_without_keywords_matches_nothing():
+    matcher = window_context.SensitiveFieldMatcher([])
+    assert not matcher.matches("password")
+
+
+def test_collector_checks_sensitive_fields_through_its_provider(monkeypatch):
+    pytest.importorskip("pynput")
+    from keystroke import keystroke_collector
+
+    provider = window_context.FakeWindowContextProvider("Bank - Enter PIN")
+    monkeypatch.setattr(keystroke_collector, "sensitive_matcher", window_context.SensitiveFieldMatcher(["pin"]))
+    previous = keystroke_collector.window_provider
+    keystroke_collector.set_window_provider(provider)
+    try:
+        assert keystroke_collector.is_sensitive_field()
+        provider.set_title("Notes")
+        assert not keystroke_collector.is_sensitive_field()
+        assert provider.query_count == 2
+    finally:
+        keystroke_collector.window_provider = previous
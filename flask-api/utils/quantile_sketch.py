@@ -0,0 +1,113 @@
+# utils/quantile_sketch.py
+import math
+
+
+class P2Quantile:
+    """Streaming estimate of one quantile with the P² algorithm.
+
+    Keeps five markers (min, q/2, q, (1+q)/2, max) whose heights are adjusted
+    with a piecewise-parabolic formula as values arrive, so each update is
+    O(1) and the state is a handful of numbers, whatever the number of
+    observations (Jain & Chlamtac, 1985). Until five values have been seen
+    the estimate is their exact quantile.
+    """
+
+    def __init__(self, q):
+        if not 0 < q < 1:
+            raise ValueError(f"Quantile must be between 0 and 1, got {q}")
+        self.q = q
+        self.count = 0
+        # Marker heights, actual positions (1-based) and desired positions
+        self._heights = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]
+        self._increments = [0, q / 2, q, (1 + q) / 2, 1]
+
+    def __len__(self):
+        return self.count
+
+    def update(self, value):
+        """Add one observation"""
+        value = float(value)
+        if math.isnan(value):
+            return
+        self.count += 1
+        heights = self._heights
+        if self.count <= 5:
+            heights.append(value)
+            heights.sort()
+            return
+
+        # Cell the value falls in, widening the extremes if needed
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= heights[k + 1]:
+                k += 1
+
+        positions = self._positions
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        # Move the middle markers that are off their desired position by one
+        for i in range(1, 4):
+            d = self._desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = self._linear(i, d)
+                heights[i] = height
+                positions[i] += d
+
+    def update_many(self, values):
+        for value in values:
+            self.update(value)
+
+    def _parabolic(self, i, d):
+        h, n = self._heights, self._positions
+        return h[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def _linear(self, i, d):
+        h, n = self._heights, self._positions
+        return h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+
+    def value(self):
+        """Current estimate, or None before the first observation"""
+        if self.count == 0:
+            return None
+        if self.count <= 5:
+            # Exact, with linear interpolation (as pandas' quantile)
+            rank = self.q * (self.count - 1)
+            low = int(math.floor(rank))
+            high = min(low + 1, self.count - 1)
+            return self._heights[low] + (rank - low) * (self._heights[high] - self._heights[low])
+        return self._heights[2]
+
+    def to_dict(self):
+        return {
+            'q': self.q,
+            'count': self.count,
+            'heights': list(self._heights),
+            'positions': list(self._positions),
+            'desired': list(self._desired)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['q'])
+        sketch.count = data['count']
+        sketch._heights = list(data['heights'])
+        sketch._positions = list(data['positions'])
+        sketch._desired = list(data['desired'])
+        return sketch
@@ -0,0 +1,67 @@
+# utils/shared_executor.py
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class SharedExecutor:
+    """
+    Executor shared by the callers of a module, created on first use with
+    `create(workers)` and kept for later calls.
+
+    Callers hold it for the whole time they submit work and wait for
+    results (`with shared.use() as executor:`). When the number of workers
+    changes, the executor in use is not shut down under them: it is retired,
+    and shut down once the last caller holding it lets go.
+    """
+
+    def __init__(self, create):
+        self._create = create
+        self._lock = threading.Lock()
+        self._workers = 0
+        self._executor = None
+        # Callers holding each executor
+        self._holders = {}
+
+    @property
+    def workers(self):
+        return self._workers
+
+    def resize(self, workers):
+        """Use `workers` workers from now on (0 or 1 for no executor)."""
+        with self._lock:
+            if workers == self._workers:
+                return
+            self._workers = workers
+            retired, self._executor = self._executor, None
+            if retired is None or self._holders.get(retired):
+                return
+        retired.shutdown(wait=False)
+
+    @contextmanager
+    def use(self):
+        """The current executor, or None when there are fewer than 2 workers."""
+        with self._lock:
+            if self._executor is None and self._workers > 1:
+                self._executor = self._create(self._workers)
+            executor = self._executor
+            if executor is not None:
+                self._holders[executor] = self._holders.get(executor, 0) + 1
+        try:
+            yield executor
+        finally:
+            if executor is not None:
+                self._release(executor)
+
+    def _release(self, executor):
+        with self._lock:
+            self._holders[executor] -= 1
+            if self._holders[executor]:
+                return
+            del self._holders[executor]
+            if executor is self._executor:
+                return
+        # Retired while in use, and this was its last holder
+        executor.shutdown(wait=False)
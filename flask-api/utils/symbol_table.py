@@ -0,0 +1,149 @@
+# utils/symbol_table.py
+import os
+import json
+import tempfile
+import threading
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SYMBOLS_DIR = os.path.join(BASE_DIR, "storage", "symbols")
+
+class SymbolTable:
+    """
+    Append-only string interning table.
+
+    Each distinct string gets a small integer code, assigned in order of first
+    appearance and never reused, so codes stored on disk stay valid as long as
+    the table is persisted alongside them.
+
+    Per-code metadata (e.g. a key's category) can be registered as attributes;
+    they are kept as arrays indexed by code, so looking them up for a batch of
+    codes is a single `take`.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._codes = {}
+        self._symbols = []
+        self._attributes = {}
+        self._lock = threading.RLock()
+        # Serializes saves (writer thread, prediction buffer mirror)
+        self._save_lock = threading.Lock()
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        """Load symbols from disk if available"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                symbols = json.load(f).get('symbols', [])
+            self._symbols = list(symbols)
+            self._codes = {symbol: code for code, symbol in enumerate(self._symbols)}
+        except Exception as e:
+            logger.error(f"Error loading symbol table {self.path}: {str(e)}")
+
+    def save(self):
+        """Persist the table if symbols were added since the last save"""
+        if not self.path:
+            return True
+        with self._save_lock:
+            if not self.dirty:
+                return True
+            tmp_path = None
+            try:
+                with self._lock:
+                    symbols = list(self._symbols)
+                    self.dirty = False
+                directory = os.path.dirname(self.path)
+                os.makedirs(directory, exist_ok=True)
+                # Unique temporary file, so no other writer can touch it
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path), suffix='.tmp')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'symbols': symbols}, f)
+                os.replace(tmp_path, self.path)
+                return True
+            except Exception as e:
+                self.dirty = True
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                logger.error(f"Error saving symbol table {self.path}: {str(e)}")
+                return False
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def intern(self, symbol):
+        """Code for `symbol`, adding it to the table if needed"""
+        code = self._codes.get(symbol)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(symbol)
+                if code is None:
+                    code = len(self._symbols)
+                    self._symbols.append(symbol)
+                    self._codes[symbol] = code
+                    self.dirty = True
+        return code
+
+    def intern_many(self, symbols):
+        """Codes for a sequence of strings, as an int32 array"""
+        cache = {}
+        codes = np.empty(len(symbols), dtype=np.int32)
+        for i, symbol in enumerate(symbols):
+            code = cache.get(symbol)
+            if code is None:
+                code = cache[symbol] = self.intern(symbol)
+            codes[i] = code
+        return codes
+
+    def symbol(self, code):
+        """String for a single code"""
+        return self._symbols[code]
+
+    def decode(self, codes):
+        """Strings for an array of codes, as an object array"""
+        return np.array(self._symbols, dtype=object)[np.asarray(codes, dtype=np.intp)]
+
+    def register_attribute(self, name, compute, dtype=object):
+        """Register per-code metadata computed by `compute(symbol)`.
+
+        Values are computed for existing codes on first use and for new codes
+        as they appear; they are derived data and are not persisted.
+        """
+        with self._lock:
+            self._attributes[name] = {
+                'compute': compute,
+                'dtype': dtype,
+                'values': np.empty(0, dtype=dtype)
+            }
+
+    def attribute(self, name):
+        """Array of an attribute's values for every code in the table"""
+        attr = self._attributes[name]
+        values = attr['values']
+        if len(values) < len(self._symbols):
+            with self._lock:
+                values = attr['values']
+                symbols = self._symbols[len(values):]
+                if symbols:
+                    extra = np.empty(len(symbols), dtype=attr['dtype'])
+                    extra[:] = [attr['compute'](symbol) for symbol in symbols]
+                    values = np.concatenate([values, extra])
+                    attr['values'] = values
+        return values
+
+    def lookup(self, name, codes):
+        """Attribute values for an array of codes"""
+        return self.attribute(name)[np.asarray(codes, dtype=np.intp)]
+
+# Shared tables for key names and application/window titles. Key names are
+# few and persisted; window titles are open-ended, so their codes only live
+# in this process and segments keep their own title table (the file is read
+# to decode segments written before that).
+key_symbols = SymbolTable(os.path.join(SYMBOLS_DIR, "keys.json"))
+app_symbols = SymbolTable(os.path.join(SYMBOLS_DIR, "applications.json"))